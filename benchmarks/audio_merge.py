@@ -0,0 +1,61 @@
+"""Measure the time and peak memory of merging a multi-phrase voiceline, growing an array vs one preallocated buffer
+
+Run from the MantellaSoftware folder:
+    python -m benchmarks.audio_merge
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import soundfile as sf
+from src.speech.audio_assembly import merge_audio_files
+
+
+def concatenate_audio_files(audio_files, voiceline_file_name):
+    """How Synthesizer.merge_audio_files used to do it"""
+    merged_audio = np.array([])
+    for audio_file in audio_files:
+        audio, samplerate = sf.read(audio_file)
+        merged_audio = np.concatenate((merged_audio, audio))
+    sf.write(voiceline_file_name, merged_audio, samplerate)
+
+
+def measure(merge, audio_files, output_file) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    merge(audio_files, output_file)
+    seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and measure the memory of merging phrase .wav files')
+    parser.add_argument('--phrases', type=int, default=12)
+    parser.add_argument('--phrase-seconds', type=float, default=3)
+    parser.add_argument('--samplerate', type=int, default=48000) # xVASynth's output with super-resolution
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        rng = np.random.default_rng(0)
+        audio_files = []
+        for i in range(args.phrases):
+            audio_file = os.path.join(folder, f'phrase_{i}.wav')
+            audio = rng.integers(-8000, 8000, int(args.phrase_seconds * args.samplerate), dtype=np.int16)
+            sf.write(audio_file, audio, args.samplerate, subtype='PCM_16')
+            audio_files.append(audio_file)
+        output_bytes = args.phrases * int(args.phrase_seconds * args.samplerate) * 2
+
+        concatenate_seconds, concatenate_peak = measure(concatenate_audio_files, audio_files, os.path.join(folder, 'concatenated.wav'))
+        merge_seconds, merge_peak = measure(merge_audio_files, audio_files, os.path.join(folder, 'merged.wav'))
+
+    print(f'{args.phrases} phrases of {args.phrase_seconds} s at {args.samplerate} Hz ({output_bytes / 1024 / 1024:.1f} MB of 16 bit audio)')
+    print(f'np.concatenate per phrase: {1000 * concatenate_seconds:.1f} ms, peak {concatenate_peak / 1024 / 1024:.1f} MB ({concatenate_peak / output_bytes:.1f}x the output)')
+    print(f'preallocated int16 buffer: {1000 * merge_seconds:.1f} ms, peak {merge_peak / 1024 / 1024:.1f} MB ({merge_peak / output_bytes:.1f}x the output)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Compare CharacterIndex lookups with the DataFrame scans they replaced
+
+Run from the MantellaSoftware folder:
+    python -m benchmarks.character_lookup
+"""
+import argparse
+import difflib
+import random
+import time
+import pandas as pd
+import src.utils as utils
+from src.character_index import CharacterIndex
+
+
+def load_character_df(file_name: str) -> pd.DataFrame:
+    encoding = utils.get_file_encoding(file_name)
+    character_df = pd.read_csv(file_name, engine='python', encoding=encoding)
+    return character_df.loc[character_df['voice_model'].notna()]
+
+
+def dataframe_lookup(character_df: pd.DataFrame, name: str, base_id: str, voice_folder: str):
+    character_df.loc[character_df['name'].astype(str).str.lower()==name.lower()].to_dict('records')
+    character_df.loc[(character_df['baseid_int'].astype(str)==base_id) | (character_df['baseid_int'].astype(str)==base_id+'.0')].to_dict('records')
+    character_df.loc[character_df['skyrim_voice_folder'].astype(str).str.lower()==voice_folder.lower(), 'voice_model'].values
+    character_df.loc[character_df['voice_model'].astype(str).str.lower()==voice_folder.lower(), 'skyrim_voice_folder'].values
+
+
+def index_lookup(character_index: CharacterIndex, name: str, base_id: str, voice_folder: str):
+    character_index.get_character_by_name(name)
+    character_index.get_character_by_base_id(base_id)
+    character_index.get_voice_model_by_voice_folder(voice_folder)
+    character_index.get_voice_folder_by_voice_model(voice_folder)
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    """Drop, double or swap one letter of a name"""
+    i = rng.randrange(len(name))
+    edit = rng.choice(['drop', 'double', 'swap'])
+    if edit == 'drop' and len(name) > 3:
+        return name[:i] + name[i+1:]
+    if edit == 'swap' and i < len(name) - 1:
+        return name[:i] + name[i+1] + name[i] + name[i+2:]
+    return name[:i] + name[i] + name[i:]
+
+
+def time_lookups(lookup, target, queries: list[tuple[str, str, str]]) -> float:
+    """Return the mean time of one set of lookups in milliseconds"""
+    start = time.perf_counter()
+    for name, base_id, voice_folder in queries:
+        lookup(target, name, base_id, voice_folder)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time character lookups by name, base ID and voice folder')
+    parser.add_argument('--characters', default='data/skyrim_characters.csv')
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    character_df = load_character_df(args.characters)
+
+    start = time.perf_counter()
+    character_index = CharacterIndex(character_df)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    rows = character_df.sample(n=args.queries, replace=True, random_state=0)
+    queries = [(str(row['name']), str(row['baseid_int']).removesuffix('.0'), str(row['skyrim_voice_folder'])) for _, row in rows.iterrows()]
+    # include misses, which are the slowest case for both paths
+    queries += [(f'Unknown NPC {i}', str(random.randint(10**7, 10**8)), f'UnknownVoice{i}') for i in range(args.queries // 10)]
+
+    dataframe_ms = time_lookups(dataframe_lookup, character_df, queries)
+    index_ms = time_lookups(index_lookup, character_index, queries)
+
+    print(f'{len(character_df)} characters, {len(queries)} queries (4 lookups each)')
+    print(f'index build:      {build_ms:.1f} ms')
+    print(f'DataFrame scans:  {dataframe_ms:.3f} ms per query')
+    print(f'CharacterIndex:   {index_ms:.3f} ms per query ({dataframe_ms / index_ms:.0f}x faster)')
+
+    rng = random.Random(0)
+    names = [name for name, _, _ in queries[:args.queries]]
+    misspelled = [misspell(name, rng) for name in names]
+    all_names = [str(name).lower() for name in character_df['name']]
+
+    start = time.perf_counter()
+    trigram_matches = [character_index.find_similar_names(name, limit=1) for name in misspelled]
+    trigram_ms = (time.perf_counter() - start) / len(misspelled) * 1000
+    start = time.perf_counter()
+    for name in misspelled:
+        difflib.get_close_matches(name.lower(), all_names, n=1, cutoff=0.75)
+    difflib_ms = (time.perf_counter() - start) / len(misspelled) * 1000
+    resolved = sum(1 for name, matches in zip(names, trigram_matches) if len(matches) > 0 and matches[0][0] == name.lower())
+
+    print(f'fuzzy names:      {len(misspelled)} misspelled names, {resolved} resolved to the right character at the default cut-off')
+    print(f'difflib scan:     {difflib_ms:.3f} ms per name')
+    print(f'trigram index:    {trigram_ms:.3f} ms per name ({difflib_ms / trigram_ms:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
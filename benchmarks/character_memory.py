@@ -0,0 +1,80 @@
+"""Compare the resident memory of the full character DataFrame with the compact table and memory-mapped bios
+
+Each variant is loaded in a fresh Python process so the measurements don't affect each other.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.character_memory
+"""
+import argparse
+import ctypes
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def resident_memory() -> int:
+    """Resident set size of this process in bytes"""
+    if sys.platform == 'win32':
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong)] + [(name, ctypes.c_size_t) for name in [
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage']]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(variant: str, characters: str, cache_file: str):
+    # import everything up front so only the character data counts towards the difference
+    import pandas as pd
+    from src.character_db import CharacterDatabase, parse_character_csv
+    from src.character_index import CharacterIndex
+
+    gc.collect()
+    before = resident_memory()
+    if variant == 'full':
+        character_df = parse_character_csv(characters)[0]
+        character_index = CharacterIndex(character_df)
+    else:
+        character_df, bios = CharacterDatabase(characters, cache_file).load()
+        character_index = CharacterIndex(character_df, bios)
+    # look up a character, as a conversation would
+    character_index.get_character_by_name('Lydia')
+    gc.collect()
+    after = resident_memory()
+    frame_bytes = int(character_df.memory_usage(deep=True).sum())
+    print(f'{variant},{after - before},{frame_bytes}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory used by the character database')
+    parser.add_argument('--characters', default='data/skyrim_characters.csv')
+    parser.add_argument('--variant', choices=['full', 'compact'], help=argparse.SUPPRESS)
+    parser.add_argument('--cache-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        measure(args.variant, args.characters, args.cache_file)
+        return
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        cache_file = os.path.join(temp_folder, 'skyrim_characters.csv.cache')
+        command = [sys.executable, '-m', 'benchmarks.character_memory', '--characters', args.characters, '--cache-file', cache_file]
+        # build the cache first, so the compact measurement is of a normal (cached) launch
+        subprocess.run(command + ['--variant', 'compact'], check=True, capture_output=True)
+        results = {}
+        for variant in ['full', 'compact']:
+            output = subprocess.run(command + ['--variant', variant], check=True, capture_output=True, text=True).stdout
+            _, rss, frame_bytes = output.strip().splitlines()[-1].split(',')
+            results[variant] = (int(rss), int(frame_bytes))
+
+    for variant, (rss, frame_bytes) in results.items():
+        print(f'{variant:8} resident memory +{rss / 1024 / 1024:.1f} MB, DataFrame {frame_bytes / 1024 / 1024:.2f} MB')
+
+
+if __name__ == '__main__':
+    main()
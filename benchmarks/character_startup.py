@@ -0,0 +1,51 @@
+"""Compare loading the character database from the CSV (cold start) with loading it from the pre-parsed cache
+
+Run from the MantellaSoftware folder:
+    python -m benchmarks.character_startup
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from src.character_db import CharacterDatabase, parse_character_csv
+from src.character_index import CharacterIndex
+
+
+def time_runs(func, runs: int) -> list[float]:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time loading skyrim_characters.csv with and without the character database cache')
+    parser.add_argument('--characters', default='data/skyrim_characters.csv')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        cache_file = os.path.join(temp_folder, 'skyrim_characters.csv.cache')
+
+        def cold_start():
+            CharacterIndex(parse_character_csv(args.characters)[0])
+
+        def cached_start():
+            CharacterIndex(*CharacterDatabase(args.characters, cache_file).load())
+
+        build = CharacterDatabase(args.characters, cache_file)
+        build.load()
+        cold = time_runs(cold_start, args.runs)
+        cached = time_runs(cached_start, args.runs)
+        cache_size = os.path.getsize(cache_file)
+
+    print(f'cache build:   {build.timings["total"]:.3f} s ({cache_size / 1024 / 1024:.1f} MB)')
+    print(f'CSV parse:     {statistics.median(cold):.3f} s (median of {args.runs})')
+    print(f'cached load:   {statistics.median(cached):.3f} s (median of {args.runs}, {statistics.median(cold) / statistics.median(cached):.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measure how long TTS requests stall the event loop, with blocking requests vs the asyncio session
+
+A local server which takes `--latency-ms` to answer stands in for xVASynth / xTTS. While voicelines are
+requested, a ticker coroutine (standing in for LLM streaming and game file handshakes) wakes up every 5 ms
+and records how late it was.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.event_loop_stall
+"""
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.speech.http_session import TTSHttpSession
+from src.speech.async_http_session import AsyncTTSHttpSession
+
+TICK_SECONDS = 0.005
+
+
+def slow_handler(latency_seconds: float):
+    class SlowHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # keep-alive, like the real servers
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency_seconds)
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+    return SlowHandler
+
+
+async def tick(stalls: list[float]):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        stalls.append(time.perf_counter() - start - TICK_SECONDS)
+
+
+async def measure(synthesize_lines) -> tuple[float, list[float]]:
+    stalls = []
+    ticker = asyncio.ensure_future(tick(stalls))
+    await asyncio.sleep(TICK_SECONDS * 2)
+    start = time.perf_counter()
+    await synthesize_lines()
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(TICK_SECONDS * 2) # let the ticker notice the last stall
+    ticker.cancel()
+    return elapsed, stalls
+
+
+def summary(stalls: list[float]) -> str:
+    stalls = sorted(stalls)
+    return f'max stall {1000 * stalls[-1]:.1f} ms, p95 {1000 * stalls[int(0.95 * (len(stalls) - 1))]:.1f} ms, total {1000 * sum(stalls):.0f} ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time event loop stalls caused by TTS requests made from coroutines')
+    parser.add_argument('--lines', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), slow_handler(args.latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/synthesize'
+    line = {'sequence': 'I used to be an adventurer like you.', 'outfile': 'out.wav'}
+
+    session = TTSHttpSession()
+    async def blocking_lines():
+        # what ChatManager did before: a blocking request inside a coroutine
+        for _ in range(args.lines):
+            session.post('synthesize', url, json=line)
+
+    async_session = AsyncTTSHttpSession()
+    async def async_lines():
+        for _ in range(args.lines):
+            await async_session.post('synthesize', url, json=line)
+        await async_session.close()
+
+    blocking_seconds, blocking_stalls = asyncio.run(measure(blocking_lines))
+    async_seconds, async_stalls = asyncio.run(measure(async_lines))
+    server.shutdown()
+
+    print(f'{args.lines} voicelines against a local server answering after {args.latency_ms:.0f} ms')
+    print(f'blocking session: {blocking_seconds:.2f} s, {summary(blocking_stalls)}')
+    print(f'asyncio session:  {async_seconds:.2f} s, {summary(async_stalls)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""A stand-in for the xVASynth and xTTS servers, which writes synthetic .wav files after a configurable delay
+
+It answers the requests Mantella sends to either service, so the whole TTS path can be run and timed on any OS.
+The latency profiles roughly follow xVASynth on a GPU and a CPU. Run from the MantellaSoftware folder:
+    python -m benchmarks.fake_tts_server --profile cpu
+and set xvasynth_url (or the xtts_ URLs, with port 8020) in config.ini to point at it.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import numpy as np
+import soundfile as sf
+
+
+class LatencyProfile:
+    """How long the fake server takes (in seconds) to load a voice model and to synthesize"""
+    def __init__(self, model_load: float, request: float, per_char: float, jitter: float = 0.1) -> None:
+        self.model_load = model_load
+        # per synthesis request, on top of the time per character
+        self.request = request
+        self.per_char = per_char
+        # delays vary by up to this fraction either way
+        self.jitter = jitter
+
+    def delay(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+PROFILES = {
+    'instant': LatencyProfile(model_load=0, request=0, per_char=0, jitter=0),
+    'gpu': LatencyProfile(model_load=1.0, request=0.05, per_char=0.002),
+    'cpu': LatencyProfile(model_load=4.0, request=0.2, per_char=0.012),
+}
+# speaking rate of the synthetic audio
+SECONDS_PER_CHAR = 0.065
+XVASYNTH_SAMPLERATE = 22050
+XTTS_SAMPLERATE = 24000
+
+
+class FakeTTSServer:
+    """Serves the xVASynth (loadModel, synthesize, synthesize_batch) and xTTS (switch_model, tts_to_audio, ...) endpoints
+
+    `max_parallel` synthesis requests are worked on at once, like a GPU with room to spare (1 for a CPU).
+    Counts of the requests it got are in `stats`.
+    """
+    def __init__(self, profile: LatencyProfile, port: int = 8008, max_parallel: int = 1) -> None:
+        self.profile = profile
+        self.__server = ThreadingHTTPServer(('127.0.0.1', port), self.__handler())
+        self.__server.daemon_threads = True
+        self.__synthesis_slots = threading.Semaphore(max(1, max_parallel))
+        self.__lock = threading.Lock()
+        self.__loaded_model: str | None = None
+        self.__counts: dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.__server.server_address[1]}'
+
+    def start(self) -> 'FakeTTSServer':
+        threading.Thread(target=self.__server.serve_forever, name='fake-tts-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def stats(self) -> dict[str, int]:
+        with self.__lock:
+            return dict(self.__counts)
+
+    def handle(self, path: str, data: dict) -> tuple[int, object]:
+        """Answer a request to `path` with a (status code, JSON body)"""
+        with self.__lock:
+            self.__counts[path] = self.__counts.get(path, 0) + 1
+
+        if path in ['/', '/set_tts_settings/', '/setVocoder', '/set_output/']:
+            return 200, {}
+        if path == '/get_models_list/':
+            return 200, ['main']
+        if path in ['/loadModel', '/switch_model']:
+            self.__load_model(data.get('model') or data.get('model_name'))
+            return 200, {}
+        if path == '/synthesize':
+            self.__synthesize([(data['sequence'], data['outfile'])], XVASYNTH_SAMPLERATE, 'PCM_16')
+            return 200, {}
+        if path == '/synthesize_batch':
+            self.__synthesize([(line[0], line[4]) for line in data['linesBatch']], XVASYNTH_SAMPLERATE, 'PCM_16')
+            return 200, {}
+        if path == '/tts_to_audio/':
+            # xTTS writes float audio, which Mantella converts to 16 bit
+            self.__synthesize([(data['text'], data['save_path'])], XTTS_SAMPLERATE, 'FLOAT')
+            return 200, {}
+        return 404, {'error': f'unknown endpoint {path}'}
+
+    def __load_model(self, model: str | None):
+        with self.__synthesis_slots:
+            if model != self.__loaded_model:
+                time.sleep(self.profile.delay(self.profile.model_load))
+                self.__loaded_model = model
+
+    def __synthesize(self, lines: list[tuple[str, str]], samplerate: int, subtype: str):
+        with self.__synthesis_slots:
+            time.sleep(self.profile.delay(self.profile.request + self.profile.per_char * sum(len(text) for text, _ in lines)))
+            for text, output_file in lines:
+                sf.write(output_file, synthetic_speech(text, samplerate), samplerate, subtype=subtype)
+
+    def __handler(self):
+        fake_server = self
+        class FakeTTSHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive, like the real servers
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.__respond(*fake_server.handle(urlparse(self.path).path, {}))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.__respond(*fake_server.handle(urlparse(self.path).path, json.loads(body) if body else {}))
+
+            def __respond(self, status_code: int, body: object):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+        return FakeTTSHandler
+
+
+def synthetic_speech(text: str, samplerate: int) -> np.ndarray:
+    """A quiet tone as long as `text` would take to say"""
+    seconds = max(0.5, SECONDS_PER_CHAR * len(text.strip()))
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    return (0.2 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake xVASynth / xTTS server')
+    parser.add_argument('--profile', choices=PROFILES, default='gpu')
+    parser.add_argument('--port', type=int, default=8008)
+    parser.add_argument('--max-parallel', type=int, default=1)
+    args = parser.parse_args()
+
+    server = FakeTTSServer(PROFILES[args.profile], args.port, args.max_parallel).start()
+    print(f'Fake TTS server ({args.profile}) listening on {server.url}, Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Measure how long a response's voicelines take to be ready to play, with FaceFX run after each line vs alongside the next line's synthesis
+
+FaceFX is played by benchmarks/stub_facefx.py and synthesis by a sleep of `--synthesis-seconds` per line.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.lip_sync
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+from src.speech.lip_sync import LipSyncGenerator, facefx_arguments
+
+SAMPLERATE = 22050
+
+
+def stub_command(seconds_per_audio_second: float) -> str:
+    return f'"{sys.executable}" -m benchmarks.stub_facefx "{{wav_file}}" "{{lip_file}}" --seconds-per-audio-second {seconds_per_audio_second}'
+
+
+def synthesize(source_file: str, wav_file: str, synthesis_seconds: float):
+    time.sleep(synthesis_seconds)
+    shutil.copyfile(source_file, wav_file)
+
+
+def time_in_line(source_files, folder, synthesis_seconds, command) -> list[float]:
+    """How Synthesizer used to do it: every line waits for its FaceFX run before the next one is synthesized"""
+    start = time.perf_counter()
+    ready = []
+    for i, source_file in enumerate(source_files):
+        wav_file = os.path.join(folder, f'in_line_{i}.wav')
+        synthesize(source_file, wav_file, synthesis_seconds)
+        subprocess.run(facefx_arguments(command, wav_file=wav_file, lip_file=wav_file[:-len('.wav')] + '.lip'), check=True)
+        ready.append(time.perf_counter() - start)
+    return ready
+
+
+def time_pooled(source_files, folder, synthesis_seconds, lip_sync: LipSyncGenerator, name: str) -> list[float]:
+    """The next line is synthesized while FaceFX works, and a line is ready once its .lip file is"""
+    start = time.perf_counter()
+    wav_files = []
+    lip_done = [0.0] * len(source_files)
+    for i, source_file in enumerate(source_files):
+        wav_file = os.path.join(folder, f'{name}_{i}.wav')
+        synthesize(source_file, wav_file, synthesis_seconds)
+        lip_sync.submit(wav_file, f'line {i}', lambda i=i: lip_done.__setitem__(i, time.perf_counter() - start))
+        wav_files.append(wav_file)
+    for wav_file in wav_files:
+        lip_sync.wait(wav_file)
+    # lines are played in order
+    return [max(lip_done[:i + 1]) for i in range(len(lip_done))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time lip sync run in line with synthesis vs on a worker pool')
+    parser.add_argument('--lines', type=int, default=6)
+    parser.add_argument('--line-seconds', type=float, default=4, help='length of each voiceline')
+    parser.add_argument('--synthesis-seconds', type=float, default=0.5, help='how long the TTS server takes per line')
+    parser.add_argument('--facefx-seconds-per-audio-second', type=float, default=0.15)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    command = stub_command(args.facefx_seconds_per_audio_second)
+    with tempfile.TemporaryDirectory() as folder:
+        rng = np.random.default_rng(0)
+        source_files = []
+        for i in range(args.lines):
+            source_file = os.path.join(folder, f'source_{i}.wav')
+            sf.write(source_file, rng.integers(-8000, 8000, int(args.line_seconds * SAMPLERATE), dtype=np.int16), SAMPLERATE, subtype='PCM_16')
+            source_files.append(source_file)
+
+        in_line = time_in_line(source_files, folder, args.synthesis_seconds, command)
+        lip_sync = LipSyncGenerator('', command, os.path.join(folder, '_lip_cache'), args.workers)
+        pooled = time_pooled(source_files, folder, args.synthesis_seconds, lip_sync, 'pooled')
+        cached = time_pooled(source_files, folder, args.synthesis_seconds, lip_sync, 'cached') # same audio and text again
+        stats = lip_sync.stats()
+
+    print(f'{args.lines} lines of {args.line_seconds} s, {args.synthesis_seconds} s to synthesize each, FaceFX {args.facefx_seconds_per_audio_second * args.line_seconds:.2f} s each')
+    print(f'FaceFX after each line:        first line ready {in_line[0]:.2f} s, all ready {in_line[-1]:.2f} s')
+    print(f'FaceFX pool ({args.workers} workers):        first line ready {pooled[0]:.2f} s, all ready {pooled[-1]:.2f} s')
+    print(f'FaceFX pool, LIP files cached: first line ready {cached[0]:.2f} s, all ready {cached[-1]:.2f} s')
+    print(f'lip sync stats: {stats}')
+
+
+if __name__ == '__main__':
+    main()
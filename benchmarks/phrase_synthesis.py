@@ -0,0 +1,79 @@
+"""Measure how long a long xVAPitch (v3) voiceline takes to synthesize, phrase by phrase vs concurrently
+
+A local server which takes `--ms-per-char` per character of a phrase stands in for xVASynth, and can work on
+several requests at once (like a GPU with room to spare).
+Run from the MantellaSoftware folder:
+    python -m benchmarks.phrase_synthesis
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.speech.http_session import TTSHttpSession
+from src.speech.async_http_session import AsyncTTSHttpSession
+
+# what Synthesizer._split_voiceline makes of a long line
+PHRASES = [
+    'I was a soldier once, in the Legion,',
+    'and I marched from Solitude to the Pale',
+    'with nothing but a rusty sword and a bad attitude,',
+    'or so my captain used to say.',
+]
+
+
+def phrase_handler(seconds_per_char: float):
+    class PhraseHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # keep-alive, like the real servers
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            time.sleep(seconds_per_char * len(data['sequence']))
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+    return PhraseHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time synthesizing the phrases of a voiceline one by one vs concurrently')
+    parser.add_argument('--ms-per-char', type=float, default=10)
+    parser.add_argument('--max-concurrent', type=int, default=3)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), phrase_handler(args.ms_per_char / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/synthesize'
+    endpoint_requests = [('synthesize', url, {'sequence': phrase, 'outfile': f'phrase_{i}.wav'}) for i, phrase in enumerate(PHRASES)]
+
+    session = TTSHttpSession(pool_size=args.max_concurrent)
+    def time_blocking(max_concurrent: int) -> float:
+        start = time.perf_counter()
+        session.post_all(endpoint_requests, max_concurrent)
+        return time.perf_counter() - start
+
+    async def time_async(max_concurrent: int) -> float:
+        async_session = AsyncTTSHttpSession(pool_size=args.max_concurrent)
+        start = time.perf_counter()
+        await async_session.post_all(endpoint_requests, max_concurrent)
+        seconds = time.perf_counter() - start
+        await async_session.close()
+        return seconds
+
+    longest_phrase_seconds = max(len(phrase) for phrase in PHRASES) * args.ms_per_char / 1000
+    print(f'{len(PHRASES)} phrases, {args.ms_per_char:.0f} ms per character, longest phrase {longest_phrase_seconds:.2f} s')
+    print(f'blocking, one at a time:  {time_blocking(1):.2f} s')
+    print(f'blocking, {args.max_concurrent} at a time:    {time_blocking(args.max_concurrent):.2f} s')
+    print(f'asyncio, one at a time:   {asyncio.run(time_async(1)):.2f} s')
+    print(f'asyncio, {args.max_concurrent} at a time:     {asyncio.run(time_async(args.max_concurrent)):.2f} s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Measure how soon an NPC starts speaking, and how smoothly it carries on, while the LLM's response streams in
+
+Scripted responses are streamed word by word (at --words-per-second, like an LLM) through ChatManager, which
+splits them into voicelines, synthesizes them against the fake TTS server and "plays" each by waiting for its length.
+Each tts_chunking policy is run on the same responses, with and without tts_first_clause_words.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.response_latency --profile cpu
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from benchmarks.fake_tts_server import FakeTTSServer, PROFILES
+from benchmarks.tts_pipeline import audio_seconds, benchmark_config, create_synthesizer, install_fake_voice_models
+from src.character_manager import Character
+from src.characters_manager import Characters
+from src.llm.message_thread import message_thread
+from src.output_manager import ChatManager
+
+RESPONSES = {
+    'short opening': (
+        "Ah. Well met, traveller. Welcome to Whiterun, though I doubt you came all this way for the view. "
+        "Now I keep the peace here, for what little it pays. "
+        "And if you see my brother, tell him he still owes me ten septims."
+    ),
+    'long opening': (
+        "I was a soldier once, in the Legion, and I marched from Solitude to the Pale and back again more times than I care to count. "
+        "Now I keep the peace here, for what little it pays. "
+        "Watch yourself on the road to Riverwood, there are wolves about, and worse than wolves since the dragons came back."
+    ),
+}
+VOICE = 'FemaleNord'
+
+
+class ScriptedLLM:
+    """Streams `response` a word at a time, in place of openai_client"""
+    def __init__(self, response: str, words_per_second: float) -> None:
+        self.__response = response
+        self.__seconds_per_word = 1 / words_per_second
+
+    async def streaming_call(self, messages: message_thread):
+        for word in self.__response.split(' '):
+            await asyncio.sleep(self.__seconds_per_word)
+            yield word + ' '
+
+    def calculate_tokens_from_text(self, text: str) -> int:
+        return len(text.split())
+
+
+class PlaybackRecorder:
+    """Stands in for the game: notes when each voiceline would start to play, and for how long"""
+    def __init__(self, voice_folder: str, wav_file: str) -> None:
+        self.__wav_file = os.path.join(voice_folder, wav_file)
+        self.start = time.perf_counter()
+        self.lines: list[tuple[float, float, str]] = [] # (seconds since start, audio seconds, subtitle)
+
+    def write_game_info(self, text_file_name: str, text: str):
+        if text_file_name == '_mantella_say_line':
+            self.lines.append((time.perf_counter() - self.start, audio_seconds(self.__wav_file), text))
+
+    def load_data_when_available(self, text_file_name: str, text: str) -> str:
+        return ''
+
+    def summary(self) -> dict[str, float]:
+        first_audio = self.lines[0][0]
+        gaps = [max(0, start - (previous_start + previous_seconds)) for (previous_start, previous_seconds, _), (start, _, _) in zip(self.lines, self.lines[1:])]
+        end = self.lines[-1][0] + self.lines[-1][1]
+        return {'first_audio_s': first_audio, 'gaps_s': sum(gaps), 'longest_gap_s': max(gaps, default=0), 'total_s': end, 'voicelines': len(self.lines)}
+
+
+def chat_config(tts_config: SimpleNamespace, mod_folder: str) -> SimpleNamespace:
+    """The config.ini settings ChatManager reads, on top of the Synthesizer's"""
+    return SimpleNamespace(**{**vars(tts_config), **dict(
+        mod_path=mod_folder,
+        max_response_sentences=999,
+        add_voicelines_to_all_voice_folders='0',
+        offended_npc_response='Good luck with that.',
+        forgiven_npc_response='Fine, I forgive you.',
+        follow_npc_response='Lead the way.',
+        wait_time_buffer=0,
+        player_name='Traveller',
+    )})
+
+
+async def speak_response(chat_manager: ChatManager, characters: Characters) -> None:
+    await chat_manager.get_response(message_thread('You are Lydia.'), characters, False)
+
+
+def run(args, server: FakeTTSServer, response: str, settings: dict) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as folder:
+        install_fake_voice_models(folder)
+        mod_folder = os.path.join(folder, 'mod')
+        os.makedirs(os.path.join(mod_folder, VOICE))
+        config = benchmark_config(args.backend, server.url, folder, args.lookahead, **settings)
+        synthesizer = create_synthesizer(config, folder, args.facefx_seconds_per_audio_second)
+        # the voice model is loaded before the player starts talking
+        synthesizer.change_voice(VOICE)
+
+        character = Character({'name': 'Lydia', 'bio': '', 'is_in_combat': 0, 'in_game_relationship_level': 0, 'in_game_voice_model': VOICE, 'voice_model': VOICE}, 'en', False)
+        characters = Characters()
+        characters.add_character(character)
+        chat_manager = ChatManager(None, chat_config(config, mod_folder), synthesizer, ScriptedLLM(response, args.words_per_second))
+        chat_manager.active_character = character
+        recorder = PlaybackRecorder(os.path.join(mod_folder, VOICE), chat_manager.wav_file)
+        chat_manager.game_state_manager = recorder
+
+        asyncio.run(speak_response(chat_manager, characters))
+        # the stock lines are pre-synthesized after the response, into the temporary folder
+        synthesizer.stock_lines.join()
+        synthesizer.lip_sync.join()
+        return recorder.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time how soon and how smoothly a streamed response is spoken')
+    parser.add_argument('--backend', choices=['xvasynth', 'xtts'], default='xvasynth')
+    parser.add_argument('--profile', choices=PROFILES, default='gpu')
+    parser.add_argument('--lookahead', type=int, default=2)
+    parser.add_argument('--words-per-second', type=float, default=30)
+    parser.add_argument('--fixed-words', type=int, default=10, help='number_words_tts for the fixed policy')
+    parser.add_argument('--first-clause-words', type=int, default=5, help='tts_first_clause_words when the first clause is sent early')
+    parser.add_argument('--facefx-seconds-per-audio-second', type=float, default=0.15)
+    args = parser.parse_args()
+
+    server = FakeTTSServer(PROFILES[args.profile], port=0).start()
+    print(f'{args.words_per_second} words/s, {args.backend} on the {args.profile} profile')
+    for response_name, response in RESPONSES.items():
+        print(f'{response_name} ({len(response.split())} words):')
+        for name, settings in [
+            ('fixed', dict(tts_chunking='fixed', number_words_tts=args.fixed_words, tts_first_clause_words=0)),
+            ('fixed + first clause', dict(tts_chunking='fixed', number_words_tts=args.fixed_words, tts_first_clause_words=args.first_clause_words)),
+            ('adaptive', dict(tts_chunking='adaptive', tts_first_clause_words=0)),
+            ('adaptive + first clause', dict(tts_chunking='adaptive', tts_first_clause_words=args.first_clause_words)),
+        ]:
+            timings = run(args, server, response, settings)
+            print(f'  {name:>23}: first audio after {timings["first_audio_s"]:.2f} s, {timings["voicelines"]} voicelines, {timings["gaps_s"]:.2f} s of gaps (longest {timings["longest_gap_s"]:.2f} s), done speaking after {timings["total_s"]:.2f} s')
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
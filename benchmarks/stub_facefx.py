@@ -0,0 +1,27 @@
+"""A stand-in for FaceFXWrapper.exe, for trying out lip sync on systems which can't run it
+
+Takes about as long as FaceFX (`--seconds-per-audio-second` of the .wav file's length) and writes a dummy .lip file.
+Set it as the facefx_command in config.ini:
+    facefx_command = python benchmarks/stub_facefx.py "{wav_file}" "{lip_file}"
+"""
+import argparse
+import time
+import wave
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pretend to be FaceFXWrapper: write a dummy .lip file for a .wav file')
+    parser.add_argument('wav_file')
+    parser.add_argument('lip_file')
+    parser.add_argument('--seconds-per-audio-second', type=float, default=0.15)
+    args = parser.parse_args()
+
+    with wave.open(args.wav_file, 'r') as wf:
+        audio_seconds = wf.getnframes() / wf.getframerate()
+    time.sleep(args.seconds_per_audio_second * audio_seconds)
+    with open(args.lip_file, 'wb') as f:
+        f.write(b'LIPS' + int(1000 * audio_seconds).to_bytes(4, 'little'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Measure the per-request overhead of talking to the TTS server, with and without the pooled session
+
+A local server which answers instantly stands in for xVASynth / xTTS, so only the HTTP overhead is measured.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.tts_http
+"""
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from src.speech.http_session import TTSHttpSession
+
+
+class InstantHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like the real servers
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def time_lines(synthesize_line, lines: int) -> list[float]:
+    times = []
+    for i in range(lines):
+        start = time.perf_counter()
+        synthesize_line(i)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time TTS HTTP requests with a new connection per request vs a pooled session')
+    parser.add_argument('--lines', type=int, default=300)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InstantHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    line = {'text': 'I used to be an adventurer like you.', 'speaker_wav': 'malenord', 'language': 'en'}
+
+    # the old xTTS path: set the output folder, then synthesize, each on a new connection
+    def unpooled(i):
+        requests.post(f'{base_url}/set_output/', json={'output_folder': 'data/voicelines/Male Nord'})
+        requests.post(f'{base_url}/tts_to_audio/', json={**line, 'save_path': f'out{i}.wav'})
+
+    session = TTSHttpSession()
+    def pooled(i):
+        session.post_if_changed('set_output', f'{base_url}/set_output/', {'output_folder': 'data/voicelines/Male Nord'})
+        session.post('synthesize', f'{base_url}/tts_to_audio/', json={**line, 'save_path': f'out{i}.wav'})
+
+    unpooled_ms = time_lines(unpooled, args.lines)
+    pooled_ms = time_lines(pooled, args.lines)
+    server.shutdown()
+
+    print(f'{args.lines} xTTS voicelines against an instant local server')
+    print(f'requests.post per call:  median {statistics.median(unpooled_ms):.3f} ms, p95 {sorted(unpooled_ms)[int(0.95 * (len(unpooled_ms) - 1))]:.3f} ms per line')
+    print(f'pooled session:          median {statistics.median(pooled_ms):.3f} ms, p95 {sorted(pooled_ms)[int(0.95 * (len(pooled_ms) - 1))]:.3f} ms per line')
+    print(f'session stats: {session.stats()}')
+
+
+if __name__ == '__main__':
+    main()
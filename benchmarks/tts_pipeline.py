@@ -0,0 +1,165 @@
+"""Measure the whole TTS path (voice model loads, synthesis, audio assembly, lip sync) against the fake TTS server
+
+A response's sentences are synthesized the way ChatManager does it: each one starts once the one before it is done,
+while a player waits for each voiceline (and its LIP file) and "plays" it by sleeping for its length.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.tts_pipeline --profile cpu --backend xvasynth
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import wave
+from types import SimpleNamespace
+from benchmarks.fake_tts_server import FakeTTSServer, PROFILES
+from src.speech.lip_sync import LipSyncGenerator
+from src.tts import Synthesizer
+
+SENTENCES = [
+    'Well met, traveller.',
+    'I was a soldier once, in the Legion, and I marched from Solitude to the Pale.',
+    'Now I keep the peace in Whiterun, for what little it pays.',
+    'Watch yourself on the road to Riverwood, there are wolves about.',
+    'And if you see my brother, tell him he still owes me ten septims.',
+]
+VOICES = ['MaleNord', 'FemaleNord']
+
+
+def benchmark_config(backend: str, server_url: str, xvasynth_folder: str, lookahead: int, **settings) -> SimpleNamespace:
+    """The config.ini settings Synthesizer reads, pointed at the fake server, with `settings` changed"""
+    return SimpleNamespace(**{**dict(
+        use_external_xtts=1 if backend == 'xtts' else 0,
+        xvasynth_path=xvasynth_folder,
+        xvasynth_url=server_url,
+        xvasynth_process_device='cpu',
+        tts_print=0,
+        xtts_synthesize_url=f'{server_url}/tts_to_audio/',
+        xtts_switch_model=f'{server_url}/switch_model',
+        xtts_set_tts_settings=f'{server_url}/set_tts_settings/',
+        xtts_get_models_list=f'{server_url}/get_models_list/',
+        xtts_set_output=f'{server_url}/set_output/',
+        xTTS_tts_data='{}',
+        language='en',
+        pace=1.0,
+        use_sr=0,
+        use_cleanup=0,
+        tts_request_timeout=120,
+        tts_request_retries=2,
+        tts_max_concurrent_phrases=3,
+        tts_lookahead_sentences=lookahead,
+        voiceline_cache_size_mb=0, # every line is synthesized
+        facefx_path='',
+        facefx_command='',
+        lip_sync_workers=2,
+        debug_mode='0',
+        play_audio_from_script='0',
+        goodbye_npc_response='Safe travels',
+        collecting_thoughts_npc_response='I need to gather my thoughts',
+        number_words_tts=10,
+        tts_chunking='adaptive',
+        tts_min_chunk_words=4,
+        tts_max_chunk_words=40,
+        tts_first_clause_words=5,
+    ), **settings})
+
+
+def install_fake_voice_models(xvasynth_folder: str):
+    models_folder = os.path.join(xvasynth_folder, 'resources', 'app', 'models', 'skyrim')
+    os.makedirs(models_folder)
+    for voice in VOICES:
+        with open(os.path.join(models_folder, f'sk_{voice.lower()}.json'), 'w') as f:
+            json.dump({'modelType': 'FastPitch1.1', 'games': [{'base_speaker_emb': [0.0, 0.0]}]}, f)
+        open(os.path.join(models_folder, f'sk_{voice.lower()}.pt'), 'w').close()
+
+
+def create_synthesizer(config: SimpleNamespace, folder: str, facefx_seconds_per_audio_second: float) -> Synthesizer:
+    """A Synthesizer whose files stay in `folder`, with benchmarks/stub_facefx.py standing in for FaceFX"""
+    synthesizer = Synthesizer(config)
+    # keep the benchmark's files (and LIP cache) out of MantellaSoftware/data
+    synthesizer.output_path = folder
+    synthesizer.lip_sync = LipSyncGenerator('', f'"{sys.executable}" -m benchmarks.stub_facefx "{{wav_file}}" "{{lip_file}}" --seconds-per-audio-second {facefx_seconds_per_audio_second}', os.path.join(folder, '_lip_cache'), max_cached=0)
+    return synthesizer
+
+
+def audio_seconds(audio_file: str) -> float:
+    with wave.open(audio_file, 'r') as wf:
+        return wf.getnframes() / wf.getframerate()
+
+
+async def speak_response(synthesizer: Synthesizer, voice: str, lookahead: int) -> dict[str, float]:
+    """Time to first audio, gaps between voicelines and total time of speaking SENTENCES"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, lookahead))
+    start = time.perf_counter()
+
+    async def produce():
+        previous = None
+        for sentence in SENTENCES:
+            async def synthesize_after(previous, sentence):
+                if previous is not None:
+                    await asyncio.wait([previous])
+                return await synthesizer.synthesize_async(voice, f' {sentence} ')
+            previous = asyncio.ensure_future(synthesize_after(previous, sentence))
+            await queue.put(previous)
+        await queue.put(None)
+
+    first_audio = None
+    gaps = []
+    # like ChatManager, stock lines wait until the response has been spoken
+    synthesizer.stock_lines.pause()
+    producer = asyncio.ensure_future(produce())
+    playback_end = None
+    try:
+        while (audio_file := await queue.get()) is not None:
+            audio_file = await audio_file
+            await synthesizer.wait_for_lip_file_async(audio_file)
+            now = time.perf_counter()
+            if first_audio is None:
+                first_audio = now - start
+            else:
+                gaps.append(now - playback_end)
+            await asyncio.sleep(audio_seconds(audio_file))
+            playback_end = time.perf_counter()
+        await producer
+    finally:
+        synthesizer.stock_lines.resume()
+    await synthesizer.close_async()
+    return {'first_audio_s': first_audio, 'gaps_s': sum(gaps), 'total_s': time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the TTS path against the fake TTS server')
+    parser.add_argument('--backend', choices=['xvasynth', 'xtts'], default='xvasynth')
+    parser.add_argument('--profile', choices=PROFILES, default='gpu')
+    parser.add_argument('--lookahead', type=int, default=2)
+    parser.add_argument('--facefx-seconds-per-audio-second', type=float, default=0.15)
+    args = parser.parse_args()
+
+    server = FakeTTSServer(PROFILES[args.profile], port=0).start()
+    with tempfile.TemporaryDirectory() as folder:
+        install_fake_voice_models(folder)
+        synthesizer = create_synthesizer(benchmark_config(args.backend, server.url, folder, args.lookahead), folder, args.facefx_seconds_per_audio_second)
+
+        backend = synthesizer.backend
+        print(f'{backend.name} on the {args.profile} profile (batch: {backend.supports_batch}, emotion: {backend.supports_emotion}, streaming: {backend.supports_streaming}, model switch cost: {backend.model_switch_cost})')
+        for voice in VOICES:
+            timings = asyncio.run(speak_response(synthesizer, voice, args.lookahead))
+            print(f'{len(SENTENCES)} sentences as {voice}: first audio after {timings["first_audio_s"]:.2f} s, {timings["gaps_s"]:.2f} s of gaps between lines, {timings["total_s"]:.2f} s in total')
+
+        # the stock lines are pre-synthesized after each response, into the temporary folder
+        synthesizer.stock_lines.join()
+        synthesizer.lip_sync.join()
+        for line in synthesizer.stage_timings.format_summary():
+            print(line)
+        stats = synthesizer.stats()
+        print(f'voice models: {stats["voice_models"]}')
+        print(f'lip sync: {stats["lip_sync"]}')
+        print(f'requests: {stats["async_requests"]}')
+        print(f'server: {server.stats()}')
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
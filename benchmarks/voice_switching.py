@@ -0,0 +1,51 @@
+"""Measure how long a group conversation waits on voice model loads, with and without preloading
+
+Two NPCs take turns, one sentence each. A fake TTS backend takes `--load-ms` to load a voice model and the LLM
+takes `--stream-ms` to stream a sentence after naming its speaker, so only the scheduling is measured.
+Run from the MantellaSoftware folder:
+    python -m benchmarks.voice_switching
+"""
+import argparse
+import time
+from src.speech.voice_scheduler import VoiceScheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time voice model switches in a two NPC conversation with and without preloading')
+    parser.add_argument('--sentences', type=int, default=20)
+    parser.add_argument('--load-ms', type=float, default=300)
+    parser.add_argument('--stream-ms', type=float, default=400)
+    args = parser.parse_args()
+
+    loaded_voice = ['']
+    def change_voice(voice):
+        if voice != loaded_voice[0]:
+            time.sleep(args.load_ms / 1000)
+            loaded_voice[0] = voice
+
+    speakers = ['Female Nord', 'Male Brute'] * (args.sentences // 2)
+
+    # before: the voice model is loaded as soon as the speaker is named, blocking the LLM stream
+    start = time.perf_counter()
+    for voice in speakers:
+        change_voice(voice)
+        time.sleep(args.stream_ms / 1000)
+    blocking_seconds = time.perf_counter() - start
+
+    loaded_voice[0] = ''
+    scheduler = VoiceScheduler(change_voice)
+    start = time.perf_counter()
+    for voice in speakers:
+        scheduler.preload(voice)
+        time.sleep(args.stream_ms / 1000)
+        scheduler.switch_to(voice)
+    preloading_seconds = time.perf_counter() - start
+
+    print(f'{len(speakers)} sentences alternating between two speakers, {args.load_ms:.0f} ms model loads, {args.stream_ms:.0f} ms per streamed sentence')
+    print(f'change_voice when the speaker is named: {blocking_seconds:.2f} s')
+    print(f'preload + switch_to:                    {preloading_seconds:.2f} s')
+    print(f'scheduler stats: {scheduler.stats()}')
+
+
+if __name__ == '__main__':
+    main()
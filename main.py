@@ -1,13 +1,14 @@
+import sys
 import traceback
 import src.tts as tts
 import src.stt as stt
 import logging
-import os
 import src.output_manager as output_manager
 import src.game_manager as game_manager
 import src.character_manager as character_manager
 import src.characters_manager as characters_manager
 import src.setup as setup
+from src.game_io.transport import create_transport
 from src.conversation.conversation import conversation
 from src.conversation.context import context
 from src.remember.remembering import remembering
@@ -17,12 +18,13 @@ from src.remember.summaries import summaries
 game_state_manager = None
 
 try:
-    config, character_df, language_info, client = setup.initialise(
+    config, character_index, language_info, client = setup.initialise(
         config_file='config.ini',
         logging_file='logging.log', 
         secret_key_file='GPT_SECRET_KEY.txt', 
         character_df_file='data/skyrim_characters.csv', 
-        language_file='data/language_support.csv'
+        language_file='data/language_support.csv',
+        generic_npc_voices_file='data/generic_npc_voices.json'
     )
 
     token_limit = client.token_limit
@@ -30,15 +32,15 @@ try:
     mantella_version = '0.11'
     logging.info(f'\nMantella v{mantella_version}')
 
+    game_state_manager = game_manager.GameStateManager(config.game_path, create_transport(config))
+
     # Check if the mic setting has been configured in MCM
     # If it has, use this instead of the config.ini setting, otherwise take the config.ini value
-    if os.path.exists(f'{config.game_path}/_mantella_microphone_enabled.txt'):
-        with open(f'{config.game_path}/_mantella_microphone_enabled.txt', 'r', encoding='utf-8') as f:
-            mcm_mic_enabled = f.readline().strip()
+    mcm_mic_enabled = game_state_manager.read_game_info('_mantella_microphone_enabled')
+    if mcm_mic_enabled != '':
         config.mic_enabled = '1' if mcm_mic_enabled == 'TRUE' else '0'
 
     synthesizer = tts.Synthesizer(config)
-    game_state_manager = game_manager.GameStateManager(config.game_path)
     chat_manager = output_manager.ChatManager(game_state_manager, config, synthesizer, client)
     transcriber = stt.Transcriber(game_state_manager, config, client.api_key)    
     rememberer: remembering = summaries(config.memory_prompt, config.resummarize_prompt, client, language_info['language'])
@@ -53,26 +55,25 @@ try:
 
         #base setup for conversation
         num_characters_selected = 0
+        num_characters_rejected = 0 # NPCs who could not join because their voice model is missing
         context_for_conversation = context(config, rememberer, language_info, client, token_limit_percent)
 
-        with open(f'{config.game_path}/_mantella_radiant_dialogue.txt', 'r', encoding='utf-8') as f:
-            is_radiant_dialogue = f.readline().strip().lower() == 'true'
+        is_radiant_dialogue = game_state_manager.read_game_info('_mantella_radiant_dialogue').lower() == 'true'
 
         talk = conversation(context_for_conversation, transcriber, game_state_manager, chat_manager, rememberer, is_radiant_dialogue, token_limit, token_limit_percent)
 
         while True: # Start conversation loop
-            with open(f'{config.game_path}/_mantella_actor_count.txt', 'r', encoding='utf-8') as f:
-                    try:
-                        num_characters_selected = int(f.readline().strip())
-                    except:
-                        logging.info('Failed to read _mantella_actor_count.txt')
+            try:
+                num_characters_selected = int(game_state_manager.read_game_info('_mantella_actor_count'))
+            except:
+                logging.info('Failed to read _mantella_actor_count.txt')
 
             # check if a new character has been added to conversation
-            if num_characters_selected > context_for_conversation.npcs_in_conversation.active_character_count():
+            if num_characters_selected > context_for_conversation.npcs_in_conversation.active_character_count() + num_characters_rejected:
                 try:
                     # load character when data is available
                     character_info, location, in_game_time, is_generic_npc = game_state_manager.load_game_state(
-                        config.debug_mode, config.debug_character_name, character_df, character_name, character_id, location, in_game_time
+                        config.debug_mode, config.debug_character_name, character_index, character_name, character_id, location, in_game_time
                     )
                 except game_manager.CharacterDoesNotExist:
                     game_state_manager.write_game_info('_mantella_end_conversation', 'True')
@@ -83,9 +84,24 @@ try:
                 context_for_conversation.ingame_time = int(in_game_time)
 
                 character = character_manager.Character(character_info, language_info['language'], is_generic_npc)
+                # report a missing voice model now rather than when the NPC first tries to speak
+                if not synthesizer.is_voice_model_available(character.voice_model):
+                    num_characters_rejected += 1
+                    game_state_manager.write_game_info('_mantella_character_selection', 'True')
+                    if context_for_conversation.npcs_in_conversation.active_character_count() > 0:
+                        # the NPCs already talking carry on without the one who tried to join
+                        logging.info(f'{character.name} cannot join the conversation without a voice model.')
+                        continue
+                    game_state_manager.write_game_info('_mantella_end_conversation', 'True')
+                    logging.info('Restarting...')
+                    # if debugging and character name not found, exit here to avoid endless loop
+                    if (config.debug_mode == '1') & (config.debug_character_name != 'None'):
+                        sys.exit(0)
+                    talk.end()
+                    break
                 if num_characters_selected == 1: 
                     #Only automatically preload the voice model for the first character, can't predict who will talk first/next in multi-npc or radiant
-                    synthesizer.change_voice(character.voice_model)
+                    synthesizer.voice_scheduler.preload(character.voice_model)
                     chat_manager.character_num = 0
                     chat_manager.active_character = character
                 game_state_manager.write_game_info('_mantella_character_selection', 'True')
@@ -93,14 +109,18 @@ try:
                 chat_manager.setup_voiceline_save_location(character_info['in_game_voice_model'])
                 talk.add_character(character)
 
-            with open(f'{config.game_path}/_mantella_end_conversation.txt', 'r', encoding='utf-8') as f:
-                if f.readline().strip() == 'true':
-                    talk.end()
+            if game_state_manager.read_game_info('_mantella_end_conversation') == 'true':
+                talk.end()
 
             # proceed the conversation
             if not talk.proceed():
                 break
 
+        synthesizer.voiceline_cache.save()
+        synthesizer.log_stage_timings()
+        chat_manager.log_first_audio_stats()
+        logging.debug(f'TTS stats: {synthesizer.stats()}')
+
 except Exception as e:
     if isinstance(game_state_manager, game_manager.GameStateManager):
         game_state_manager.write_game_info('_mantella_status', 'Error with Mantella.exe. Please check MantellaSoftware/logging.log')
@@ -0,0 +1,258 @@
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import sys
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import src.utils as utils
+
+# bump when the way the CSV is parsed changes, so old caches are rebuilt
+CACHE_FORMAT_VERSION = 2
+# the columns used after a character has been looked up; everything else in the CSV (bio_url, notes, ...) is dropped
+CHARACTER_COLUMNS = ['name', 'voice_model', 'skyrim_voice_folder', 'race', 'gender', 'baseid_int']
+CATEGORICAL_COLUMNS = ['voice_model', 'skyrim_voice_folder', 'race', 'gender']
+
+
+def normalize_base_id(base_id) -> str:
+    """Normalize a base ID to the decimal string the game writes to _mantella_current_actor_id
+
+    IDs read from the CSV are floats ('554831.0') because of missing values in the column
+    """
+    base_id = str(base_id).strip()
+    if base_id.endswith('.0'):
+        base_id = base_id[:-2]
+    return base_id
+
+
+def hash_file(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def parse_character_csv(file_name: str) -> tuple[pd.DataFrame, str | None]:
+    """Parse skyrim_characters.csv the slow way, returning the characters which have a voice model and the detected encoding"""
+    encoding = utils.get_file_encoding(file_name)
+    character_df = pd.read_csv(file_name, engine='python', encoding=encoding)
+    character_df = character_df.loc[character_df['voice_model'].notna()]
+    return character_df, encoding
+
+
+def compact_character_df(character_df: pd.DataFrame) -> tuple[pd.DataFrame, list[str]]:
+    """Reduce the parsed CSV to the columns Mantella uses, returning the compact table and the bios (row for row)
+
+    The few distinct voice models, races, genders and voice folders are stored as categoricals, and base IDs as
+    interned strings without the '.0' float artefact.
+    """
+    character_df = character_df.reset_index(drop=True)
+    bios = [bio if isinstance(bio, str) else '' for bio in character_df['bio']]
+
+    compact_df = character_df[CHARACTER_COLUMNS].copy()
+    compact_df['name'] = compact_df['name'].astype(str).astype(object)
+    for column in CATEGORICAL_COLUMNS:
+        compact_df[column] = compact_df[column].astype('category')
+    compact_df['baseid_int'] = [sys.intern(normalize_base_id(base_id)) if pd.notna(base_id) else None for base_id in compact_df['baseid_int']]
+    return compact_df, bios
+
+
+class Bios(ABC):
+    """The bios of the characters in the compact table, looked up by row"""
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def get(self, row: int) -> str:
+        pass
+
+    def close(self):
+        pass
+
+
+class BioStore(Bios):
+    """Character bios kept in a side file of concatenated UTF-8 text, memory-mapped and decoded one at a time
+
+    Only the bios of the NPCs in a conversation are ever needed, so keeping thousands of them as Python strings
+    is wasted memory. `offsets[row]:offsets[row+1]` is the byte range of a row's bio in the file.
+    """
+    def __init__(self, bios_file: str, offsets: np.ndarray) -> None:
+        self.__offsets = offsets
+        self.__mmap: mmap.mmap | None = None
+        if offsets[-1] > 0: # an empty file can't be mapped
+            with open(bios_file, 'rb') as f:
+                self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self.__mmap) != offsets[-1]:
+                self.close()
+                raise ValueError(f'{bios_file} does not match its offsets')
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self.__offsets
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
+
+    def get(self, row: int) -> str:
+        if self.__mmap is None:
+            return ''
+        return self.__mmap[self.__offsets[row]:self.__offsets[row + 1]].decode('utf-8')
+
+    def close(self):
+        if self.__mmap is not None:
+            self.__mmap.close()
+            self.__mmap = None
+
+    @staticmethod
+    def write(bios_file: str, bios: list[str]) -> np.ndarray:
+        """Write the bios side file and return its offsets"""
+        encoded = [bio.encode('utf-8') for bio in bios]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(bio) for bio in encoded])
+        temp_file = f'{bios_file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(b''.join(encoded))
+        os.replace(temp_file, bios_file)
+        return offsets
+
+
+class InMemoryBioStore(Bios):
+    """Bios kept as Python strings, for when the side file can't be written"""
+    def __init__(self, bios: list[str]) -> None:
+        self.__bios = bios
+
+    def __len__(self) -> int:
+        return len(self.__bios)
+
+    def get(self, row: int) -> str:
+        return self.__bios[row]
+
+
+class CharacterDatabase:
+    """Loads skyrim_characters.csv from a pre-parsed cache file, rebuilding the cache when the CSV changes
+
+    The cache file holds two pickles: a small header identifying the CSV it was built from (size, mtime, SHA-256,
+    detected encoding) and the compact table (see `compact_character_df`) with the offsets of the bios, which are
+    kept in a separate `.bios` file (see `BioStore`). A matching size and mtime is trusted without reading the CSV.
+    Otherwise the CSV is hashed, so that a CSV which was only touched (eg copied by a mod manager) is not parsed again.
+    """
+    def __init__(self, csv_file: str, cache_file: str | None = None) -> None:
+        self.__csv_file = csv_file
+        self.__cache_file = cache_file if cache_file is not None else csv_file + '.cache'
+        self.__bios_file = os.path.splitext(self.__cache_file)[0] + '.bios'
+        self.__timings: dict[str, float] = {}
+        self.__source = ''
+
+    @property
+    def cache_file(self) -> str:
+        return self.__cache_file
+
+    @property
+    def source(self) -> str:
+        """Where the last load came from: 'cache' or 'csv'"""
+        return self.__source
+
+    @property
+    def timings(self) -> dict[str, float]:
+        """Seconds spent in each step of the last load"""
+        return self.__timings
+
+    def load(self) -> tuple[pd.DataFrame, Bios]:
+        """Return the compact character table and the store of its bios"""
+        start = time.perf_counter()
+        self.__timings = {}
+        stat = os.stat(self.__csv_file)
+        key = {
+            'version': CACHE_FORMAT_VERSION,
+            'pandas_version': pd.__version__,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+
+        header = self.__read_header()
+        if header is not None and all(header.get(name) == value for name, value in key.items()):
+            cached = self.__read_cache()
+            if cached is not None:
+                return self.__loaded_from('cache', start, cached, header)
+
+        hash_start = time.perf_counter()
+        key['sha256'] = hash_file(self.__csv_file)
+        self.__timings['hash'] = time.perf_counter() - hash_start
+        if header is not None and all(header.get(name) == value for name, value in key.items() if name != 'mtime_ns'):
+            cached = self.__read_cache()
+            if cached is not None:
+                # same content with a new mtime, so only the header needs updating
+                header['mtime_ns'] = key['mtime_ns']
+                self.__write_cache(header, cached[0], cached[1].offsets)
+                return self.__loaded_from('cache', start, cached, header)
+
+        parse_start = time.perf_counter()
+        character_df, encoding = parse_character_csv(self.__csv_file)
+        character_df, bios = compact_character_df(character_df)
+        self.__timings['parse'] = time.perf_counter() - parse_start
+        header = {**key, 'encoding': encoding, 'parse_seconds': self.__timings['parse']}
+        try:
+            offsets = BioStore.write(self.__bios_file, bios)
+            self.__write_cache(header, character_df, offsets)
+            bio_store = BioStore(self.__bios_file, offsets)
+        except (OSError, ValueError) as e:
+            # a read-only install still works, it just parses the CSV on every launch and keeps the bios in memory
+            logging.warning(f'Could not write character database cache {self.__cache_file}: {e}')
+            bio_store = InMemoryBioStore(bios)
+        return self.__loaded_from('csv', start, (character_df, bio_store), header)
+
+    def report(self) -> str:
+        """A one line summary of the last load, for the startup log"""
+        total = self.__timings.get('total', 0)
+        if self.__source == 'cache':
+            parse_seconds = self.__timings.get('csv_parse_when_built', 0)
+            return f'Loaded character database from cache in {total:.3f} seconds (parsing the CSV took {parse_seconds:.3f} seconds)'
+        return f'Parsed character database from CSV in {total:.3f} seconds (cache rebuilt at {self.__cache_file})'
+
+    def __loaded_from(self, source: str, start: float, loaded: tuple[pd.DataFrame, Bios], header: dict) -> tuple[pd.DataFrame, Bios]:
+        self.__source = source
+        self.__timings['csv_parse_when_built'] = header.get('parse_seconds', 0)
+        self.__timings['total'] = time.perf_counter() - start
+        return loaded
+
+    def __read_header(self) -> dict | None:
+        try:
+            with open(self.__cache_file, 'rb') as f:
+                header = pickle.load(f)
+            return header if isinstance(header, dict) else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.debug(f'Could not read character database cache {self.__cache_file}: {e}')
+            return None
+
+    def __read_cache(self) -> tuple[pd.DataFrame, 'BioStore'] | None:
+        try:
+            with open(self.__cache_file, 'rb') as f:
+                pickle.load(f) # header
+                character_df, offsets = pickle.load(f)
+            if not isinstance(character_df, pd.DataFrame) or len(offsets) != len(character_df) + 1:
+                return None
+            return character_df, BioStore(self.__bios_file, offsets)
+        except Exception as e:
+            logging.debug(f'Could not read character database cache {self.__cache_file}: {e}')
+            return None
+
+    def __write_cache(self, header: dict, character_df: pd.DataFrame, offsets: np.ndarray):
+        temp_file = f'{self.__cache_file}.{os.getpid()}.tmp'
+        try:
+            with open(temp_file, 'wb') as f:
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump((character_df, offsets), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self.__cache_file)
+        except OSError as e:
+            logging.warning(f'Could not write character database cache {self.__cache_file}: {e}')
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
@@ -0,0 +1,158 @@
+import re
+import unicodedata
+import pandas as pd
+from src.character_db import Bios, normalize_base_id
+from src.voice_model_table import VoiceModelTable
+
+
+def normalize_name(name: str) -> str:
+    """Fold a name for fuzzy matching, ignoring accents, punctuation, case and spacing ("J'zargo" -> "jzargo", "Lydía" -> "lydia")"""
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return re.sub(r'[\W_]', '', name.casefold())
+
+
+def name_trigrams(normalized_name: str) -> set[str]:
+    padded = f'  {normalized_name} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+class NameTrigramIndex:
+    """Inverted index from name trigrams to names, for finding names spelled slightly differently
+
+    Similarity is the Dice coefficient of the two names' trigram sets (1.0 for identical normalized names).
+    Only names sharing at least one trigram with the query are scored, instead of comparing against every name.
+    """
+    def __init__(self, names: list[str]) -> None:
+        self.__names: list[str] = []
+        self.__trigram_counts: list[int] = []
+        self.__postings: dict[str, list[int]] = {}
+        self.__ids_by_normalized_name: dict[str, int] = {}
+        for name in names:
+            normalized = normalize_name(name)
+            if normalized == '' or normalized in self.__ids_by_normalized_name:
+                continue
+            name_id = len(self.__names)
+            self.__ids_by_normalized_name[normalized] = name_id
+            self.__names.append(name)
+            trigrams = name_trigrams(normalized)
+            self.__trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self.__postings.setdefault(trigram, []).append(name_id)
+
+    def search(self, name: str, cutoff: float = 0.0, limit: int = 5) -> list[tuple[str, float]]:
+        """Return up to `limit` (name, similarity) pairs with a similarity of at least `cutoff`, best first"""
+        normalized = normalize_name(name)
+        if normalized == '':
+            return []
+        name_id = self.__ids_by_normalized_name.get(normalized)
+        if name_id is not None:
+            return [(self.__names[name_id], 1.0)]
+
+        trigrams = name_trigrams(normalized)
+        shared: dict[int, int] = {}
+        for trigram in trigrams:
+            for name_id in self.__postings.get(trigram, ()):
+                shared[name_id] = shared.get(name_id, 0) + 1
+
+        candidates = []
+        for name_id, count in shared.items():
+            similarity = 2 * count / (len(trigrams) + self.__trigram_counts[name_id])
+            if similarity >= cutoff:
+                candidates.append((similarity, name_id))
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+        return [(self.__names[name_id], round(similarity, 4)) for similarity, name_id in candidates[:limit]]
+
+
+class CharacterIndex:
+    """Hash indexes over the character database (skyrim_characters.csv), built once at startup
+
+    Lookups cost O(1) instead of a lowercase comparison over the whole column per query.
+    Where several rows share a key, the first row wins (the same row the DataFrame lookups used to return).
+    If `bios` is given, the table has no 'bio' column and each bio is only decoded when its character is looked up.
+    Names which only differ in accents, punctuation or spelling are matched with a similarity of at least
+    `name_match_cutoff` (0 to 1, where 1 disables fuzzy matching).
+    Generic NPCs get their voice model from `voice_model_table` (data/generic_npc_voices.json by default).
+    """
+    def __init__(self, character_df: pd.DataFrame, bios: Bios | None = None, name_match_cutoff: float = 0.75, voice_model_table: VoiceModelTable | None = None) -> None:
+        self.__character_df: pd.DataFrame = character_df.reset_index(drop=True)
+        self.__bios = bios
+        self.__name_match_cutoff = name_match_cutoff
+        self.__voice_model_table = voice_model_table if voice_model_table is not None else VoiceModelTable.load()
+        self.__rows_by_name: dict[str, int] = {}
+        self.__rows_by_base_id: dict[str, int] = {}
+        self.__voice_models_by_voice_folder: dict[str, str] = {}
+        self.__voice_folders_by_voice_model: dict[str, str] = {}
+
+        df = self.__character_df
+        for row, name in enumerate(df['name'].astype(str).str.lower()):
+            self.__rows_by_name.setdefault(name, row)
+        for row, base_id in enumerate(df['baseid_int']):
+            if pd.notna(base_id):
+                self.__rows_by_base_id.setdefault(normalize_base_id(base_id), row)
+        has_voice_folder = df['skyrim_voice_folder'].notna()
+        for voice_folder, voice_model in zip(df.loc[has_voice_folder, 'skyrim_voice_folder'].astype(str), df.loc[has_voice_folder, 'voice_model']):
+            self.__voice_models_by_voice_folder.setdefault(voice_folder.lower(), voice_model)
+            self.__voice_folders_by_voice_model.setdefault(str(voice_model).lower(), voice_folder)
+        self.__name_trigram_index = NameTrigramIndex(list(self.__rows_by_name.keys()))
+
+    @property
+    def character_df(self) -> pd.DataFrame:
+        return self.__character_df
+
+    @property
+    def voice_model_table(self) -> VoiceModelTable:
+        return self.__voice_model_table
+
+    def __len__(self) -> int:
+        return len(self.__character_df)
+
+    def __get_row(self, row: int | None) -> dict | None:
+        if row is None:
+            return None
+        # a new dict each time, as callers add their own keys to it
+        character = self.__character_df.iloc[row].to_dict()
+        if self.__bios is not None:
+            character['bio'] = self.__bios.get(row)
+        return character
+
+    def get_character_by_name(self, name: str) -> dict | None:
+        """Case-insensitive lookup by the 'name' column"""
+        return self.__get_row(self.__rows_by_name.get(name.lower()))
+
+    def find_similar_names(self, name: str, limit: int = 5) -> list[tuple[str, float]]:
+        """Ranked (lowercased name, similarity) candidates for a name, down to the configured cut-off"""
+        return self.__name_trigram_index.search(name, self.__name_match_cutoff, limit)
+
+    def get_character_by_similar_name(self, name: str) -> dict | None:
+        """The character with the most similar name, if it is at least as similar as the configured cut-off"""
+        if self.__name_match_cutoff >= 1:
+            return None
+        candidates = self.find_similar_names(name, limit=1)
+        if len(candidates) == 0:
+            return None
+        return self.__get_row(self.__rows_by_name[candidates[0][0]])
+
+    def get_character_by_base_id(self, base_id: str) -> dict | None:
+        """Lookup by the 'baseid_int' column"""
+        return self.__get_row(self.__rows_by_base_id.get(normalize_base_id(base_id)))
+
+    def get_voice_model_by_voice_folder(self, voice_folder: str) -> str | None:
+        """Case-insensitive lookup of the voice model used with an in-game voice folder"""
+        return self.__voice_models_by_voice_folder.get(voice_folder.lower())
+
+    def get_voice_folder_by_voice_model(self, voice_model: str) -> str | None:
+        """Case-insensitive lookup of the in-game voice folder used with a voice model"""
+        return self.__voice_folders_by_voice_model.get(voice_model.lower())
+
+    def get_generic_voice_model(self, voice_form_id: str, voice_folder: str, race: str, is_female: bool) -> str:
+        """Pick the voice model of an NPC which isn't in skyrim_characters.csv from its in-game voice type
+
+        Tries the voice type's form ID, then its voice folder, then the NPC's race and sex.
+        """
+        voice_model = self.__voice_model_table.get_voice_model_by_form_id(voice_form_id)
+        if voice_model is None:
+            voice_model = self.get_voice_model_by_voice_folder(voice_folder)
+        if voice_model is None:
+            voice_model = self.__voice_model_table.get_voice_model_by_race(race, is_female)
+        return voice_model
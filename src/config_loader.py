@@ -70,6 +70,7 @@ https://github.com/art-from-the-machine/Mantella#issues-qa
             self.xvasynth_path = config['Paths']['xvasynth_folder']
             self.mod_path = config['Paths']['mod_folder']
             self.facefx_path = config['Paths']['facefx_folder']
+            self.facefx_command = config['Paths']['facefx_command']
             #Added from xTTS implementation
             self.xtts_server_path = config['Paths']['xtts_server_folder']
 
@@ -111,17 +112,31 @@ https://github.com/art-from-the-machine/Mantella#issues-qa
             #Added from xTTS implementation
             self.use_external_xtts = int(config['Speech']['use_external_xtts'])
             self.number_words_tts = int(config['Speech']['number_words_tts'])
+            self.tts_chunking = config['Speech']['tts_chunking'].strip().lower()
+            self.tts_min_chunk_words = int(config['Speech']['tts_min_chunk_words'])
+            self.tts_max_chunk_words = int(config['Speech']['tts_max_chunk_words'])
+            self.tts_first_clause_words = int(config['Speech']['tts_first_clause_words'])
             self.xtts_synthesize_url = config['Speech']['xtts_synthesize_url']
             self.xtts_switch_model = config['Speech']['xtts_switch_model']
             self.xtts_set_tts_settings = config['Speech']['xtts_set_tts_settings']
             self.xTTS_tts_data = config['Speech']['xTTS_tts_data']
             self.xtts_get_models_list = config['Speech']['xtts_get_models_list']
             self.xtts_set_output = config['Speech']['xtts_set_output']
+            self.xvasynth_url = config['Speech']['xvasynth_url']
             self.xvasynth_process_device = config['Speech']['tts_process_device']
             self.pace = float(config['Speech']['pace'])
             self.use_cleanup = int(config['Speech']['use_cleanup'])
             self.use_sr = int(config['Speech']['use_sr'])
             self.tts_print = int(config['Speech']['tts_print'])
+            self.tts_request_timeout = float(config['Speech']['tts_request_timeout'])
+            self.tts_request_retries = int(config['Speech']['tts_request_retries'])
+            self.voiceline_cache_size_mb = float(config['Speech']['voiceline_cache_size_mb'])
+            self.tts_lookahead_sentences = int(config['Speech']['tts_lookahead_sentences'])
+            self.tts_max_concurrent_phrases = int(config['Speech']['tts_max_concurrent_phrases'])
+            self.lip_sync_workers = int(config['Speech']['lip_sync_workers'])
+
+            self.game_transport = config['Game']['game_transport'].strip().lower()
+            self.game_transport_port = int(config['Game']['game_transport_port'])
 
             self.remove_mei_folders = config['Cleanup']['remove_mei_folders']
             #Debugging
@@ -132,9 +147,11 @@ https://github.com/art-from-the-machine/Mantella#issues-qa
             self.default_player_response = config['Debugging']['default_player_response']
             self.debug_exit_on_first_exchange = config['Debugging']['exit_on_first_exchange']
             self.add_voicelines_to_all_voice_folders = config['Debugging']['add_voicelines_to_all_voice_folders']
+            self.game_trace_file = config['Debugging']['game_trace_file'].strip()
             #Conversation
             self.player_name = config['Conversation']['player_name']
             self.automatic_greeting = config['Conversation']['automatic_greeting']
+            self.npc_name_match_cutoff = float(config['Conversation']['npc_name_match_cutoff'])
             #Prompt
             self.prompt = config['Prompt']['prompt']
             self.multi_npc_prompt = config['Prompt']['multi_npc_prompt']
@@ -105,8 +105,9 @@ class conversation:
             config = self.__context.config
             # say goodbyes
             npc = self.__output_manager.active_character
-            if npc:
-                self.__output_manager.play_sentence_ingame(config.goodbye_npc_response, npc)
+            # the active character may be left over from the last conversation if no NPC could join this one
+            if npc and self.__context.npcs_in_conversation.contains_character(npc):
+                self.__output_manager.play_sentence_ingame(config.goodbye_npc_response, npc, self.__output_manager.character_num)
 
             self.__messages.add_message(user_message(config.end_conversation_keyword+'.', config.player_name, is_system_generated_message=True))
             self.__messages.add_message(assistant_message(config.end_conversation_keyword+'.', self.__context.npcs_in_conversation.get_all_names(), is_system_generated_message=True))
@@ -157,7 +158,7 @@ class conversation:
         
         # Play gather thoughts
         collecting_thoughts_text = self.__context.config.collecting_thoughts_npc_response
-        self.__output_manager.play_sentence_ingame(collecting_thoughts_text, latest_npc)
+        self.__output_manager.play_sentence_ingame(collecting_thoughts_text, latest_npc, self.__context.npcs_in_conversation.get_all_names().index(latest_npc.name))
         # Add gather thought messages to thread
         self.__messages.add_message(user_message(latest_npc.name +'?', self.__context.config.player_name, is_system_generated_message=True))
         if len(self.__context.npcs_in_conversation) > 1:
@@ -184,8 +185,7 @@ class conversation:
         config = self.__context.config
         transcript_cleaned = utils.clean_text(last_user_text)
         # check if conversation has ended again after player input
-        with open(f'{config.game_path}/_mantella_end_conversation.txt', 'r', encoding='utf-8') as f:
-            conversation_ended = f.readline().strip()
+        conversation_ended = self.__game_manager.read_game_info('_mantella_end_conversation')
 
         # check if user is ending conversation
         return transcriber.activation_name_exists(transcript_cleaned, config.end_conversation_keyword.lower()) or (transcriber.activation_name_exists(transcript_cleaned, 'good bye')) or (conversation_ended.lower() == 'true')
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from src.game_io.file_writer import write_text_atomically
+
+
+class GameFileCache:
+    """In-memory mirror of the (small) _mantella_ files
+
+    Every entry is validated against the file's stat mtime and size, so re-reading an unchanged file
+    costs a single stat call instead of an open, read and close.
+    """
+    # files modified less than this many seconds before they were read are not trusted,
+    # as a second write within the same mtime tick would otherwise go unnoticed
+    RACY_WINDOW = 0.05
+
+    def __init__(self) -> None:
+        self.__entries: dict[str, tuple[tuple[int, int], str]] = {}
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def stats(self) -> dict[str, int | float]:
+        total = self.__hits + self.__misses
+        return {
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'hit_rate': round(self.__hits / total, 3) if total > 0 else 0.0,
+        }
+
+    def read(self, file_path: str) -> str | None:
+        """Full content of `file_path`, or None if it does not exist"""
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            with self.__lock:
+                self.__entries.pop(file_path, None)
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.__lock:
+            entry = self.__entries.get(file_path)
+            if entry is not None and entry[0] == signature:
+                self.__hits += 1
+                return entry[1]
+            self.__misses += 1
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+
+        # the stat was taken before the read, so a write in between makes the next lookup miss
+        self.__store(file_path, signature, text)
+        return text
+
+    def read_first_line(self, file_path: str) -> str | None:
+        """Stripped first line of `file_path`, or None if it does not exist"""
+        text = self.read(file_path)
+        if text is None:
+            return None
+        lines = text.splitlines()
+        return lines[0].strip() if len(lines) > 0 else ''
+
+    def write(self, file_path: str, text: str) -> bool:
+        """Atomically write `text` to `file_path` unless it already holds it
+
+        Returns:
+            bool: True if the file was written, False if it was unchanged
+        """
+        if self.read(file_path) == text:
+            return False
+        write_text_atomically(file_path, text)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return True
+        self.__store(file_path, (stat.st_mtime_ns, stat.st_size), text)
+        return True
+
+    def invalidate(self, file_path: str | None = None):
+        with self.__lock:
+            if file_path is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(file_path, None)
+
+    def __store(self, file_path: str, signature: tuple[int, int], text: str):
+        with self.__lock:
+            if time.time() - signature[0] / 1e9 < self.RACY_WINDOW:
+                self.__entries.pop(file_path, None)
+            else:
+                self.__entries[file_path] = (signature, text)
@@ -0,0 +1,232 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable
+from src.speech.latency import latency_summary
+
+
+def read_first_line(file_path: str) -> str | None:
+    """Read the first line of a _mantella_ file. Returns None if the file does not exist (yet)"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.readline().strip()
+    except FileNotFoundError:
+        return None
+
+
+class FileWatcher(ABC):
+    """Base class for blocking until a game file contains the expected data
+
+    Subclasses only need to implement how to sleep until a file has (probably) changed.
+    The content is always re-read and re-checked after waking up, so spurious wake-ups are harmless.
+    """
+    def __init__(self, reader: Callable[[str], str | None] = read_first_line) -> None:
+        self._reader: Callable[[str], str | None] = reader
+        self.__wake_latencies: deque[float] = deque(maxlen=200)
+
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
+    def wait_for(self, file_path: str, predicate: Callable[[str], bool], timeout: float | None = None) -> str | None:
+        """Block until the content of `file_path` satisfies `predicate`
+
+        Args:
+            file_path (str): the file to watch
+            predicate (Callable[[str], bool]): condition the (stripped) first line of the file has to meet
+            timeout (float | None, optional): seconds to wait before giving up. Defaults to None (wait forever).
+
+        Returns:
+            str | None: the content of the file or None if the timeout was reached
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._watch(file_path)
+        has_waited = False
+        while True:
+            text = self._reader(file_path)
+            if text is not None and predicate(text):
+                if has_waited:
+                    self.__record_wake_latency(file_path)
+                return text
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            self._wait_for_change(file_path, remaining)
+            has_waited = True
+
+    def wake_latency_summary(self) -> dict[str, float]:
+        """Time between the game writing a file and this watcher noticing it (in milliseconds)"""
+        return latency_summary(self.__wake_latencies)
+
+    def __record_wake_latency(self, file_path: str):
+        try:
+            latency = time.time() - os.stat(file_path).st_mtime
+        except OSError:
+            return
+        # the latency can't be negative; clock granularity can make it look that way though
+        self.__wake_latencies.append(max(latency, 0.0))
+
+    def _watch(self, file_path: str):
+        """Called before the first read of `file_path` so that no change between the read and the wait gets lost"""
+        pass
+
+    @abstractmethod
+    def _wait_for_change(self, file_path: str, timeout: float | None):
+        """Sleep until `file_path` has possibly changed or `timeout` seconds have passed"""
+        pass
+
+
+class PollingFileWatcher(FileWatcher):
+    """Fallback watcher that polls the file's stat signature with an adaptive backoff
+
+    Polling starts at `min_interval` and doubles up to `max_interval` while nothing changes,
+    so an idle wait costs a handful of stat calls per second
+    """
+    def __init__(self, reader: Callable[[str], str | None] = read_first_line, min_interval: float = 0.001, max_interval: float = 0.05) -> None:
+        super().__init__(reader)
+        self.__min_interval = min_interval
+        self.__max_interval = max_interval
+
+    @staticmethod
+    def __signature(file_path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(file_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _wait_for_change(self, file_path: str, timeout: float | None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        signature = self.__signature(file_path)
+        interval = self.__min_interval
+        while True:
+            sleep_time = interval
+            if deadline is not None:
+                sleep_time = min(sleep_time, deadline - time.monotonic())
+                if sleep_time <= 0:
+                    return
+            time.sleep(sleep_time)
+            if self.__signature(file_path) != signature:
+                return
+            interval = min(interval * 2, self.__max_interval)
+
+
+class InotifyFileWatcher(FileWatcher):
+    """Linux watcher using inotify on the folder of the watched file"""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    # re-read the file at least this often in case a notification gets lost
+    MAX_WAIT = 0.25
+
+    def __init__(self, reader: Callable[[str], str | None] = read_first_line) -> None:
+        super().__init__(reader)
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.__local = threading.local()
+        # fail early (and fall back to polling) if inotify is not available
+        self.__get_fd()
+
+    def __get_fd(self) -> int:
+        # inotify events are consumed on read, so each thread gets its own instance
+        if not hasattr(self.__local, 'fd'):
+            fd = self.__libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+            if fd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            self.__local.fd = fd
+            self.__local.watched = set()
+        return self.__local.fd
+
+    def _watch(self, file_path: str):
+        fd = self.__get_fd()
+        directory = os.path.dirname(os.path.abspath(file_path))
+        if directory in self.__local.watched:
+            return
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if self.__libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self.__local.watched.add(directory)
+
+    def _wait_for_change(self, file_path: str, timeout: float | None):
+        fd = self.__get_fd()
+        timeout = self.MAX_WAIT if timeout is None else min(timeout, self.MAX_WAIT)
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if readable:
+            # drain all pending events; the caller re-reads the file anyway
+            try:
+                while os.read(fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+
+class WindowsFileWatcher(FileWatcher):
+    """Windows watcher using directory change notifications on the folder of the watched file"""
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+    FILE_NOTIFY_CHANGE_SIZE = 0x00000008
+    FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+    WAIT_OBJECT_0 = 0x00000000
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+    # re-read the file at least this often in case a notification gets lost
+    MAX_WAIT = 0.25
+
+    def __init__(self, reader: Callable[[str], str | None] = read_first_line) -> None:
+        super().__init__(reader)
+        self.__kernel32 = ctypes.WinDLL('kernel32', use_last_error=True) # type: ignore[attr-defined]
+        self.__kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        self.__kernel32.FindFirstChangeNotificationW.argtypes = [ctypes.c_wchar_p, ctypes.c_int, ctypes.c_uint32]
+        self.__kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+        self.__kernel32.WaitForSingleObject.restype = ctypes.c_uint32
+        self.__kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+        self.__local = threading.local()
+
+    def __get_handle(self, file_path: str):
+        # a change handle is re-armed by whoever waits on it, so each thread gets its own handles
+        if not hasattr(self.__local, 'handles'):
+            self.__local.handles = {}
+        directory = os.path.dirname(os.path.abspath(file_path))
+        handle = self.__local.handles.get(directory)
+        if handle is None:
+            notify_filter = self.FILE_NOTIFY_CHANGE_FILE_NAME | self.FILE_NOTIFY_CHANGE_SIZE | self.FILE_NOTIFY_CHANGE_LAST_WRITE
+            handle = self.__kernel32.FindFirstChangeNotificationW(directory, False, notify_filter)
+            if handle is None or handle == self.INVALID_HANDLE_VALUE:
+                raise ctypes.WinError(ctypes.get_last_error()) # type: ignore[attr-defined]
+            self.__local.handles[directory] = handle
+        return handle
+
+    def _watch(self, file_path: str):
+        self.__get_handle(file_path)
+
+    def _wait_for_change(self, file_path: str, timeout: float | None):
+        handle = self.__get_handle(file_path)
+        timeout = self.MAX_WAIT if timeout is None else min(timeout, self.MAX_WAIT)
+        if self.__kernel32.WaitForSingleObject(handle, int(timeout * 1000)) == self.WAIT_OBJECT_0:
+            self.__kernel32.FindNextChangeNotification(handle)
+
+
+def create_file_watcher(reader: Callable[[str], str | None] = read_first_line) -> FileWatcher:
+    """Return the best file watcher available on this OS, falling back to polling"""
+    try:
+        if sys.platform == 'win32':
+            return WindowsFileWatcher(reader)
+        elif sys.platform.startswith('linux'):
+            return InotifyFileWatcher(reader)
+    except (OSError, AttributeError) as e:
+        logging.debug(f'File change notifications are not available ({e}). Falling back to polling.')
+    return PollingFileWatcher(reader)
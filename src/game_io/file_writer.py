@@ -0,0 +1,45 @@
+import logging
+import os
+import tempfile
+import time
+
+
+def write_text_atomically(file_path: str, text: str, max_wait: float = 5):
+    """Write `text` to a temp file next to `file_path` and rename it into place
+
+    Readers on the game side either see the old or the new content, never a half written file.
+    It always writes: GameFileCache.write is what skips content the file already holds.
+
+    Args:
+        file_path (str): the file to write
+        text (str): the new content
+        max_wait (float, optional): seconds to keep retrying while the game holds the file open. Defaults to 5.
+    """
+    content = text.encode('utf-8')
+
+    directory, file_name = os.path.split(file_path)
+    fd, temp_path = tempfile.mkstemp(dir=directory or '.', prefix=f'.{file_name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+
+        # the rename fails on Windows while the game has the target open, so retry with a short backoff
+        delay = 0.01
+        deadline = time.monotonic() + max_wait
+        while True:
+            try:
+                os.replace(temp_path, file_path)
+                break
+            except PermissionError:
+                if time.monotonic() + delay > deadline:
+                    raise
+                logging.debug(f'Permission denied to write to {file_name}. Retrying...')
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
@@ -0,0 +1,173 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from src.game_io.file_cache import GameFileCache
+from src.game_io.file_writer import write_text_atomically
+from src.game_io.trace import load_trace, summarize_timeline
+
+# values which are part of the protocol itself; any other value is free text (eg a voiceline) which can differ between runs
+PROTOCOL_VALUES = ['', 'True', 'False', 'true', 'false']
+
+
+class TraceReplayer:
+    """Plays the game side of a recorded trace into a folder while Mantella runs against it
+
+    Every game write in the trace waits for the Mantella write that preceded it in the recording (the one the game
+    was reacting to), then waits as long as the game took to react during the recording, then writes its value.
+    Free text values written by Mantella (voicelines, player input) only have to match by key, so runs with a
+    different LLM response can still be replayed, but the closer the responses are to the recording the more
+    comparable the measurements are.
+    """
+    def __init__(self, trace_file: str, game_path: str, speed: float = 1.0, dependency_timeout: float = 120, poll_interval: float = 0.002) -> None:
+        self.__entries = load_trace(trace_file)
+        self.__game_path = game_path
+        self.__speed = speed
+        self.__dependency_timeout = dependency_timeout
+        self.__poll_interval = poll_interval
+
+        self.__mantella_keys = sorted({entry['key'] for entry in self.__entries if entry['side'] == 'mantella'})
+        self.__file_cache = GameFileCache()
+        self.__condition = threading.Condition()
+        self.__last_values: dict[str, str | None] = {}
+        self.__observed: list[dict] = []
+        self.__timeline: list[dict] = []
+        self.__is_running = False
+        self.__start = 0.0
+
+    @property
+    def recorded_entries(self) -> list[dict]:
+        return self.__entries
+
+    @property
+    def timeline(self) -> list[dict]:
+        return self.__timeline
+
+    def run(self) -> dict[str, dict[str, float]]:
+        """Replay the trace and return the measured latencies (see `summarize_timeline`)"""
+        # start from a clean folder so that every write of the recording is visible again
+        os.makedirs(self.__game_path, exist_ok=True)
+        for file_name in os.listdir(self.__game_path):
+            if file_name.startswith('_mantella_') and file_name.endswith('.txt'):
+                os.remove(os.path.join(self.__game_path, file_name))
+        # lets Mantella's config check find the folder without prompting
+        write_text_atomically(self.__file_path('_mantella__skyrim_folder'), 'True')
+
+        self.__start = time.perf_counter()
+        self.__is_running = True
+        observer = threading.Thread(target=self.__observe_mantella, name='mantella-trace-observer', daemon=True)
+        observer.start()
+        try:
+            self.__play_game_side()
+        finally:
+            self.__is_running = False
+            observer.join()
+
+        self.__timeline = sorted(self.__timeline + self.__observed, key=lambda entry: entry['t'])
+        return summarize_timeline(self.__timeline)
+
+    def __now(self) -> float:
+        return time.perf_counter() - self.__start
+
+    def __file_path(self, key: str) -> str:
+        return f'{self.__game_path}/{key}.txt'
+
+    def __play_game_side(self):
+        cursor = 0 # index into the observed Mantella writes which have already been matched
+        last_dependency = None
+        last_game_write = (0.0, 0.0) # (recorded time, replayed time)
+        for i, entry in enumerate(self.__entries):
+            if entry['side'] != 'game':
+                continue
+
+            dependency = self.__find_dependency(i)
+            if (dependency is not None) and (dependency is not last_dependency) and (dependency['t'] > last_game_write[0]):
+                cursor, observed_at = self.__wait_for_mantella(dependency, cursor)
+                anchor = (dependency['t'], observed_at)
+                last_dependency = dependency
+            else:
+                anchor = last_game_write
+
+            # react as quickly as the game did during the recording
+            delay = (entry['t'] - anchor[0]) * self.__speed
+            remaining = anchor[1] + delay - self.__now()
+            if remaining > 0:
+                time.sleep(remaining)
+
+            self.__write_game_entry(entry)
+            last_game_write = (entry['t'], self.__now())
+
+    def __find_dependency(self, index: int) -> dict | None:
+        for entry in reversed(self.__entries[:index]):
+            if entry['side'] == 'mantella':
+                return entry
+        return None
+
+    def __matches(self, observed: dict, expected: dict) -> bool:
+        if observed['key'] != expected['key']:
+            return False
+        if expected['value'] in PROTOCOL_VALUES:
+            return observed['value'] == expected['value']
+        return observed['value'] not in PROTOCOL_VALUES
+
+    def __wait_for_mantella(self, expected: dict, cursor: int) -> tuple[int, float]:
+        deadline = time.monotonic() + self.__dependency_timeout
+        with self.__condition:
+            while True:
+                for index in range(cursor, len(self.__observed)):
+                    if self.__matches(self.__observed[index], expected):
+                        return index + 1, self.__observed[index]['t']
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning(f"Mantella did not write {expected['key']} = '{expected['value']}' within {self.__dependency_timeout} seconds. Continuing anyway.")
+                    return cursor, self.__now()
+                self.__condition.wait(remaining)
+
+    def __write_game_entry(self, entry: dict):
+        key, value = entry['key'], entry['value']
+        with self.__condition:
+            if entry['op'] == 'append':
+                with open(self.__file_path(key), 'a', encoding='utf-8') as f:
+                    f.write(value + '\n')
+            else:
+                write_text_atomically(self.__file_path(key), value)
+            # don't report the replayer's own writes as Mantella writes
+            content = self.__file_cache.read(self.__file_path(key))
+            self.__last_values[key] = content.strip() if content is not None else None
+        self.__timeline.append({'t': self.__now(), 'side': 'game', 'op': entry['op'], 'key': key, 'value': value})
+
+    def __observe_mantella(self):
+        while self.__is_running:
+            for key in self.__mantella_keys:
+                with self.__condition:
+                    value = self.__file_cache.read(self.__file_path(key))
+                    if value is None:
+                        continue
+                    value = value.strip()
+                    if self.__last_values.get(key) == value:
+                        continue
+                    self.__last_values[key] = value
+                    self.__observed.append({'t': self.__now(), 'side': 'mantella', 'op': 'write', 'key': key, 'value': value})
+                    self.__condition.notify_all()
+            time.sleep(self.__poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the game side of a recorded Mantella trace (see config.ini's game_trace_file) into a folder. Point Mantella's skyrim_folder at that folder and start it. Existing _mantella_ files in the folder are removed.")
+    parser.add_argument('trace_file')
+    parser.add_argument('game_folder')
+    parser.add_argument('--speed', type=float, default=1.0, help='multiplier for the recorded game reaction times (0 = react instantly)')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for an expected Mantella write before continuing anyway')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    replayer = TraceReplayer(args.trace_file, args.game_folder, args.speed, args.timeout)
+    replayed = replayer.run()
+    recorded = summarize_timeline(replayer.recorded_entries)
+    print(json.dumps({'recorded': recorded, 'replayed': replayed}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
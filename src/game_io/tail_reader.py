@@ -0,0 +1,77 @@
+import os
+from typing import Iterator
+
+
+class TailReader:
+    """Incrementally reads the lines appended to a file, eg _mantella_in_game_events.txt
+
+    The reader remembers its byte offset, so each call only reads the bytes written since the previous call.
+    If the file is truncated or replaced (eg when Mantella clears it), reading restarts from the beginning.
+    A rewrite which ends up at least as long as the old content is detected by comparing the first bytes of the file.
+    """
+    HEAD_SIZE = 64
+
+    def __init__(self, file_path: str, chunk_size: int = 64 * 1024) -> None:
+        self.__file_path = file_path
+        self.__chunk_size = chunk_size
+        self.__offset = 0
+        self.__identity: tuple[int, int] | None = None
+        self.__partial = b''
+        self.__head = b''
+
+    @property
+    def offset(self) -> int:
+        return self.__offset
+
+    def reset(self):
+        self.__offset = 0
+        self.__identity = None
+        self.__partial = b''
+        self.__head = b''
+
+    def read_lines(self, include_partial: bool = False) -> Iterator[str]:
+        """Yield the complete lines written since the last call (without line endings)
+
+        Args:
+            include_partial (bool, optional): also yield a trailing line which has no line ending yet. Defaults to False.
+        """
+        try:
+            f = open(self.__file_path, 'rb')
+        except FileNotFoundError:
+            self.reset()
+            return
+
+        with f:
+            stat = os.fstat(f.fileno())
+            identity = (stat.st_dev, stat.st_ino)
+            if (identity != self.__identity) or (stat.st_size < self.__offset) or (f.read(len(self.__head)) != self.__head):
+                # the file has been replaced or rewritten since the last read
+                self.reset()
+                self.__identity = identity
+
+            if len(self.__head) < self.HEAD_SIZE:
+                f.seek(0)
+                self.__head = f.read(min(self.HEAD_SIZE, stat.st_size))
+
+            f.seek(self.__offset)
+            while True:
+                chunk = f.read(self.__chunk_size)
+                if not chunk:
+                    break
+                self.__offset += len(chunk)
+                lines = (self.__partial + chunk).split(b'\n')
+                self.__partial = lines.pop()
+                # don't let a single line without a line ending grow the buffer without bound
+                if len(self.__partial) >= self.__chunk_size:
+                    lines.append(self.__partial)
+                    self.__partial = b''
+                for line in lines:
+                    yield self.__decode(line)
+
+        if include_partial and len(self.__partial) > 0:
+            partial, self.__partial = self.__partial, b''
+            yield self.__decode(partial)
+
+    @staticmethod
+    def __decode(line: bytes) -> str:
+        return line.rstrip(b'\r').decode('utf-8', errors='replace')
@@ -0,0 +1,141 @@
+import json
+import statistics
+import threading
+import time
+from typing import Callable, Iterator
+from src.game_io.transport import GameTransport
+
+SAY_LINE_KEYS = ['_mantella_say_line'] + [f'_mantella_say_line_{i}' for i in range(2, 11)]
+
+
+class TraceRecorder:
+    """Writes timestamped protocol entries to a JSON lines trace file
+
+    Each entry looks like:
+        {"t": 1.234, "side": "mantella", "op": "write", "key": "_mantella_say_line", "value": "Hello."}
+    `side` is who changed the value ('mantella' or 'game'), `t` is in seconds since the recording started.
+    """
+    def __init__(self, trace_file: str) -> None:
+        self.__file = open(trace_file, 'w', encoding='utf-8')
+        self.__lock = threading.Lock()
+        self.__start = time.perf_counter()
+
+    def record(self, side: str, op: str, key: str, value: str):
+        entry = {'t': round(time.perf_counter() - self.__start, 6), 'side': side, 'op': op, 'key': key, 'value': value}
+        with self.__lock:
+            self.__file.write(json.dumps(entry) + '\n')
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class RecordingTransport(GameTransport):
+    """Wraps another transport and records every value change going through it
+
+    Mantella's writes are recorded as they happen. The game's writes can't be seen directly, so a read which
+    returns a value different from the last known one is recorded as a game write at the time it was observed.
+    """
+    def __init__(self, transport: GameTransport, trace_file: str) -> None:
+        self.__transport = transport
+        self.__recorder = TraceRecorder(trace_file)
+        self.__known_values: dict[str, str] = {}
+        self.__lock = threading.Lock()
+
+    def write(self, key: str, value: str) -> bool:
+        return self.write_batch({key: value}) > 0
+
+    def write_batch(self, values: dict[str, str]) -> int:
+        written = self.__transport.write_batch(values)
+        for key, value in values.items():
+            self.__mantella_wrote(key, value)
+        return written
+
+    def read(self, key: str) -> str:
+        return self.__observe(key, self.__transport.read(key))
+
+    def read_all(self, key: str) -> str:
+        return self.__transport.read_all(key)
+
+    def wait_for(self, key: str, predicate: Callable[[str], bool], timeout: float | None = None) -> str | None:
+        value = self.__transport.wait_for(key, predicate, timeout)
+        if value is not None:
+            self.__observe(key, value)
+        return value
+
+    def read_new_lines(self, key: str) -> Iterator[str]:
+        for line in self.__transport.read_new_lines(key):
+            self.__recorder.record('game', 'append', key, line)
+            yield line
+
+    def stats(self) -> dict:
+        return self.__transport.stats()
+
+    def close(self):
+        self.__recorder.close()
+        self.__transport.close()
+
+    def __mantella_wrote(self, key: str, value: str):
+        with self.__lock:
+            if self.__known_values.get(key) == value:
+                return
+            self.__known_values[key] = value
+        self.__recorder.record('mantella', 'write', key, value)
+
+    def __observe(self, key: str, value: str) -> str:
+        with self.__lock:
+            if self.__known_values.get(key) == value:
+                return value
+            self.__known_values[key] = value
+        self.__recorder.record('game', 'write', key, value)
+        return value
+
+
+def load_trace(trace_file: str) -> list[dict]:
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip() != '']
+
+
+def summarize_timeline(entries: list[dict]) -> dict[str, dict[str, float]]:
+    """Measure the latencies the player notices from a list of trace entries
+
+    conversation_start: the game selecting an NPC -> Mantella signalling that the NPC has been loaded
+    first_voiceline: the game selecting an NPC -> the first voiceline being handed to the game
+    turn: Mantella passing on the player's input -> the first voiceline of the reply
+    """
+    durations: dict[str, list[float]] = {'conversation_start': [], 'first_voiceline': [], 'turn': []}
+    npc_selected_at = None
+    waiting_for_first_voiceline_since = None
+    turn_started_at = None
+    for entry in sorted(entries, key=lambda entry: entry['t']):
+        key, value, t = entry['key'], entry['value'], entry['t']
+        if entry['side'] == 'game':
+            if key == '_mantella_current_actor_id' and value != '':
+                npc_selected_at = t
+                waiting_for_first_voiceline_since = t
+        elif key == '_mantella_end_conversation' and value == 'False' and npc_selected_at is not None:
+            durations['conversation_start'].append(t - npc_selected_at)
+            npc_selected_at = None
+        elif key == '_mantella_player_input' and value != '':
+            turn_started_at = t
+        elif key in SAY_LINE_KEYS and value not in ['', 'False']:
+            if waiting_for_first_voiceline_since is not None:
+                durations['first_voiceline'].append(t - waiting_for_first_voiceline_since)
+                waiting_for_first_voiceline_since = None
+            if turn_started_at is not None:
+                durations['turn'].append(t - turn_started_at)
+                turn_started_at = None
+
+    summary = {}
+    for name, values in durations.items():
+        if len(values) == 0:
+            summary[name] = {'count': 0}
+        else:
+            summary[name] = {
+                'count': len(values),
+                'mean': round(statistics.mean(values), 4),
+                'median': round(statistics.median(values), 4),
+                'max': round(max(values), 4),
+            }
+    return summary
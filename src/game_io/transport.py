@@ -0,0 +1,296 @@
+import json
+import logging
+import socket
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator
+from src.game_io.file_cache import GameFileCache
+from src.game_io.file_watcher import FileWatcher, create_file_watcher
+from src.game_io.tail_reader import TailReader
+
+
+def first_line(text: str) -> str:
+    lines = text.splitlines()
+    return lines[0].strip() if len(lines) > 0 else ''
+
+
+class GameTransport(ABC):
+    """Carries the key/value protocol between Mantella and the Mantella spell
+
+    Keys are the names of the _mantella_ files (eg '_mantella_say_line'), values are their text.
+    """
+    @abstractmethod
+    def write(self, key: str, value: str) -> bool:
+        """Set `key` to `value`. Returns False if nothing had to be sent because the value was unchanged"""
+        pass
+
+    def write_batch(self, values: dict[str, str]) -> int:
+        """Set several keys at once (in the given order). Returns the number of keys which were actually sent"""
+        written = 0
+        for key, value in values.items():
+            if self.write(key, value):
+                written += 1
+        return written
+
+    @abstractmethod
+    def read(self, key: str) -> str:
+        """Current value of `key` (first line, stripped). Returns '' if the key has not been set"""
+        pass
+
+    @abstractmethod
+    def read_all(self, key: str) -> str:
+        """Current value of `key` including all lines. Returns '' if the key has not been set"""
+        pass
+
+    @abstractmethod
+    def wait_for(self, key: str, predicate: Callable[[str], bool], timeout: float | None = None) -> str | None:
+        """Block until the value of `key` satisfies `predicate`. Returns None if `timeout` seconds passed first"""
+        pass
+
+    @abstractmethod
+    def read_new_lines(self, key: str) -> Iterator[str]:
+        """Stream the complete lines appended to `key` since the last call. Starts over if the value was cleared in between"""
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class FileTransport(GameTransport):
+    """Exchanges data through _mantella_ text files in the Skyrim folder (the protocol the Mantella spell speaks)"""
+    def __init__(self, game_path: str) -> None:
+        self.__game_path = game_path
+        self.__file_cache: GameFileCache = GameFileCache()
+        self.__file_watcher: FileWatcher = create_file_watcher(self.__file_cache.read_first_line)
+        self.__tail_readers: dict[str, TailReader] = {}
+        logging.debug(f'Watching game files with {self.__file_watcher.name}')
+
+    @property
+    def game_path(self) -> str:
+        return self.__game_path
+
+    def file_path(self, key: str) -> str:
+        return f'{self.__game_path}/{key}.txt'
+
+    def write(self, key: str, value: str) -> bool:
+        return self.__file_cache.write(self.file_path(key), value)
+
+    def read(self, key: str) -> str:
+        text = self.__file_cache.read_first_line(self.file_path(key))
+        return text if text is not None else ''
+
+    def read_all(self, key: str) -> str:
+        text = self.__file_cache.read(self.file_path(key))
+        return text if text is not None else ''
+
+    def wait_for(self, key: str, predicate: Callable[[str], bool], timeout: float | None = None) -> str | None:
+        return self.__file_watcher.wait_for(self.file_path(key), predicate, timeout)
+
+    def read_new_lines(self, key: str) -> Iterator[str]:
+        if key not in self.__tail_readers:
+            self.__tail_readers[key] = TailReader(self.file_path(key))
+        return self.__tail_readers[key].read_lines()
+
+    def stats(self) -> dict:
+        return {
+            'wake_latency': self.__file_watcher.wake_latency_summary(),
+            'file_cache': self.__file_cache.stats(),
+        }
+
+
+class SocketTransport(GameTransport):
+    """Exchanges data with a game-side client over a localhost TCP connection
+
+    Messages are newline delimited JSON objects in both directions:
+        {"type": "set", "values": {"_mantella_say_line": "Hello there."}}
+        {"type": "append", "key": "_mantella_in_game_events", "value": "The player picked up a sword."}
+    Writes are pushed to the client as soon as they happen, one message per batch.
+    When a client (re)connects it receives all current values first.
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 4999) -> None:
+        self.__values: dict[str, str] = {}
+        self.__condition = threading.Condition()
+        self.__send_lock = threading.Lock()
+        self.__client: socket.socket | None = None
+        self.__messages_sent = 0
+        self.__messages_received = 0
+        self.__is_closed = False
+        self.__line_offsets: dict[str, int] = {}
+
+        self.__server = socket.create_server((host, port))
+        self.__address: tuple[str, int] = self.__server.getsockname()[:2]
+        threading.Thread(target=self.__accept_clients, name='mantella-game-transport', daemon=True).start()
+        logging.info(f'Waiting for the game to connect to {self.__address[0]}:{self.__address[1]}')
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.__address
+
+    def write(self, key: str, value: str) -> bool:
+        return self.write_batch({key: value}) > 0
+
+    def write_batch(self, values: dict[str, str]) -> int:
+        with self.__condition:
+            changed = {key: value for key, value in values.items() if self.__values.get(key) != value}
+            if len(changed) == 0:
+                return 0
+            self.__values.update(changed)
+            self.__condition.notify_all()
+        self.__send({'type': 'set', 'values': changed})
+        return len(changed)
+
+    def read(self, key: str) -> str:
+        return first_line(self.read_all(key))
+
+    def read_all(self, key: str) -> str:
+        with self.__condition:
+            return self.__values.get(key, '')
+
+    def wait_for(self, key: str, predicate: Callable[[str], bool], timeout: float | None = None) -> str | None:
+        with self.__condition:
+            if self.__condition.wait_for(lambda: predicate(first_line(self.__values.get(key, ''))), timeout):
+                return first_line(self.__values.get(key, ''))
+            return None
+
+    def read_new_lines(self, key: str) -> Iterator[str]:
+        with self.__condition:
+            value = self.__values.get(key, '')
+            offset = self.__line_offsets.get(key, 0)
+            if len(value) < offset:
+                # the value was cleared since the last read
+                offset = 0
+            self.__line_offsets[key] = len(value)
+        return iter(value[offset:].splitlines())
+
+    def stats(self) -> dict:
+        return {
+            'connected': self.__client is not None,
+            'messages_sent': self.__messages_sent,
+            'messages_received': self.__messages_received,
+        }
+
+    def close(self):
+        self.__is_closed = True
+        self.__server.close()
+        if self.__client is not None:
+            self.__client.close()
+
+    def __send(self, message: dict):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self.__send_lock:
+            client = self.__client
+            if client is None:
+                # the client gets the current values once it connects
+                return
+            try:
+                client.sendall(data)
+                self.__messages_sent += 1
+            except OSError as e:
+                logging.warning(f'Lost connection to the game: {e}')
+                self.__client = None
+
+    def __accept_clients(self):
+        while not self.__is_closed:
+            try:
+                client, address = self.__server.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            logging.info(f'Game connected from {address[0]}:{address[1]}')
+            with self.__send_lock:
+                self.__client = client
+                with self.__condition:
+                    snapshot = dict(self.__values)
+            if len(snapshot) > 0:
+                self.__send({'type': 'set', 'values': snapshot})
+            self.__receive(client)
+
+    def __receive(self, client: socket.socket):
+        with client, client.makefile('r', encoding='utf-8', newline='\n') as stream:
+            try:
+                for line in stream:
+                    if line.strip() == '':
+                        continue
+                    self.__apply(json.loads(line))
+            except (OSError, ValueError) as e:
+                logging.warning(f'Game connection closed: {e}')
+        if self.__client is client:
+            self.__client = None
+
+    def __apply(self, message: dict):
+        with self.__condition:
+            self.__messages_received += 1
+            if message.get('type') == 'set':
+                self.__values.update({str(key): str(value) for key, value in message['values'].items()})
+            elif message.get('type') == 'append':
+                current = self.__values.get(message['key'], '')
+                separator = '\n' if current != '' and not current.endswith('\n') else ''
+                self.__values[message['key']] = current + separator + str(message['value'])
+            else:
+                logging.warning(f'Unknown message from game: {message}')
+                return
+            self.__condition.notify_all()
+
+
+class SocketTransportClient:
+    """Stand-in for the game side of `SocketTransport`, eg to drive Mantella from a script or test"""
+    def __init__(self, host: str = '127.0.0.1', port: int = 4999, timeout: float = 5) -> None:
+        self.__values: dict[str, str] = {}
+        self.__condition = threading.Condition()
+        self.__socket = socket.create_connection((host, port), timeout=timeout)
+        self.__socket.settimeout(None)
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=self.__receive, name='mantella-game-client', daemon=True).start()
+
+    def set(self, key: str, value: str):
+        self.set_batch({key: value})
+
+    def set_batch(self, values: dict[str, str]):
+        self.__socket.sendall((json.dumps({'type': 'set', 'values': values}) + '\n').encode('utf-8'))
+
+    def append(self, key: str, value: str):
+        self.__socket.sendall((json.dumps({'type': 'append', 'key': key, 'value': value}) + '\n').encode('utf-8'))
+
+    def read(self, key: str) -> str:
+        with self.__condition:
+            return first_line(self.__values.get(key, ''))
+
+    def wait_for(self, key: str, predicate: Callable[[str], bool], timeout: float | None = None) -> str | None:
+        with self.__condition:
+            if self.__condition.wait_for(lambda: predicate(first_line(self.__values.get(key, ''))), timeout):
+                return first_line(self.__values.get(key, ''))
+            return None
+
+    def close(self):
+        self.__socket.close()
+
+    def __receive(self):
+        try:
+            with self.__socket.makefile('r', encoding='utf-8', newline='\n') as stream:
+                for line in stream:
+                    message = json.loads(line)
+                    with self.__condition:
+                        self.__values.update(message.get('values', {}))
+                        self.__condition.notify_all()
+        except (OSError, ValueError):
+            pass
+
+
+def create_transport(config) -> GameTransport:
+    """Create the transport selected in config.ini"""
+    if config.game_transport == 'socket':
+        transport = SocketTransport('127.0.0.1', config.game_transport_port)
+    else:
+        if config.game_transport != 'file':
+            logging.warning(f"Unknown game_transport '{config.game_transport}'. Falling back to 'file'.")
+        transport = FileTransport(config.game_path)
+
+    if config.game_trace_file != '':
+        # imported here as the trace module depends on this one
+        from src.game_io.trace import RecordingTransport
+        logging.info(f'Recording game communication to {config.game_trace_file}')
+        transport = RecordingTransport(transport, config.game_trace_file)
+    return transport
@@ -3,6 +3,10 @@ from src.llm.messages import user_message
 import src.utils as utils
 import time
 import random
+import pandas as pd
+from src.game_io.transport import GameTransport, FileTransport
+from src.character_index import CharacterIndex
+from src.character_db import normalize_base_id
 
 class CharacterDoesNotExist(Exception):
     """Exception raised when NPC name cannot be found in skyrim_characters.csv"""
@@ -10,35 +14,38 @@ class CharacterDoesNotExist(Exception):
 
 
 class GameStateManager:
-    def __init__(self, game_path):
+    def __init__(self, game_path, transport: GameTransport | None = None):
         self.game_path = game_path
         self.prev_game_time = ''
+        # the _mantella_ text files in the Skyrim folder are used unless another transport is given
+        self.transport: GameTransport = transport if transport is not None else FileTransport(game_path)
 
 
     def write_game_info(self, text_file_name, text):
-        max_attempts = 2
-        delay_between_attempts = 5
-
-        for attempt in range(max_attempts):
-            try:
-                with open(f'{self.game_path}/{text_file_name}.txt', 'w', encoding='utf-8') as f:
-                    f.write(text)
-                break
-            except PermissionError:
-                print(f'Permission denied to write to {text_file_name}.txt. Retrying...')
-                if attempt + 1 == max_attempts:
-                    raise
-                else:
-                    time.sleep(delay_between_attempts)
+        self.transport.write(text_file_name, text)
         return None
     
 
+    def write_game_info_batch(self, game_info: dict[str, str]):
+        """Write several _mantella_ files in one pass. Files which already hold the given text are skipped
+
+        Args:
+            game_info (dict[str, str]): file name (without .txt) -> text to write
+        """
+        written = self.transport.write_batch(game_info)
+        logging.debug(f'Wrote {written} of {len(game_info)} game files')
+        return None
+    
+
+    def read_game_info(self, text_file_name) -> str:
+        """Read the first line of a _mantella_ file without waiting for it to be populated. Unchanged files are served from memory"""
+        return self.transport.read(text_file_name)
+    
+
     def load_data_when_available(self, text_file_name, text):
-        while text == '':
-            with open(f'{self.game_path}/{text_file_name}.txt', 'r', encoding='utf-8') as f:
-                text = f.readline().strip()
-            # decrease stress on CPU while waiting for file to populate
-            time.sleep(0.01)
+        if text == '':
+            # block until the game has written something to the file
+            text = self.transport.wait_for(text_file_name, lambda content: content != '')
         return text
     
     def wait_for_conversation_init(self):
@@ -46,81 +53,53 @@ class GameStateManager:
 
     @utils.time_it
     def reset_game_info(self):
-        self.write_game_info('_mantella_current_actor', '')
         character_name = ''
-
-        self.write_game_info('_mantella_current_actor_id', '')
         character_id = ''
-
-        self.write_game_info('_mantella_current_location', '')
         location = ''
-
-        self.write_game_info('_mantella_in_game_time', '')
         in_game_time = ''
 
-        self.write_game_info('_mantella_active_actors', '')
-
-        self.write_game_info('_mantella_in_game_events', '')
-
-        self.write_game_info('_mantella_status', 'False')
-
-        self.write_game_info('_mantella_actor_is_enemy', 'False')
-        self.write_game_info('_mantella_actor_is_in_combat', 'False')
-
-        self.write_game_info('_mantella_actor_relationship', '')
-
-        self.write_game_info('_mantella_character_selection', 'True')
-
-        self.write_game_info('_mantella_say_line', 'False')
-        self.write_game_info('_mantella_say_line_2', 'False')
-        self.write_game_info('_mantella_say_line_3', 'False')
-        self.write_game_info('_mantella_say_line_4', 'False')
-        self.write_game_info('_mantella_say_line_5', 'False')
-        self.write_game_info('_mantella_say_line_6', 'False')
-        self.write_game_info('_mantella_say_line_7', 'False')
-        self.write_game_info('_mantella_say_line_8', 'False')
-        self.write_game_info('_mantella_say_line_9', 'False')
-        self.write_game_info('_mantella_say_line_10', 'False')
-        self.write_game_info('_mantella_actor_count', '0')
-
-        self.write_game_info('_mantella_player_input', '')
-
-        self.write_game_info('_mantella_aggro', '')
+        game_info = {
+            '_mantella_current_actor': character_name,
+            '_mantella_current_actor_id': character_id,
+            '_mantella_current_location': location,
+            '_mantella_in_game_time': in_game_time,
+            '_mantella_active_actors': '',
+            '_mantella_in_game_events': '',
+            '_mantella_status': 'False',
+            '_mantella_actor_is_enemy': 'False',
+            '_mantella_actor_is_in_combat': 'False',
+            '_mantella_actor_relationship': '',
+            '_mantella_character_selection': 'True',
+            '_mantella_say_line': 'False',
+        }
+        for i in range(2, 11):
+            game_info[f'_mantella_say_line_{i}'] = 'False'
+        game_info['_mantella_actor_count'] = '0'
+        game_info['_mantella_player_input'] = ''
+        game_info['_mantella_aggro'] = ''
+        game_info['_mantella_radiant_dialogue'] = 'False'
 
-        self.write_game_info('_mantella_radiant_dialogue', 'False')
+        self.write_game_info_batch(game_info)
 
         return character_name, character_id, location, in_game_time
     
     
-    def write_dummy_game_info(self, character_name, character_df):
+    def write_dummy_game_info(self, character_name, character_index: CharacterIndex):
         """Write fake data to game files when debugging"""
         logging.info(f'Writing dummy game status for debugging character {character_name}')
         actor_sex = random.choice(['Female','Male'])
         actor_race = random.choice(['ArgonianRace','BretonRace','DarkElfRace','HighElfRace','ImperialRace','KhajiitRace','NordRace','OrcRace','RedguardRace','WoodElfRace'])
-        try:
-            actor_sex = character_df.loc[character_df['name'].astype(str).str.lower()==character_name.lower(), 'gender'].values[0]
-        except:
-            pass
-        try:
-            actor_race = character_df.loc[character_df['name'].astype(str).str.lower()==character_name.lower(), 'race'].values[0]
-        except:
-            pass
+        character = character_index.get_character_by_name(character_name)
+        if character is not None:
+            actor_sex = character['gender']
+            actor_race = character['race']
         self.write_game_info('_mantella_actor_race', f'<{actor_race}')
         self.write_game_info('_mantella_actor_sex', actor_sex)
         voice_model = random.choice(['Female Nord', 'Male Nord'])
-        try: # search for voice model in skyrim_characters.csv
-            voice_model = character_df.loc[character_df['name'].astype(str).str.lower()==character_name.lower(), 'voice_model'].values[0]
-        except: # guess voice model based on sex and race
-            if actor_sex == 'Female':
-                try:
-                    voice_model = _female_voice_models[actor_race]
-                except:
-                    voice_model = 'Female Nord'
-            else:
-                try:
-                    voice_model = _male_voice_models[actor_race]
-                except:
-                    voice_model = 'Male Nord'
+        if character is not None: # search for voice model in skyrim_characters.csv
+            voice_model = character['voice_model']
+        else: # guess voice model based on sex and race
+            voice_model = character_index.voice_model_table.get_voice_model_by_race(actor_race, actor_sex == 'Female')
 
         self.write_game_info('_mantella_actor_voice', f'<{voice_model}')
 
@@ -130,10 +109,8 @@ class GameStateManager:
         self.write_game_info('_mantella_current_actor', character_name)
 
         character_id = '0'
-        try: # search for voice model in skyrim_characters.csv
-            voice_model = character_df.loc[character_df['name'].astype(str).str.lower()==character_name.lower(), 'base_id_int'].values[0]
-        except:
-            pass
+        if (character is not None) and pd.notna(character['baseid_int']): # search for base ID in skyrim_characters.csv
+            character_id = normalize_base_id(character['baseid_int'])
         self.write_game_info('_mantella_current_actor_id', str(character_id))
 
         location = 'Skyrim'
@@ -150,13 +127,12 @@ class GameStateManager:
 
         character_id = self.load_data_when_available('_mantella_current_actor_id', '')
         time.sleep(0.5) # wait for file to register
-        with open(f'{self.game_path}/_mantella_current_actor.txt', 'r') as f:
-            character_name = f.readline().strip()
+        character_name = self.read_game_info('_mantella_current_actor')
         
         return character_id, character_name
     
     
-    def debugging_setup(self, debug_character_name, character_df):
+    def debugging_setup(self, debug_character_name, character_index: CharacterIndex):
         """Select character based on debugging parameters"""
 
         # None == in-game character chosen by spell
@@ -166,64 +142,13 @@ class GameStateManager:
             character_name = debug_character_name
             debug_character_name = ''
 
-        character_name, character_id, location, in_game_time = self.write_dummy_game_info(character_name, character_df)
+        character_name, character_id, location, in_game_time = self.write_dummy_game_info(character_name, character_index)
 
         return character_name, character_id, location, in_game_time
     
     
-    def load_unnamed_npc(self, character_name, character_df):
+    def load_unnamed_npc(self, character_name, character_index: CharacterIndex):
         """Load generic NPC if character cannot be found in skyrim_characters.csv"""
-        # unknown == I couldn't find the IDs for these voice models
-        voice_model_ids = {
-            '0002992B':	'Dragon',
-            '2470000': 'Male Dark Elf Commoner',
-            '18469': 'Male Dark Elf Cynical',
-            '00013AEF':	'Female Argonian',
-            '00013AE3':	'Female Commander',
-            '00013ADE':	'Female Commoner',
-            '00013AE4':	'Female Condescending',
-            '00013AE5': 'Female Coward',
-            '00013AF3':	'Female Dark Elf',
-            'unknown': 'Female Dark Elf Commoner',
-            '00013AF1':	'Female Elf Haughty',
-            '00013ADD':	'Female Even Toned',
-            '00013AED':	'Female Khajiit',
-            '00013AE7':	'Female Nord',
-            '00013AE2':	'Female Old Grumpy',
-            '00013AE1':	'Female Old Kindly',
-            '00013AEB':	'Female Orc',
-            '00013BC3':	'Female Shrill',
-            '00012AE0':	'Female Sultry',
-            'unknown': 'Female Vampire',
-            '00013ADC':	'Female Young Eager',
-            '00013AEE':	'Male Argonian',
-            'unknown': 'Male Bandit',
-            '00013ADA':	'Male Brute',
-            '00013AD8':	'Male Commander',
-            '00013AD3': 'Male Commoner',
-            '000EA266': 'Male Commoner Accented',
-            '00013AD9':	'Male Condescending',
-            '00013ADB':	'Male Coward',
-            '00013AF2':	'Male Dark Elf Commoner',
-            'unknown': 'Male Dark Elf Cynical',
-            '00013AD4':	'Male Drunk',
-            '00013AF0':	'Male Elf Haughty',
-            '00013AD2':	'Male Even Toned',
-            '000EA267':	'Male Even Toned Accented',
-            '000AA8D3':	'Male Guard', # not in csv
-            '00013AEC':	'Male Khajiit',
-            '00013AE6':	'Male Nord',
-            '000E5003':	'Male Nord Commander',
-            '00013AD7':	'Male Old Grumpy',
-            '00013AD6':	'Male Old Kindly',
-            '00013AEA':	'Male Orc',
-            '00013AD5':	'Male Sly Cynical',
-            '0001B55F':	'Male Soldier',
-            'unknown': 'Male Vampire',
-            'unknown': 'Male Warlock',
-            '00012AD1':	'Male Young Eager',
-        }
-
         actor_voice_model = self.load_data_when_available('_mantella_actor_voice', '')
         actor_voice_model_id = actor_voice_model.split('(')[1].split(')')[0]
         actor_voice_model_name = actor_voice_model.split('<')[1].split(' ')[0]
@@ -233,32 +158,11 @@ class GameStateManager:
 
         actor_sex = self.load_data_when_available('_mantella_actor_sex', '')
 
-        voice_model = ''
-        for key in voice_model_ids:
-            # using endswith because sometimes leading zeros are ignored
-            if actor_voice_model_id.endswith(key):
-                voice_model = voice_model_ids[key]
-                break
-        
-        # if voice_model not found in the voice model ID list
-        if voice_model == '':
-            try: # search for voice model in skyrim_characters.csv
-                voice_model = character_df.loc[character_df['skyrim_voice_folder'].astype(str).str.lower()==actor_voice_model_name.lower(), 'voice_model'].values[0]
-            except: # guess voice model based on sex and race
-                if actor_sex == '1':
-                    try:
-                        voice_model = _female_voice_models[actor_race]
-                    except:
-                        voice_model = 'Female Nord'
-                else:
-                    try:
-                        voice_model = _male_voice_models[actor_race]
-                    except:
-                        voice_model = 'Male Nord'
-
-        try: # search for relavant skyrim_voice_folder for voice_model
-            skyrim_voice_folder = character_df.loc[character_df['voice_model'].astype(str).str.lower()==voice_model.lower(), 'skyrim_voice_folder'].values[0]
-        except: # assume it is simply the voice_model name without spaces
+        voice_model = character_index.get_generic_voice_model(actor_voice_model_id, actor_voice_model_name, actor_race, actor_sex == '1')
+
+        # search for relavant skyrim_voice_folder for voice_model
+        skyrim_voice_folder = character_index.get_voice_folder_by_voice_model(voice_model)
+        if skyrim_voice_folder is None: # assume it is simply the voice_model name without spaces
             skyrim_voice_folder = voice_model.replace(' ','')
         
         character_info = {
@@ -272,26 +176,29 @@ class GameStateManager:
     
     
     @utils.time_it
-    def load_game_state(self, debug_mode, debug_character_name, character_df, character_name, character_id, location, in_game_time):
+    def load_game_state(self, debug_mode, debug_character_name, character_index: CharacterIndex, character_name, character_id, location, in_game_time):
         """Load game variables from _mantella_ files in Skyrim folder (data passed by the Mantella spell)"""
 
         if debug_mode == '1':
-            character_name, character_id, location, in_game_time = self.debugging_setup(debug_character_name, character_df)
+            character_name, character_id, location, in_game_time = self.debugging_setup(debug_character_name, character_index)
         
         # tell Skyrim papyrus script to start waiting for voiceline input
         self.write_game_info('_mantella_end_conversation', 'False')
         character_id, character_name = self.load_character_name_id()
-        try: # load character from skyrim_characters.csv
-            character_info = character_df.loc[character_df['name'].astype(str).str.lower()==character_name.lower()].to_dict('records')[0]
-            is_generic_npc = False
-        except IndexError: # character not found
-            try: # try searching by ID
-                logging.info(f"Could not find {character_name} in skyrim_characters.csv. Searching by ID {character_id}...")
-                character_info = character_df.loc[(character_df['baseid_int'].astype(str)==character_id) | (character_df['baseid_int'].astype(str)==character_id+'.0')].to_dict('records')[0]
-                is_generic_npc = False
-            except IndexError: # load generic NPC
+        # load character from skyrim_characters.csv
+        character_info = character_index.get_character_by_name(character_name)
+        is_generic_npc = False
+        if character_info is None: # try names which only differ in spelling, accents or punctuation
+            character_info = character_index.get_character_by_similar_name(character_name)
+            if character_info is not None:
+                logging.info(f"Could not find {character_name} in skyrim_characters.csv. Using the closest match '{character_info['name']}'")
+        if character_info is None: # character not found
+            # try searching by ID
+            logging.info(f"Could not find {character_name} in skyrim_characters.csv. Searching by ID {character_id}...")
+            character_info = character_index.get_character_by_base_id(character_id)
+            if character_info is None: # load generic NPC
                 logging.info(f"NPC '{character_name}' could not be found in 'skyrim_characters.csv'. If this is not a generic NPC, please ensure '{character_name}' exists in the CSV's 'name' column exactly as written here, and that there is a voice model associated with them.")
-                character_info = self.load_unnamed_npc(character_name, character_df)
+                character_info = self.load_unnamed_npc(character_name, character_index)
                 is_generic_npc = True
 
         location = self.load_data_when_available('_mantella_current_location', location)
@@ -323,8 +230,10 @@ class GameStateManager:
         """Add in-game events to player's response"""
 
         # append in-game events to player's response
-        with open(f'{self.game_path}/_mantella_in_game_events.txt', 'r', encoding='utf-8') as f:
-            in_game_events_lines = f.readlines()[-5:] # read latest 5 events
+        # only the events written since the previous exchange are read, of which the latest 5 are passed on
+        in_game_events_lines = [event for event in self.transport.read_new_lines('_mantella_in_game_events') if event.strip() != ''][-5:]
+        # once the events are read, clear the file so that it doesn't grow for the whole session
+        self.write_game_info('_mantella_in_game_events', '')
 
         message.add_event(in_game_events_lines)
 
@@ -335,12 +244,8 @@ class GameStateManager:
         if message.count_ingame_events() > 0:            
             logging.info(f'In-game events since previous exchange:\n{message.get_ingame_events_text()}')
 
-        # once the events are shared with the NPC, clear the file
-        self.write_game_info('_mantella_in_game_events', '')
-
         # append the time to player's response
-        with open(f'{self.game_path}/_mantella_in_game_time.txt', 'r') as f:
-            in_game_time = f.readline().strip()
+        in_game_time = self.read_game_info('_mantella_in_game_time')
         
         # only pass the in-game time if it has changed
         if (in_game_time != self.prev_game_time) and (in_game_time != ''):
@@ -354,33 +259,11 @@ class GameStateManager:
     def end_conversation(self):
         logging.info('Conversation ended.')
 
-        self.write_game_info('_mantella_in_game_events', '')
-        self.write_game_info('_mantella_end_conversation', 'True')
+        self.write_game_info_batch({
+            '_mantella_in_game_events': '',
+            '_mantella_end_conversation': 'True',
+        })
+        logging.debug(f'Game transport stats: {self.transport.stats()}')
         time.sleep(5) # wait a few seconds for everything to register
 
         return None
-        
-_male_voice_models = {
-    'ArgonianRace': 'Male Argonian',
-    'BretonRace': 'Male Even Toned',
-    'DarkElfRace': 'Male Dark Elf Commoner',
-    'HighElfRace': 'Male Elf Haughty',
-    'ImperialRace': 'Male Even Toned',
-    'KhajiitRace': 'Male Khajit',
-    'NordRace': 'Male Nord',
-    'OrcRace': 'Male Orc',
-    'RedguardRace': 'Male Even Toned',
-    'WoodElfRace': 'Male Young Eager',
-}
-_female_voice_models = {
-    'ArgonianRace': 'Female Argonian',
-    'BretonRace': 'Female Even Toned',
-    'DarkElfRace': 'Female Dark Elf Commoner',
-    'HighElfRace': 'Female Elf Haughty',
-    'ImperialRace': 'Female Even Toned',
-    'KhajiitRace': 'Female Khajit',
-    'NordRace': 'Female Nord',
-    'OrcRace': 'Female Orc',
-    'RedguardRace': 'Female Sultry',
-    'WoodElfRace': 'Female Young Eager',
-}
@@ -5,15 +5,16 @@ import logging
 import time
 import shutil
 import re
-import sys
 import unicodedata
+from collections import deque
 import src.utils as utils
 from src.characters_manager import Characters
 from src.character_manager import Character
 from src.llm.messages import assistant_message, message
 from src.llm.message_thread import message_thread
 from src.llm.openai_client import openai_client
-from src.tts import Synthesizer
+from src.tts import Synthesizer, VoiceModelNotFound
+from src.speech.latency import latency_summary
 
 class ChatManager:
     def __init__(self, game_state_manager, config, tts: Synthesizer, client: openai_client):
@@ -33,7 +34,15 @@ class ChatManager:
         self.character_num = 0
         self.active_character = None
         self.player_name = config.player_name
-        self.number_words_tts = config.number_words_tts
+        self.tts_lookahead_sentences = config.tts_lookahead_sentences
+        # the most recently queued voiceline, which the next one waits for so that they are synthesized in order
+        self.__last_synthesis: asyncio.Future[str] | None = None
+        # when the current response was asked for, until its first voiceline is spoken
+        self.__response_start: float | None = None
+        # whether the response's first voiceline is a whole sentence or only the first clause of one
+        self.__first_voiceline_kind = 'first_sentence'
+        # how long the player waited for the NPC to start speaking, per kind of first voiceline
+        self.__first_audio_seconds: dict[str, deque[float]] = {'first_sentence': deque(maxlen=200), 'first_clause': deque(maxlen=200)}
 
         self.wav_file = f'MantellaDi_MantellaDialogu_00001D8B_1.wav'
         self.lip_file = f'MantellaDi_MantellaDialogu_00001D8B_1.lip'
@@ -43,9 +52,10 @@ class ChatManager:
 
         self.sentence_queue = asyncio.Queue()
 
-    def play_sentence_ingame(self, sentence: str, character_to_talk: Character):
+    def play_sentence_ingame(self, sentence: str, character_to_talk: Character, character_num: int):
+        """Synthesize and speak a sentence of `character_to_talk` (number `character_num` in the conversation) straight away, outside of a response"""
         audio_file = self.__tts.synthesize(character_to_talk.voice_model, sentence)
-        self.save_files_to_voice_folders([audio_file, sentence])
+        self.save_files_to_voice_folders([audio_file, sentence, character_to_talk, character_num])
 
     def num_tokens(self, content_to_measure: message | str | message_thread | list[message]) -> int:
         if isinstance(content_to_measure, message_thread) or isinstance(content_to_measure, list):
@@ -54,18 +64,39 @@ class ChatManager:
             return openai_client.num_tokens_from_message(content_to_measure, None)
         
     async def get_response(self, messages: message_thread, characters: Characters, radiant_dialogue: bool) -> message_thread:
-        sentence_queue: asyncio.Queue[tuple[str,str] | None] = asyncio.Queue()
-        event: asyncio.Event = asyncio.Event()
-        event.set()
-
-        results = await asyncio.gather(
-            self.process_response(sentence_queue, messages, characters, radiant_dialogue, event), 
-            self.send_response(sentence_queue, event)
-        )
-        messages, _ = results
+        # sentences waiting to be spoken, as (future audio file, sentence, character, character number)
+        # the queue's size is the look-ahead: how far synthesis can get ahead of playback
+        sentence_queue: asyncio.Queue[tuple[asyncio.Future[str],str,Character,int] | None] = asyncio.Queue(maxsize=max(1, self.tts_lookahead_sentences))
+        self.__response_start = time.perf_counter()
+        self.__first_voiceline_kind = 'first_sentence'
+
+        # the response's voicelines go first, stock lines are pre-synthesized once it has been spoken
+        self.__tts.stock_lines.pause()
+        producer = asyncio.ensure_future(self.process_response(sentence_queue, messages, characters, radiant_dialogue))
+        consumer = asyncio.ensure_future(self.send_response(sentence_queue))
+        try:
+            messages, _ = await asyncio.gather(producer, consumer)
+        except BaseException:
+            producer.cancel()
+            consumer.cancel()
+            raise
+        finally:
+            self.cancel_queued_sentences(sentence_queue)
+            self.__last_synthesis = None
+            self.__tts.stock_lines.resume()
+            await self.__tts.close_async()
 
         return messages
 
+    def first_audio_stats(self) -> dict[str, dict[str, float]]:
+        """How long the player waited for the NPC to start speaking, for responses which started with a whole sentence or its first clause"""
+        return {kind: latency_summary(seconds) for kind, seconds in self.__first_audio_seconds.items()}
+
+    def log_first_audio_stats(self):
+        for kind, summary in self.first_audio_stats().items():
+            if summary['count'] > 0:
+                logging.log(self.loglevel, f"Time to first audio when starting with the {kind.replace('_', ' ')}: {summary['mean_ms']:.0f} ms (p95 {summary['p95_ms']:.0f} ms, {summary['count']}x)")
+
     async def get_audio_duration(self, audio_file):
         """Check if the external software has finished playing the audio file"""
 
@@ -106,36 +137,37 @@ class ChatManager:
     def save_files_to_voice_folders(self, queue_output):
         """Save voicelines and subtitles to the correct game folders"""
 
-        audio_file, subtitle = queue_output
-        if self.add_voicelines_to_all_voice_folders == '1':
-            for sub_folder in os.scandir(self.mod_folder):
-                if not sub_folder.is_dir():
-                    continue
+        audio_file, subtitle, character, character_num = queue_output
+        with self.__tts.stage_timings.span(character.voice_model, 'file_copy'):
+            if self.add_voicelines_to_all_voice_folders == '1':
+                for sub_folder in os.scandir(self.mod_folder):
+                    if not sub_folder.is_dir():
+                        continue
 
-                shutil.copyfile(audio_file, f"{sub_folder.path}/{self.wav_file}")
+                    shutil.copyfile(audio_file, f"{sub_folder.path}/{self.wav_file}")
+
+                    # Copy FaceFX generated LIP file
+                    try:
+                        shutil.copyfile(audio_file.replace(".wav", ".lip"), f"{sub_folder.path}/{self.lip_file}")
+                    except Exception as e:
+                        # only warn on failure
+                        logging.warning(e)
+            else:
+                shutil.copyfile(audio_file, f"{self.mod_folder}/{character.in_game_voice_model}/{self.wav_file}")
 
                 # Copy FaceFX generated LIP file
                 try:
-                    shutil.copyfile(audio_file.replace(".wav", ".lip"), f"{sub_folder.path}/{self.lip_file}")
+                    shutil.copyfile(audio_file.replace(".wav", ".lip"), f"{self.mod_folder}/{character.in_game_voice_model}/{self.lip_file}")
                 except Exception as e:
                     # only warn on failure
                     logging.warning(e)
-        else:
-            shutil.copyfile(audio_file, f"{self.mod_folder}/{self.active_character.in_game_voice_model}/{self.wav_file}")
-
-            # Copy FaceFX generated LIP file
-            try:
-                shutil.copyfile(audio_file.replace(".wav", ".lip"), f"{self.mod_folder}/{self.active_character.in_game_voice_model}/{self.lip_file}")
-            except Exception as e:
-                # only warn on failure
-                logging.warning(e)
 
 
-        logging.info(f"{self.active_character.name} (character {self.character_num}) should speak")
-        if self.character_num == 0:
+        logging.info(f"{character.name} (character {character_num}) should speak")
+        if character_num == 0:
             self.game_state_manager.write_game_info('_mantella_say_line', subtitle.strip())
         else:
-            say_line_file = '_mantella_say_line_'+str(self.character_num+1)
+            say_line_file = '_mantella_say_line_'+str(character_num+1)
             self.game_state_manager.write_game_info(say_line_file, subtitle.strip())
 
     @utils.time_it
@@ -159,7 +191,34 @@ class ChatManager:
         # Remove the played audio file
         #os.remove(audio_file)
 
-    async def send_response(self, sentence_queue: asyncio.Queue[tuple[str,str]|None], event: asyncio.Event):
+    async def queue_sentence(self, sentence_queue: asyncio.Queue[tuple[asyncio.Future[str],str,Character,int]|None], sentence: str):
+        """Start synthesizing a sentence of the active character and queue it to be spoken once the sentences before it have been"""
+        character = self.active_character
+        audio_file = asyncio.ensure_future(self.__synthesize_after(self.__last_synthesis, character, sentence))
+        self.__last_synthesis = audio_file
+        # waits while `tts_lookahead_sentences` sentences are already waiting to be spoken
+        await sentence_queue.put((audio_file, sentence, character, self.character_num))
+
+    async def __synthesize_after(self, previous_synthesis: asyncio.Future[str] | None, character: Character, sentence: str) -> str:
+        if previous_synthesis is not None:
+            await asyncio.wait([previous_synthesis])
+        return await self.__tts.synthesize_async(character.voice_model, ' ' + sentence + ' ', character.is_in_combat)
+
+    def __preload_voice_after(self, previous_synthesis: asyncio.Future[str] | None, voice: str):
+        """Preload `voice` once the sentences queued before it are synthesized, so that it doesn't cut in between them"""
+        if previous_synthesis is None:
+            self.__tts.voice_scheduler.preload(voice)
+        else:
+            previous_synthesis.add_done_callback(lambda _: self.__tts.voice_scheduler.preload(voice))
+
+    def cancel_queued_sentences(self, sentence_queue: asyncio.Queue[tuple[asyncio.Future[str],str,Character,int]|None]):
+        """Drop sentences which haven't been spoken yet and cancel their synthesis"""
+        while not sentence_queue.empty():
+            queue_output = sentence_queue.get_nowait()
+            if queue_output is not None:
+                queue_output[0].cancel()
+
+    async def send_response(self, sentence_queue: asyncio.Queue[tuple[asyncio.Future[str],str,Character,int]|None]):
         """Send response from sentence queue generated by `process_response()`"""
 
         while True:
@@ -168,11 +227,28 @@ class ChatManager:
                 logging.info('End of sentences')
                 break
 
+            audio_file, sentence, character, character_num = queue_output
+            start_time = time.time()
+            try:
+                audio_file = await audio_file
+            except VoiceModelNotFound:
+                raise
+            except Exception as e:
+                logging.error(f"xVASynth Error: {e}")
+                continue
+            logging.debug(f"Waited {round(time.time() - start_time, 3)} seconds for the voiceline to be synthesized")
+            # FaceFX works on the LIP file while the next voiceline is synthesized
+            start_time = time.time()
+            await self.__tts.wait_for_lip_file_async(audio_file)
+            logging.debug(f"Waited {round(time.time() - start_time, 3)} seconds for the voiceline's LIP file")
+
             # send the audio file to the external software and wait for it to finish playing
-            await self.send_audio_to_external_software(queue_output)
-            event.set()
+            await self.send_audio_to_external_software([audio_file, sentence, character, character_num])
+            if self.__response_start is not None:
+                self.__first_audio_seconds[self.__first_voiceline_kind].append(time.perf_counter() - self.__response_start)
+                self.__response_start = None
 
-            audio_duration = await self.get_audio_duration(queue_output[0])
+            audio_duration = await self.get_audio_duration(audio_file)
             # wait for the audio playback to complete before getting the next file
             logging.info(f"Waiting {int(round(audio_duration,4))} seconds...")
             await asyncio.sleep(audio_duration)
@@ -227,7 +303,7 @@ class ChatManager:
         return sentence
 
 
-    async def process_response(self, sentence_queue: asyncio.Queue[tuple[str,str] |None], messages : message_thread, characters: Characters, radiant_dialogue: bool, event:asyncio.Event) -> message_thread:
+    async def process_response(self, sentence_queue: asyncio.Queue[tuple[asyncio.Future[str],str,Character,int]|None], messages : message_thread, characters: Characters, radiant_dialogue: bool) -> message_thread:
         """Stream response from LLM one sentence at a time"""
 
         sentence = ''
@@ -237,6 +313,7 @@ class ChatManager:
         cumulative_sentence_bool = False
         #Added from xTTS implementation
         accumulated_sentence = ''
+        self.__tts.chunking.start_response()
         
         while True:
             try:
@@ -247,10 +324,23 @@ class ChatManager:
                         # Check for the last occurrence of sentence-ending punctuation
                         punctuations = ['.', '!', ':', '?']
                         last_punctuation = max(sentence.rfind(p) for p in punctuations)
-                        if last_punctuation != -1:
-                            # Split the sentence at the last punctuation mark
-                            remaining_content = sentence[last_punctuation + 1:]
-                            current_sentence = sentence[:last_punctuation + 1]
+                        # a long first sentence can start being spoken from its first clause, rather than waiting for all of it
+                        # (it counts as one of max_response_sentences, so not if that would be the whole response)
+                        first_clause_end = None
+                        if (last_punctuation == -1) and self.active_character and ((self.max_response_sentences > 1) or radiant_dialogue):
+                            first_clause_end = self.__tts.chunking.first_clause_end(accumulated_sentence + sentence)
+                        if (last_punctuation != -1) or (first_clause_end is not None):
+                            if first_clause_end is not None:
+                                # Split the sentence (with any sentences too short to send on their own) after the clause
+                                sentence = accumulated_sentence + sentence
+                                accumulated_sentence = ''
+                                remaining_content = sentence[first_clause_end:]
+                                current_sentence = sentence[:first_clause_end]
+                                self.__first_voiceline_kind = 'first_clause'
+                            else:
+                                # Split the sentence at the last punctuation mark
+                                remaining_content = sentence[last_punctuation + 1:]
+                                current_sentence = sentence[:last_punctuation + 1]
                             
                             # New logic to handle conditions based on the presence of a colon and the state of `accumulated_sentence`
                             content_edit = unicodedata.normalize('NFKC', current_sentence)
@@ -270,7 +360,8 @@ class ChatManager:
                                     if matching_character_key:
                                         logging.info(f"Switched to {matching_character_key}")
                                         self.active_character = characters.get_character_by_name(matching_character_key)
-                                        self.__tts.change_voice(self.active_character.voice_model)
+                                        # load their voice model while the current sentence plays and their first sentence streams in
+                                        self.__preload_voice_after(self.__last_synthesis, self.active_character.voice_model)
 
                                         # Find the index of the matching character
                                         self.character_num = characters.get_all_names().index(matching_character_key)
@@ -296,8 +387,9 @@ class ChatManager:
                                 logging.info(f"'assist' keyword found. Ignoring sentence which begins with: {sentence}")
                                 break
                             
-                            # Accumulate sentences if less than X words
-                            if len(accumulated_sentence.split()) < self.number_words_tts and cumulative_sentence_bool == False:
+                            # Accumulate sentences until there are enough words for the next voiceline (fewer for the first one)
+                            chunk_words = self.__tts.chunking.chunk_words(sentence_queue.qsize())
+                            if len((accumulated_sentence + current_sentence).split()) < chunk_words and cumulative_sentence_bool == False and first_clause_end is None:
                                 accumulated_sentence += current_sentence
                                 sentence = remaining_content
                                 continue
@@ -314,14 +406,10 @@ class ChatManager:
                                 logging.log(self.loglevel, f"LLM returned sentence took {time.time() - start_time} seconds to execute")
 
                                 if self.active_character :
-                                    # Generate the audio and return the audio file path
-                                    try:
-                                        audio_file = self.__tts.synthesize(self.active_character.voice_model, ' ' + sentence + ' ', self.active_character.is_in_combat)
-                                    except Exception as e:
-                                        logging.error(f"xVASynth Error: {e}")
-
-                                    # Put the audio file path in the sentence_queue
-                                    await sentence_queue.put([audio_file, sentence])
+                                    # Synthesize the audio in the background and queue it to be spoken
+                                    logging.debug(f"Sending a voiceline of {len(sentence.split())} words to TTS (waited for {chunk_words} words, {sentence_queue.qsize()} voicelines queued)")
+                                    self.__tts.chunking.chunk_sent(len(sentence.split()))
+                                    await self.queue_sentence(sentence_queue, sentence)
 
                                     full_reply += sentence
                                     num_sentences += 1
@@ -332,28 +420,27 @@ class ChatManager:
                                         sentence = remaining_content
                                     remaining_content = ''
 
-                                    # clear the event for the next iteration
-                                    event.clear()
-                                    # wait for the event to be set before generating the next line
-                                    await event.wait()
-
                                     end_conversation = self.game_state_manager.load_data_when_available('_mantella_end_conversation', '')
                                     radiant_dialogue_update = self.game_state_manager.load_data_when_available('_mantella_radiant_dialogue', '')
                                     # stop processing LLM response if:
                                     # max_response_sentences reached (and the conversation isn't radiant)
                                     # conversation has switched from radiant to multi NPC (this allows the player to "interrupt" radiant dialogue and include themselves in the conversation)
                                     # the conversation has ended
-                                    if ((num_sentences >= self.max_response_sentences) and (radiant_dialogue == 'false')) or ((radiant_dialogue == 'true') and (radiant_dialogue_update.lower() == 'false')) or (end_conversation.lower() == 'true'):
+                                    if (radiant_dialogue and (radiant_dialogue_update.lower() == 'false')) or (end_conversation.lower() == 'true'):
+                                        # don't speak the sentences synthesized ahead
+                                        self.cancel_queued_sentences(sentence_queue)
+                                        break
+                                    if (num_sentences >= self.max_response_sentences) and not radiant_dialogue:
                                         break
                 break
             except Exception as e:
                 logging.error(f"LLM API Error: {e}")
                 error_response = "I can't find the right words at the moment."
-                self.play_sentence_ingame(error_response, self.active_character)
-                # audio_file = self.__tts.synthesize(self.active_character.voice_model, None, error_response)
-                # self.save_files_to_voice_folders([audio_file, error_response])
+                if self.active_character:
+                    # spoken after the sentences which are already queued
+                    await self.queue_sentence(sentence_queue, error_response)
                 logging.log(self.loglevel, 'Retrying connection to API...')
-                time.sleep(5)
+                await asyncio.sleep(5)
 
         #Added from xTTS implementation
         # Check if there is any accumulated sentence at the end
@@ -361,16 +448,9 @@ class ChatManager:
             # Generate the audio and return the audio file path
             try:
                 #Added from xTTS implementation
-                audio_file = self.__tts.synthesize(self.active_character.voice_model, ' ' + accumulated_sentence + ' ', self.active_character.is_in_combat)
-                await sentence_queue.put([audio_file, accumulated_sentence])
+                await self.queue_sentence(sentence_queue, accumulated_sentence)
                 full_reply += accumulated_sentence
                 accumulated_sentence = ''
-                # clear the event for the next iteration
-                event.clear()
-                # wait for the event to be set before generating the next line
-                await event.wait()
-                end_conversation = self.game_state_manager.load_data_when_available('_mantella_end_conversation', '')
-                radiant_dialogue_update = self.game_state_manager.load_data_when_available('_mantella_radiant_dialogue', '')
             except Exception as e:
                 accumulated_sentence = ''
                 logging.error(f"xVASynth Error: {e}")
@@ -7,9 +7,12 @@ import sys
 import os
 
 import src.config_loader as config_loader
+from src.character_index import CharacterIndex
+from src.character_db import CharacterDatabase
+from src.voice_model_table import VoiceModelTable
 from src.llm.openai_client import openai_client
 
-def initialise(config_file, logging_file, secret_key_file, character_df_file, language_file) -> tuple[config_loader.ConfigLoader, pd.DataFrame, dict[Hashable, str], openai_client]:
+def initialise(config_file, logging_file, secret_key_file, character_df_file, language_file, generic_npc_voices_file) -> tuple[config_loader.ConfigLoader, CharacterIndex, dict[Hashable, str], openai_client]:
     
     def set_cwd_to_exe_dir():
         if getattr(sys, 'frozen', False): # if exe and not Python script
@@ -63,12 +66,12 @@ def initialise(config_file, logging_file, secret_key_file, character_df_file, la
         logging.log(28, "Large Language Model related")
         logging.log(29, "Text-To-Speech related")
 
-    def get_character_df(file_name) -> pd.DataFrame:
-        encoding = utils.get_file_encoding(file_name)
-        character_df = pd.read_csv(file_name, engine='python', encoding=encoding)
-        character_df = character_df.loc[character_df['voice_model'].notna()]
+    def get_character_index(file_name, voices_file_name) -> CharacterIndex:
+        character_db = CharacterDatabase(file_name)
+        character_df, bios = character_db.load()
+        logging.info(character_db.report())
 
-        return character_df
+        return CharacterIndex(character_df, bios, config.npc_name_match_cutoff, VoiceModelTable.load(voices_file_name))
     
     def get_language_info(file_name) -> dict[Hashable, str]:
         language_df = pd.read_csv(file_name)
@@ -86,11 +89,11 @@ def initialise(config_file, logging_file, secret_key_file, character_df_file, la
     # clean up old instances of exe runtime files
     utils.cleanup_mei(config.remove_mei_folders)
     
-    character_df = get_character_df(character_df_file)
+    character_index = get_character_index(character_df_file, generic_npc_voices_file)
     language_info = get_language_info(language_file)
 
     
     
     client = openai_client(config, secret_key_file)
 
-    return config, character_df, language_info, client
+    return config, character_index, language_info, client
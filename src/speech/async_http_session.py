@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from src.speech.http_session import DEFAULT_TIMEOUTS, RETRY_STATUS_CODES, ServerState, RequestStats
+
+
+class TTSResponse:
+    """The parts of a TTS server response Mantella looks at, read before the connection goes back to the pool"""
+    def __init__(self, status_code: int, text: str) -> None:
+        self.status_code = status_code
+        self.text = text
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncTTSHttpSession:
+    """The asyncio counterpart of TTSHttpSession, so that TTS requests don't block the event loop
+
+    Timeouts, retries, `post_if_changed` and stats work the same way. Pass the blocking session's `server_state`
+    so that both know what the server has already been sent. Cancelling a request (eg when the conversation
+    ends) closes its connection instead of waiting for the server's answer.
+
+    aiohttp sessions belong to the event loop they were created on, so a new one is opened when called from
+    another loop. Call `close` before the loop finishes.
+    """
+    def __init__(self, timeouts: dict[str, tuple[float, float]] | None = None, max_retries: int = 2, retry_backoff: float = 0.25, pool_size: int = 4, server_state: ServerState | None = None) -> None:
+        self.__timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.__max_retries = max_retries
+        self.__retry_backoff = retry_backoff
+        self.__pool_size = pool_size
+        self.__session: aiohttp.ClientSession | None = None
+        self.__session_loop: asyncio.AbstractEventLoop | None = None
+
+        self.server_state = server_state or ServerState()
+        self.__stats = RequestStats()
+
+    async def get(self, endpoint: str, url: str, retry: bool = True, **kwargs) -> TTSResponse:
+        return await self.request('GET', endpoint, url, retry, **kwargs)
+
+    async def post(self, endpoint: str, url: str, retry: bool = True, **kwargs) -> TTSResponse:
+        return await self.request('POST', endpoint, url, retry, **kwargs)
+
+    async def post_all(self, endpoint_requests: list[tuple[str, str, dict]], max_concurrent: int = 1) -> list[TTSResponse]:
+        """POST several (endpoint, url, json_data) requests, up to `max_concurrent` at a time, and return their responses in order"""
+        semaphore = asyncio.Semaphore(max(1, max_concurrent))
+        async def post(endpoint: str, url: str, json_data: dict) -> TTSResponse:
+            async with semaphore:
+                return await self.post(endpoint, url, json=json_data)
+        return list(await asyncio.gather(*[post(endpoint, url, json_data) for endpoint, url, json_data in endpoint_requests]))
+
+    async def post_if_changed(self, endpoint: str, url: str, json_data: dict) -> TTSResponse | None:
+        """POST `json_data` unless the same data was the last thing successfully sent to `url`
+
+        Returns None if the request was skipped
+        """
+        payload = json.dumps(json_data, sort_keys=True)
+        if self.server_state.is_unchanged(endpoint, url, payload):
+            self.__stats.count(endpoint, 'skipped')
+            return None
+
+        response = await self.post(endpoint, url, json=json_data)
+        if response.ok:
+            self.server_state.remember(endpoint, url, payload)
+        return response
+
+    def forget_server_state(self, endpoint: str | None = None):
+        """Send the next settings request(s) again, eg because the server has been restarted"""
+        self.server_state.forget(endpoint)
+
+    async def request(self, method: str, endpoint: str, url: str, retry: bool = True, **kwargs) -> TTSResponse:
+        connect_timeout, read_timeout = self.__timeouts.get(endpoint, (2, 60))
+        kwargs.setdefault('timeout', aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout))
+        session = self.__get_session()
+        retries = self.__max_retries if retry else 0
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    tts_response = TTSResponse(response.status, await response.text())
+            except asyncio.TimeoutError:
+                # the server was busy with the request, asking again would only queue the same work
+                self.__stats.count(endpoint, 'errors')
+                raise
+            except aiohttp.ClientConnectorError as e:
+                # only retry if the request never reached the server
+                # if the connection dropped after it was sent (ServerDisconnectedError), the server may already be working on it
+                self.__stats.count(endpoint, 'errors')
+                if attempt >= retries:
+                    raise
+                logging.debug(f'{method} {url} failed ({e}), retrying...')
+            except aiohttp.ClientError:
+                self.__stats.count(endpoint, 'errors')
+                raise
+            else:
+                self.__stats.record(endpoint, time.perf_counter() - start)
+                if (attempt >= retries) or (tts_response.status_code not in RETRY_STATUS_CODES):
+                    return tts_response
+                logging.debug(f'{method} {url} returned {tts_response.status_code}, retrying...')
+            self.__stats.count(endpoint, 'retries')
+            await asyncio.sleep(self.__retry_backoff * (2 ** attempt))
+            attempt += 1
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Request counts and round trip times (in milliseconds) per endpoint"""
+        return self.__stats.summary()
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+        self.__session = None
+        self.__session_loop = None
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if (self.__session is None) or (self.__session_loop is not loop) or self.__session.closed:
+            self.__session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.__pool_size))
+            self.__session_loop = loop
+        return self.__session
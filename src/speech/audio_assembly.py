@@ -0,0 +1,84 @@
+import logging
+import shutil
+import numpy as np
+import soundfile as sf
+
+FLOAT_SUBTYPES = ['FLOAT', 'DOUBLE']
+# float samples are scaled in blocks of this many frames, so only one block is ever held as floats
+FLOAT_BLOCK_FRAMES = 65536
+
+
+def _read_pcm16_into(audio_file: sf.SoundFile, out: np.ndarray):
+    """Decode `audio_file` into the int16 array `out`, which has exactly its number of frames"""
+    if audio_file.subtype not in FLOAT_SUBTYPES:
+        # libsndfile scales integer PCM (8, 24, 32 bit) to 16 bit itself
+        audio_file.read(dtype='int16', out=out)
+        return
+
+    # but reads float samples as int16 without scaling them, so scale them here
+    position = 0
+    for block in audio_file.blocks(blocksize=FLOAT_BLOCK_FRAMES, dtype='float32'):
+        np.clip(block, -1.0, 1.0, out=block)
+        np.multiply(block, 32767, out=block)
+        out[position:position + len(block)] = block # casts (truncating) to int16
+        position += len(block)
+
+
+def _empty_buffer(frames: int, channels: int) -> np.ndarray:
+    return np.empty((frames,) if channels == 1 else (frames, channels), dtype=np.int16)
+
+
+def merge_audio_files(audio_files: list[str], output_file: str):
+    """Join audio files into one 16 bit .wav file
+
+    The frame counts are read from the files' headers first, so every file is decoded straight into its slice
+    of one preallocated int16 buffer: merging takes about as much memory as the output file.
+    Files which are missing, or don't match the first file's sample rate and channels, are left out.
+    """
+    audio_infos = []
+    for audio_file in audio_files:
+        try:
+            audio_infos.append((audio_file, sf.info(audio_file)))
+        except (RuntimeError, OSError): # soundfile raises a RuntimeError (LibsndfileError) for missing files
+            logging.error(f'Could not find voiceline file: {audio_file}')
+    if len(audio_infos) == 0:
+        logging.error(f'No voiceline files to merge into {output_file}')
+        return
+
+    samplerate = audio_infos[0][1].samplerate
+    channels = audio_infos[0][1].channels
+    for audio_file, info in audio_infos[1:]:
+        if (info.samplerate != samplerate) or (info.channels != channels):
+            logging.error(f'Could not merge voiceline file {audio_file}: {info.samplerate} Hz / {info.channels} channel(s) instead of {samplerate} Hz / {channels} channel(s)')
+    audio_infos = [(audio_file, info) for audio_file, info in audio_infos if (info.samplerate == samplerate) and (info.channels == channels)]
+
+    merged_audio = _empty_buffer(sum(info.frames for _, info in audio_infos), channels)
+    position = 0
+    for audio_file, info in audio_infos:
+        with sf.SoundFile(audio_file) as f:
+            _read_pcm16_into(f, merged_audio[position:position + info.frames])
+        position += info.frames
+
+    sf.write(output_file, merged_audio, samplerate, subtype='PCM_16')
+
+
+def audio_seconds(audio_file: str) -> float:
+    """How long an audio file plays for, from its header"""
+    return sf.info(audio_file).duration
+
+
+def convert_to_16bit(input_file: str, output_file: str | None = None):
+    """Convert an audio file to a 16 bit .wav file, unless it already is one"""
+    if output_file is None:
+        output_file = input_file
+
+    info = sf.info(input_file)
+    if (info.format == 'WAV') and (info.subtype == 'PCM_16'):
+        if output_file != input_file:
+            shutil.copyfile(input_file, output_file)
+        return
+
+    with sf.SoundFile(input_file) as f:
+        data = _empty_buffer(f.frames, f.channels)
+        _read_pcm16_into(f, data)
+    sf.write(output_file, data, info.samplerate, subtype='PCM_16')
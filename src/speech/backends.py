@@ -0,0 +1,352 @@
+import json
+import logging
+import os
+import sys
+from abc import ABC, abstractmethod
+from subprocess import Popen, DEVNULL
+import requests
+import src.speech.audio_assembly as audio_assembly
+from src.speech.http_session import TTSHttpSession
+from src.speech.voice_catalogue import VoiceCatalogue, voice_id
+
+# how long loading another voice model takes compared to synthesizing a line
+MODEL_SWITCH_COST_LOW = 'low' # about as long as a short line, or less
+MODEL_SWITCH_COST_HIGH = 'high' # seconds, worth loading ahead of time
+
+
+class TTSServiceFailure(Exception):
+    pass
+
+
+class VoiceModelNotFound(Exception):
+    pass
+
+
+class TTSBackend(ABC):
+    """A TTS service Synthesizer can speak through (xVASynth, xTTS, ...)
+
+    A backend knows how to reach and start its service and turns voice model changes and voicelines into the
+    (endpoint, url, data) requests Synthesizer sends, through the blocking or the asyncio session.
+    The capability flags tell Synthesizer (and benchmarks) what the service can do.
+    """
+    name = ''
+    # synthesizes several phrases in one request
+    supports_batch = False
+    # can speak a line in an emotion (angrily, when the NPC is in combat)
+    supports_emotion = False
+    # can return audio before the whole line is synthesized
+    supports_streaming = False
+    model_switch_cost = MODEL_SWITCH_COST_HIGH
+    # how many voice models the service keeps loaded at once, ie how many VoiceScheduler keeps in its LRU
+    max_loaded_voices = 1
+    # whether long voicelines are split into phrases, each synthesized to its own file and merged afterwards
+    splits_voicelines = True
+
+    def __init__(self, http: TTSHttpSession) -> None:
+        self.http = http
+
+    @abstractmethod
+    def start(self):
+        """Connect to the TTS service, starting it if it isn't running. Raises TTSServiceFailure if it can't be reached"""
+        pass
+
+    @abstractmethod
+    def voice_model_request(self, voice: str) -> tuple[str, str, dict]:
+        """The (endpoint, url, data) request which loads `voice`. Raises VoiceModelNotFound if there is no such voice model
+
+        Building the request must not change the backend, as it may never be sent or may fail; see `voice_model_loaded`
+        """
+        pass
+
+    def voice_model_loaded(self, voice: str):
+        """Called once the request from `voice_model_request` has succeeded, to update what the backend knows about the loaded voice model"""
+        pass
+
+    @abstractmethod
+    def synthesis_requests(self, voice: str, phrases: list[str], voiceline_files: list[str], aggro) -> list[tuple[str, str, dict]]:
+        """The (endpoint, url, data) requests which synthesize `phrases` into `voiceline_files` with the loaded voice model
+
+        They write to separate files, so they can be sent at the same time
+        """
+        pass
+
+    def output_folder_request(self, folder: str) -> tuple[str, str, dict] | None:
+        """The (endpoint, url, data) request which tells the service where voicelines go, if it needs to be told"""
+        return None
+
+    def finish_audio(self, voiceline_files: list[str], final_voiceline_file: str) -> str | None:
+        """Turn what the service wrote to `voiceline_files` into the 16 bit .wav file `final_voiceline_file`
+
+        Returns the name of the stage this took ('merge', 'convert_16bit'), or None if there was nothing to do
+        """
+        if voiceline_files != [final_voiceline_file]:
+            audio_assembly.merge_audio_files(voiceline_files, final_voiceline_file)
+            return 'merge'
+        return None
+
+    def is_voice_model_available(self, voice: str) -> bool:
+        return True
+
+    def cache_settings(self) -> dict:
+        """The backend's part of the settings which change how a voiceline sounds"""
+        return {'backend': self.name}
+
+
+class XVASynthBackend(TTSBackend):
+    name = 'xvasynth'
+    supports_emotion = True
+    model_switch_cost = MODEL_SWITCH_COST_HIGH
+
+    def __init__(self, http: TTSHttpSession, xvasynth_path: str, url: str, process_device: str, tts_print: int, language: str, pace: float, use_sr: bool, use_cleanup: bool) -> None:
+        super().__init__(http)
+        self.loglevel = 29
+        self.xvasynth_path = xvasynth_path
+        self.process_device = process_device
+        self.tts_print = tts_print
+        self.language = language
+        self.pace = pace
+        self.use_sr = use_sr
+        self.use_cleanup = use_cleanup
+        self.times_checked_xvasynth = 0
+
+        url = url.rstrip('/')
+        self.ping_url = url + '/'
+        self.synthesize_url = url + '/synthesize'
+        self.synthesize_batch_url = url + '/synthesize_batch'
+        self.loadmodel_url = url + '/loadModel'
+        self.setvocoder_url = url + '/setVocoder'
+
+        # voice models path
+        self.model_path = f"{self.xvasynth_path}/resources/app/models/skyrim/"
+        # the installed voice models, indexed in the background so that switching voices needs no file I/O
+        self.voice_catalogue = VoiceCatalogue(self.model_path)
+
+        # of the loaded voice model
+        self.model_type = ''
+        self.base_speaker_emb = ''
+
+    @property
+    def supports_batch(self) -> bool:
+        # xVASynth can't batch synthesize with v3 (xVAPitch) models
+        return self.model_type != 'xVAPitch'
+
+    def start(self):
+        self.check_if_xvasynth_is_running()
+        self.voice_catalogue.load_in_background()
+
+    def check_if_xvasynth_is_running(self):
+        self.times_checked_xvasynth += 1
+
+        try:
+            if (self.times_checked_xvasynth > 10):
+                # break loop
+                logging.error('Could not connect to xVASynth multiple times. Ensure that xVASynth is running and restart Mantella.')
+                raise TTSServiceFailure()
+
+            # contact local xVASynth server; ~2 second timeout
+            logging.log(self.loglevel, f'Attempting to connect to xVASynth... ({self.times_checked_xvasynth})')
+            response = self.http.get('ping', self.ping_url, retry=False)
+            response.raise_for_status()  # If the response contains an HTTP error status code, raise an exception
+        except requests.exceptions.RequestException as err:
+            if ('Connection aborted' in err.__str__()):
+                # So it is alive
+                return
+
+            if (self.times_checked_xvasynth == 1):
+                logging.log(self.loglevel, 'Could not connect to xVASynth. Attempting to run headless server...')
+                self.run_xvasynth_server()
+                # a new server has nothing loaded yet
+                self.http.forget_server_state()
+
+            # do the web request again; LOOP!!!
+            return self.check_if_xvasynth_is_running()
+
+    def run_xvasynth_server(self):
+        try:
+            # start the process without waiting for a response
+            if (self.tts_print == 1):
+                # print subprocess output
+                Popen(f'{self.xvasynth_path}/resources/app/cpython_{self.process_device}/server.exe', cwd=self.xvasynth_path, stdout=None, stderr=None)
+            else:
+                # ignore output
+                Popen(f'{self.xvasynth_path}/resources/app/cpython_{self.process_device}/server.exe', cwd=self.xvasynth_path, stdout=DEVNULL, stderr=DEVNULL)
+        except:
+            logging.error(f'Could not run xVASynth. Ensure that the path "{self.xvasynth_path}" is correct.')
+            raise TTSServiceFailure()
+
+    def voice_model_request(self, voice: str) -> tuple[str, str, dict]:
+        voice_model = self.voice_catalogue.get(voice)
+        if voice_model is None:
+            self._log_voice_model_not_found(voice)
+            raise VoiceModelNotFound()
+
+        model_change = {
+            'outputs': None,
+            'version': '3.0',
+            'model': voice_model.model_path,
+            'modelType': voice_model.model_type,
+            'base_lang': self.language,
+            'pluginsContext': '{}',
+        }
+        return 'load_model', self.loadmodel_url, model_change
+
+    def voice_model_loaded(self, voice: str):
+        voice_model = self.voice_catalogue.get(voice)
+        self.base_speaker_emb = voice_model.base_speaker_emb
+        self.model_type = voice_model.model_type
+
+    def synthesis_requests(self, voice: str, phrases: list[str], voiceline_files: list[str], aggro) -> list[tuple[str, str, dict]]:
+        if len(phrases) == 1:
+            return [self._synthesize_line_request(phrases[0], voiceline_files[0], aggro)]
+        if self.supports_batch:
+            return [self._batch_synthesize_request(phrases, voiceline_files)]
+        # so the phrases of v3 models are requested one by one (but concurrently)
+        return [self._synthesize_line_request(phrase, voiceline_file) for phrase, voiceline_file in zip(phrases, voiceline_files)]
+
+    def _synthesize_line_request(self, line, save_path, aggro=0):
+        pluginsContext = {}
+        # in combat
+        if (aggro == 1):
+            pluginsContext["mantella_settings"] = {
+                "emAngry": 0.6
+            }
+        data = {
+            'pluginsContext': json.dumps(pluginsContext),
+            'modelType': self.model_type,
+            'sequence': line,
+            'pace': self.pace,
+            'outfile': save_path,
+            'vocoder': 'n/a',
+            'base_lang': self.language,
+            'base_emb': self.base_speaker_emb,
+            'useSR': self.use_sr,
+            'useCleanup': self.use_cleanup,
+        }
+        return 'synthesize', self.synthesize_url, data
+
+    def _batch_synthesize_request(self, grouped_sentences, voiceline_files):
+        # line = [text, unknown 1, unknown 2, pace, output_path, unknown 5, unknown 6, pitch_amp]
+        linesBatch = [[grouped_sentences[i], '', '', 1, voiceline_files[i], '', '', 1] for i in range(len(grouped_sentences))]
+
+        data = {
+            'pluginsContext': '{}',
+            'modelType': self.model_type,
+            'linesBatch': linesBatch,
+            'speaker_i': None,
+            'vocoder': [],
+            'outputJSON': None,
+            'useSR': None,
+            'useCleanup': None,
+        }
+        return 'synthesize_batch', self.synthesize_batch_url, data
+
+    def is_voice_model_available(self, voice: str) -> bool:
+        if not self.voice_catalogue.is_available(voice):
+            self._log_voice_model_not_found(voice)
+            return False
+        return True
+
+    def _log_voice_model_not_found(self, voice):
+        voice_path = f"{self.model_path}sk_{voice_id(voice)}"
+        logging.error(f"Voice model does not exist in location '{voice_path}'. Please ensure that the correct path has been set in config.ini (xvasynth_folder) and that the model has been downloaded from https://www.nexusmods.com/skyrimspecialedition/mods/44184?tab=files (Ctrl+F for 'sk_{voice_id(voice)}').")
+
+    def cache_settings(self) -> dict:
+        return {'backend': self.name, 'xtts_settings': ''}
+
+
+class XTTSBackend(TTSBackend):
+    name = 'xtts'
+    # xtts-api-server can stream audio, which Mantella doesn't use (yet)
+    supports_streaming = True
+    # most voices are a speaker .wav for the official model, so the model rarely changes
+    model_switch_cost = MODEL_SWITCH_COST_LOW
+    # xTTS takes the whole voiceline at once
+    splits_voicelines = False
+
+    def __init__(self, http: TTSHttpSession, synthesize_url: str, switch_model_url: str, set_tts_settings_url: str, get_models_list_url: str, set_output_url: str, tts_data: str, language: str) -> None:
+        super().__init__(http)
+        self.loglevel = 29
+        self.synthesize_url = synthesize_url
+        self.switch_model_url = switch_model_url
+        self.set_tts_settings_url = set_tts_settings_url
+        self.get_models_list_url = get_models_list_url
+        self.set_output_url = set_output_url
+        self.tts_data = tts_data
+        self.language = language
+        self.official_model_list = ["main","v2.0.3","v2.0.2","v2.0.1","v2.0.0"]
+        self.available_models = []
+
+    def start(self):
+        self._set_tts_settings_and_test_if_serv_running()
+        self.available_models = self._get_available_models()
+
+    def _set_tts_settings_and_test_if_serv_running(self):
+        try:
+            # Sending a POST request to the API endpoint
+            logging.log(self.loglevel, f'Attempting to connect to xTTS...')
+            tts_data_dict = json.loads(self.tts_data.replace('\n', ''))
+            response = self.http.post('set_tts_settings', self.set_tts_settings_url, json=tts_data_dict)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            # Log the error
+            logging.error(f'Could not reach the API at "{self.set_tts_settings_url}". Error: {e}')
+            # Wait for user input before exiting
+            logging.error(f'You should run xTTS api server before running Mantella.')
+            input('\nPress any key to stop Mantella...')
+            sys.exit(0)
+
+    def _get_available_models(self):
+        # Code to request and return the list of available models
+        response = self.http.get('models_list', self.get_models_list_url)
+        return response.json() if response.status_code == 200 else []
+
+    def get_first_available_official_model(self):
+        # Check in the available models list if there is an official model
+        for model in self.official_model_list:
+            if model in self.available_models:
+                return model
+        return None
+
+    def voice_model_request(self, voice: str) -> tuple[str, str, dict]:
+        # Format the voice string to match the model naming convention
+        model_voice = voice_id(voice)
+        # Check if the specified voice is available
+        if model_voice not in self.available_models:
+            logging.log(self.loglevel, f'Voice "{voice}" not in available models. Available models: {self.available_models}')
+            # Use the first available official model as a fallback
+            model_voice = self.get_first_available_official_model()
+            if model_voice is None:
+                # Handle the case where no official model is available
+                raise ValueError("No available voice model found.")
+            model_voice = voice_id(model_voice)
+
+        # Request to switch the voice model
+        return 'switch_model', self.switch_model_url, {"model_name": model_voice}
+
+    def synthesis_requests(self, voice: str, phrases: list[str], voiceline_files: list[str], aggro) -> list[tuple[str, str, dict]]:
+        data = {
+            'text': phrases[0],
+            'speaker_wav': voice_id(voice),
+            'language': self.language,
+            'save_path': voiceline_files[0]
+        }
+        return [('synthesize', self.synthesize_url, data)]
+
+    def output_folder_request(self, folder: str) -> tuple[str, str, dict] | None:
+        return 'set_output', self.set_output_url, {'output_folder': folder}
+
+    def finish_audio(self, voiceline_files: list[str], final_voiceline_file: str) -> str | None:
+        if os.path.exists(final_voiceline_file):
+            audio_assembly.convert_to_16bit(final_voiceline_file)
+            return 'convert_16bit'
+        return None
+
+    def cache_settings(self) -> dict:
+        return {'backend': self.name, 'xtts_settings': self.tts_data}
+
+
+def create_tts_backend(config, http: TTSHttpSession) -> TTSBackend:
+    """Create the TTS backend selected in config.ini"""
+    if int(config.use_external_xtts) == 1:
+        return XTTSBackend(http, config.xtts_synthesize_url, config.xtts_switch_model, config.xtts_set_tts_settings, config.xtts_get_models_list, config.xtts_set_output, config.xTTS_tts_data, config.language)
+    return XVASynthBackend(http, config.xvasynth_path, config.xvasynth_url, config.xvasynth_process_device, config.tts_print, config.language, config.pace, bool(config.use_sr), bool(config.use_cleanup))
@@ -0,0 +1,84 @@
+import logging
+import math
+import re
+from src.speech.latency import StageTimings
+
+CHUNKING_ADAPTIVE = 'adaptive'
+CHUNKING_FIXED = 'fixed'
+# xVASynth gets long voicelines in phrases of at most this many characters
+MAX_PHRASE_CHARS = 150
+# shorter phrases than this sound choppy once merged
+MIN_PHRASE_CHARS = 60
+# where a sentence can be cut short: after a comma, semicolon or dash, or before a conjunction
+CLAUSE_BOUNDARY = re.compile(r'[,;](?=\s)|[–—]|\s-+(?=\s)|\s(?=(?:and|but|or|so|because|though|while)\s)', re.IGNORECASE)
+
+
+class ChunkingPolicy:
+    """Decides how much of the LLM's response goes into each voiceline, from how fast the TTS service has been
+
+    The first voiceline of a response is sent once `min_words` words have streamed in, so the NPC starts speaking
+    as soon as possible. After that, each voiceline may wait for twice as many words as the last one (up to
+    `max_words`) while synthesis keeps ahead of playback: voicelines are queued and the real-time factor is below 1.
+    Longer voicelines sound more natural and need fewer requests. Once the queue runs dry, voicelines go back to
+    `min_words`, so playback doesn't wait on a long one.
+
+    When synthesis falls behind playback, long voicelines are split into shorter phrases for models whose
+    phrases are synthesized concurrently, so that the line is spread over them.
+
+    With the 'fixed' policy every voiceline waits for `fixed_words` words and phrases are always as long as possible.
+
+    With either policy, if `first_clause_words` is above 0, a long first sentence doesn't have to finish streaming in:
+    its first clause of at least `first_clause_words` words is sent as soon as the clause boundary comes in.
+    """
+    def __init__(self, policy: str, min_words: int, max_words: int, fixed_words: int, first_clause_words: int, stage_timings: StageTimings) -> None:
+        if policy not in [CHUNKING_ADAPTIVE, CHUNKING_FIXED]:
+            logging.warning(f"Unknown tts_chunking '{policy}'. Falling back to '{CHUNKING_FIXED}'.")
+            policy = CHUNKING_FIXED
+        self.policy = policy
+        self.min_words = max(0, min_words)
+        self.max_words = max(self.min_words, max_words)
+        self.fixed_words = fixed_words
+        self.first_clause_words = first_clause_words
+        self.__stage_timings = stage_timings
+        self.__chunks_sent = 0
+        self.__last_chunk_words = self.min_words
+
+    def start_response(self):
+        """Start over for a new LLM response, whose first voiceline should be short"""
+        self.__chunks_sent = 0
+        self.__last_chunk_words = self.min_words
+
+    def chunk_words(self, queued_voicelines: int) -> int:
+        """How many words to collect before sending the next voiceline, with `queued_voicelines` waiting to be spoken"""
+        if self.policy == CHUNKING_FIXED:
+            return self.fixed_words
+        if (self.__chunks_sent == 0) or (queued_voicelines == 0):
+            return self.min_words
+        real_time_factor = self.__stage_timings.recent_real_time_factor()
+        if (real_time_factor is not None) and (real_time_factor >= 1):
+            # synthesis is falling behind: longer voicelines would only keep the player waiting longer
+            return min(self.max_words, max(self.min_words, self.__last_chunk_words))
+        return min(self.max_words, max(self.min_words, 2 * self.__last_chunk_words, 1))
+
+    def first_clause_end(self, text: str) -> int | None:
+        """Where to cut off the first voiceline of a response from `text`, a sentence still streaming in, or None to wait for the rest of it"""
+        if (self.first_clause_words <= 0) or (self.__chunks_sent > 0):
+            return None
+        for boundary in CLAUSE_BOUNDARY.finditer(text):
+            if len(text[:boundary.end()].split()) >= self.first_clause_words:
+                return boundary.end()
+        return None
+
+    def chunk_sent(self, chunk_words: int):
+        """Note that a voiceline of `chunk_words` words was sent"""
+        self.__chunks_sent += 1
+        self.__last_chunk_words = chunk_words
+
+    def phrase_chars(self, voiceline_chars: int, concurrent_phrases: int) -> int:
+        """The longest phrase to split a voiceline of `voiceline_chars` characters into"""
+        if (self.policy == CHUNKING_FIXED) or (concurrent_phrases <= 1):
+            return MAX_PHRASE_CHARS
+        real_time_factor = self.__stage_timings.recent_real_time_factor()
+        if (real_time_factor is None) or (real_time_factor < 1):
+            return MAX_PHRASE_CHARS
+        return max(MIN_PHRASE_CHARS, min(MAX_PHRASE_CHARS, math.ceil(voiceline_chars / concurrent_phrases)))
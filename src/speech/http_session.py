@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from src.speech.latency import latency_summary
+
+# (connect, read) timeouts in seconds per kind of request
+# synthesis and model loading can legitimately take a while on a CPU, the rest should answer immediately
+DEFAULT_TIMEOUTS: dict[str, tuple[float, float]] = {
+    'ping': (2, 2),
+    'synthesize': (2, 120),
+    'synthesize_batch': (2, 300),
+    'load_model': (2, 120),
+    'switch_model': (2, 120),
+    'set_output': (2, 10),
+    'set_tts_settings': (2, 10),
+    'models_list': (2, 10),
+}
+RETRY_STATUS_CODES = [502, 503, 504]
+
+
+def is_connect_failure(error: requests.exceptions.ConnectionError) -> bool:
+    """Whether `error` happened while connecting, ie before the server could have seen the request"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+class ServerState:
+    """What was last successfully sent to the TTS server's settings endpoints (output folder, loaded model, ...)
+
+    Shared by the blocking and the asyncio session, as both talk to the same server
+    """
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__state: dict[tuple[str, str], str] = {}
+
+    def is_unchanged(self, endpoint: str, url: str, payload: str) -> bool:
+        """Whether `payload` was the last thing sent to `url`. If not, the server's state is unknown until `remember` is called"""
+        with self.__lock:
+            if self.__state.get((endpoint, url)) == payload:
+                return True
+            self.__state.pop((endpoint, url), None)
+            return False
+
+    def remember(self, endpoint: str, url: str, payload: str):
+        with self.__lock:
+            self.__state[(endpoint, url)] = payload
+
+    def forget(self, endpoint: str | None = None):
+        with self.__lock:
+            if endpoint is None:
+                self.__state.clear()
+            else:
+                for state_key in [state_key for state_key in self.__state if state_key[0] == endpoint]:
+                    del self.__state[state_key]
+
+
+class RequestStats:
+    """Request counts and the round trip times of the most recent requests, per endpoint"""
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__latencies: dict[str, deque[float]] = {}
+        self.__counts: dict[str, dict[str, int]] = {}
+
+    def record(self, endpoint: str, seconds: float):
+        with self.__lock:
+            self.__latencies.setdefault(endpoint, deque(maxlen=200)).append(seconds)
+        self.count(endpoint, 'requests')
+
+    def count(self, endpoint: str, name: str):
+        with self.__lock:
+            counts = self.__counts.setdefault(endpoint, {})
+            counts[name] = counts.get(name, 0) + 1
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Request counts and round trip times (in milliseconds) per endpoint"""
+        with self.__lock:
+            summary = {}
+            for endpoint in sorted(set(self.__latencies) | set(self.__counts)):
+                endpoint_summary: dict[str, float] = {'requests': 0, **self.__counts.get(endpoint, {})}
+                # of the most recent requests, which 'requests' already counts
+                latencies = latency_summary(self.__latencies.get(endpoint, deque()))
+                endpoint_summary.update({name: value for name, value in latencies.items() if name != 'count'})
+                summary[endpoint] = endpoint_summary
+            return summary
+
+
+class TTSHttpSession:
+    """A pooled keep-alive HTTP session for talking to the TTS server (xVASynth or xTTS)
+
+    Every request names the kind of endpoint it goes to, which picks its timeout and groups its latency stats.
+    Requests which fail before reaching the server (connection errors) or with a 502/503/504 are retried up to
+    `max_retries` times. A request which timed out while the server was working on it is not retried, as that
+    would only queue the same work again.
+
+    `post_if_changed` remembers what was last sent to settings endpoints (output folder, loaded model, ...),
+    so unchanged settings are not sent again. Call `forget_server_state` when the server may have restarted.
+    """
+    def __init__(self, timeouts: dict[str, tuple[float, float]] | None = None, max_retries: int = 2, retry_backoff: float = 0.25, pool_size: int = 4, server_state: ServerState | None = None) -> None:
+        self.__timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.__max_retries = max_retries
+        self.__retry_backoff = retry_backoff
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+
+        self.server_state = server_state or ServerState()
+        self.__stats = RequestStats()
+
+    def get(self, endpoint: str, url: str, retry: bool = True, **kwargs) -> requests.Response:
+        return self.request('GET', endpoint, url, retry, **kwargs)
+
+    def post(self, endpoint: str, url: str, retry: bool = True, **kwargs) -> requests.Response:
+        return self.request('POST', endpoint, url, retry, **kwargs)
+
+    def post_all(self, endpoint_requests: list[tuple[str, str, dict]], max_concurrent: int = 1) -> list[requests.Response]:
+        """POST several (endpoint, url, json_data) requests, up to `max_concurrent` at a time, and return their responses in order"""
+        if (max_concurrent <= 1) or (len(endpoint_requests) <= 1):
+            return [self.post(endpoint, url, json=json_data) for endpoint, url, json_data in endpoint_requests]
+        with ThreadPoolExecutor(max_workers=min(max_concurrent, len(endpoint_requests))) as executor:
+            return list(executor.map(lambda request: self.post(request[0], request[1], json=request[2]), endpoint_requests))
+
+    def post_if_changed(self, endpoint: str, url: str, json_data: dict) -> requests.Response | None:
+        """POST `json_data` unless the same data was the last thing successfully sent to `url`
+
+        Returns None if the request was skipped
+        """
+        payload = json.dumps(json_data, sort_keys=True)
+        if self.server_state.is_unchanged(endpoint, url, payload):
+            self.__stats.count(endpoint, 'skipped')
+            return None
+
+        response = self.post(endpoint, url, json=json_data)
+        if response.ok:
+            self.server_state.remember(endpoint, url, payload)
+        return response
+
+    def forget_server_state(self, endpoint: str | None = None):
+        """Send the next settings request(s) again, eg because the server has been restarted"""
+        self.server_state.forget(endpoint)
+
+    def request(self, method: str, endpoint: str, url: str, retry: bool = True, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.__timeouts.get(endpoint, (2, 60)))
+        retries = self.__max_retries if retry else 0
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.__session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # only retry if the request never reached the server
+                # if the connection dropped after it was sent, the server may already be synthesizing or loading a model
+                self.__stats.count(endpoint, 'errors')
+                if (attempt >= retries) or not is_connect_failure(e):
+                    raise
+                logging.debug(f'{method} {url} failed ({e}), retrying...')
+            except requests.exceptions.RequestException:
+                self.__stats.count(endpoint, 'errors')
+                raise
+            else:
+                self.__stats.record(endpoint, time.perf_counter() - start)
+                if (attempt >= retries) or (response.status_code not in RETRY_STATUS_CODES):
+                    return response
+                logging.debug(f'{method} {url} returned {response.status_code}, retrying...')
+            self.__stats.count(endpoint, 'retries')
+            time.sleep(self.__retry_backoff * (2 ** attempt))
+            attempt += 1
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Request counts and round trip times (in milliseconds) per endpoint"""
+        return self.__stats.summary()
+
+    def close(self):
+        self.__session.close()
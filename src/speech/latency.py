@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def latency_summary(seconds: deque[float]) -> dict[str, float]:
+    """The count, mean, 95th percentile and maximum (in milliseconds) of recent timings"""
+    latencies = sorted(seconds)
+    if len(latencies) == 0:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean_ms': round(1000 * sum(latencies) / len(latencies), 3),
+        'p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 3),
+        'max_ms': round(1000 * latencies[-1], 3),
+    }
+
+
+def ratio_summary(ratios: deque[float]) -> dict[str, float]:
+    """`latency_summary` for unitless values, eg real-time factors"""
+    values = sorted(ratios)
+    if len(values) == 0:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 3),
+        'p95': round(values[int(0.95 * (len(values) - 1))], 3),
+        'max': round(values[-1], 3),
+    }
+
+
+class StageTimings:
+    """Rolling timings of each stage of making a voiceline (model load, synthesis, merge, FaceFX, ...), per voice model
+
+    Also keeps each line's real-time factor: how long it took to synthesize divided by how long it plays for.
+    Below 1, synthesis keeps ahead of playback.
+    """
+    def __init__(self, max_samples: int = 200) -> None:
+        self.__max_samples = max_samples
+        self.__lock = threading.Lock()
+        self.__timings: dict[str, dict[str, deque[float]]] = {} # voice -> stage -> seconds
+        self.__real_time_factors: dict[str, deque[float]] = {} # voice -> real-time factors
+        self.__recent_real_time_factors: deque[float] = deque(maxlen=max_samples) # of every voice, oldest first
+
+    def record(self, voice: str, stage: str, seconds: float):
+        with self.__lock:
+            self.__timings.setdefault(voice, {}).setdefault(stage, deque(maxlen=self.__max_samples)).append(seconds)
+
+    @contextmanager
+    def span(self, voice: str, stage: str):
+        """Time the stage in the `with` block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(voice, stage, time.perf_counter() - start)
+
+    def record_line(self, voice: str, synthesis_seconds: float, audio_seconds: float) -> float | None:
+        """Note how long a line took to synthesize. Returns its real-time factor (None for a line without audio)"""
+        if audio_seconds <= 0:
+            return None
+        real_time_factor = synthesis_seconds / audio_seconds
+        with self.__lock:
+            self.__real_time_factors.setdefault(voice, deque(maxlen=self.__max_samples)).append(real_time_factor)
+            self.__recent_real_time_factors.append(real_time_factor)
+        return real_time_factor
+
+    def recent_real_time_factor(self, lines: int = 5) -> float | None:
+        """The mean real-time factor of the last `lines` lines of any voice, or None before the first line"""
+        with self.__lock:
+            recent = list(self.__recent_real_time_factors)[-lines:]
+        if len(recent) == 0:
+            return None
+        return sum(recent) / len(recent)
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """Per voice model, the count, mean, p95 and max of each stage (in milliseconds) and of the real-time factor"""
+        with self.__lock:
+            summary = {}
+            for voice in sorted(set(self.__timings) | set(self.__real_time_factors)):
+                voice_summary = {stage: latency_summary(seconds) for stage, seconds in sorted(self.__timings.get(voice, {}).items())}
+                if voice in self.__real_time_factors:
+                    voice_summary['real_time_factor'] = ratio_summary(self.__real_time_factors[voice])
+                summary[voice] = voice_summary
+            return summary
+
+    def format_summary(self) -> list[str]:
+        """One readable line per voice model, slowest stage first"""
+        lines = []
+        for voice, voice_summary in self.summary().items():
+            real_time_factor = voice_summary.pop('real_time_factor', None)
+            stages = sorted(voice_summary.items(), key=lambda stage: stage[1].get('mean_ms', 0), reverse=True)
+            stage_texts = [f"{stage} {timing['mean_ms']:.0f} ms (p95 {timing['p95_ms']:.0f} ms, {timing['count']}x)" for stage, timing in stages if timing['count'] > 0]
+            line = f"{voice}: {', '.join(stage_texts)}"
+            if real_time_factor is not None:
+                line += f"; real-time factor {real_time_factor['mean']:.2f} (p95 {real_time_factor['p95']:.2f})"
+            lines.append(line)
+        return lines
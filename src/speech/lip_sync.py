@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shlex
+import subprocess
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_for_futures
+from pathlib import Path
+from typing import Callable
+from src.speech.latency import latency_summary
+
+# FaceFXWrapper's arguments: game, language, phoneme data, the .wav file, the resampled .wav file it writes, the .lip file and the text
+FACEFX_WRAPPER_COMMAND = '"{facefx_folder}FaceFXWrapper.exe" "Skyrim" "USEnglish" "{facefx_folder}FonixData.cdf" "{wav_file}" "{resampled_wav_file}" "{lip_file}" "{text}"'
+# a FaceFX run which takes longer than this has hung, and the voiceline is spoken without lip sync
+FACEFX_TIMEOUT = 60
+
+
+def facefx_arguments(command_template: str, **values: str) -> list[str]:
+    """Split a FaceFX command into its arguments, then fill in their {placeholders}
+
+    Splitting before filling in means a quote in the voiceline's text can't break up the command,
+    and backslashes in Windows paths are left alone.
+    """
+    return [argument.strip('"').format(**values) for argument in shlex.split(command_template, posix=False)]
+
+
+def _startupinfo() -> 'subprocess.STARTUPINFO | None':
+    """Don't flash a console window for every FaceFX run on Windows"""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return startupinfo
+
+
+class LipSyncGenerator:
+    """Makes the .lip files Skyrim lip syncs voicelines with, by running FaceFX on a pool of worker threads
+
+    `submit` returns straight away, so the TTS server can get on with the next voiceline while FaceFX works on this
+    one. At most `max_workers` FaceFX processes run at once. Call `wait` (or `wait_async`) before a voiceline is
+    copied to the game, to make sure its .lip file is there.
+
+    .lip files are cached by a hash of the audio and the text, so audio FaceFX has already seen (eg a line which has
+    dropped out of the voiceline cache) has its .lip file copied instead. `command_template` replaces FaceFXWrapper,
+    eg with a stub on systems which can't run it.
+    """
+    def __init__(self, facefx_folder: str, command_template: str, cache_folder: str, max_workers: int = 2, max_cached: int = 1000) -> None:
+        self.__facefx_folder = facefx_folder
+        self.__uses_facefx_wrapper = command_template.strip() == ''
+        self.__command_template = FACEFX_WRAPPER_COMMAND if self.__uses_facefx_wrapper else command_template.strip()
+        self.__cache_folder = cache_folder
+        self.__max_cached = max_cached
+        self.__cached: OrderedDict[str, None] = OrderedDict() # least recently used first
+        self.__jobs: dict[str, Future[str | None]] = {} # .wav file -> the job making its .lip file
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='lip-sync')
+        self.__has_logged_missing_facefx = False
+
+        self.__counts = {'generated': 0, 'cache_hits': 0, 'failed': 0}
+        self.__facefx_seconds: deque[float] = deque(maxlen=200)
+        self.__wait_seconds: deque[float] = deque(maxlen=200)
+
+        if max_cached > 0:
+            os.makedirs(cache_folder, exist_ok=True)
+            self.__load_cache()
+
+    def submit(self, wav_file: str, text: str, then: Callable[[], None] | None = None, on_facefx: Callable[[float], None] | None = None) -> Future[str | None]:
+        """Start making the .lip file next to `wav_file`, then call `then` (from a worker thread) if it was made
+
+        `on_facefx` is called with how many seconds FaceFX took, if it had to run.
+        The future's result is the .lip file, or None if there isn't one
+        """
+        lip_file = wav_file[:-len('.wav')] + '.lip'
+        job = self.__executor.submit(self.__make_lip_file, wav_file, lip_file, text, on_facefx)
+        with self.__lock:
+            self.__jobs[wav_file] = job
+        job.add_done_callback(lambda job: self.__finish_job(wav_file, job, then))
+        return job
+
+    def wait(self, wav_file: str):
+        """Wait for the .lip file of `wav_file`, if it is still being made"""
+        with self.__lock:
+            job = self.__jobs.get(wav_file)
+        start = time.perf_counter()
+        if job is not None:
+            job.result()
+        self.__record_wait(time.perf_counter() - start)
+
+    def join(self):
+        """Wait until every .lip file which is being made is done (eg before its folder is removed)"""
+        with self.__lock:
+            jobs = list(self.__jobs.values())
+        wait_for_futures(jobs)
+
+    async def wait_async(self, wav_file: str):
+        """`wait` for the event loop. Cancelling it doesn't cancel the .lip file, which is cached once it is done"""
+        with self.__lock:
+            job = self.__jobs.get(wav_file)
+        start = time.perf_counter()
+        if job is not None:
+            await asyncio.shield(asyncio.wrap_future(job))
+        self.__record_wait(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        """How many .lip files were made, copied from the cache or failed, how long FaceFX took and how long voicelines waited for it"""
+        with self.__lock:
+            return {
+                **self.__counts,
+                'cached': len(self.__cached),
+                'facefx': latency_summary(self.__facefx_seconds),
+                'wait': latency_summary(self.__wait_seconds),
+            }
+
+    def __finish_job(self, wav_file: str, job: Future[str | None], then: Callable[[], None] | None):
+        with self.__lock:
+            if self.__jobs.get(wav_file) is job:
+                del self.__jobs[wav_file]
+        if job.cancelled():
+            return
+        if job.result() is None:
+            # the reason has been logged already. Without its .lip file the voiceline mustn't be reused (eg from the voiceline cache)
+            logging.debug(f'No LIP file was made for {wav_file}, so it will not be reused')
+        elif then is not None:
+            then()
+
+    def __record_wait(self, seconds: float):
+        with self.__lock:
+            self.__wait_seconds.append(seconds)
+
+    def __count(self, name: str):
+        with self.__lock:
+            self.__counts[name] += 1
+
+    def __make_lip_file(self, wav_file: str, lip_file: str, text: str, on_facefx: Callable[[float], None] | None) -> str | None:
+        resampled_wav_file = wav_file[:-len('.wav')] + '_r.wav'
+        try:
+            key = self.__key(wav_file, text)
+            if self.__copy_from_cache(key, lip_file):
+                self.__count('cache_hits')
+                return lip_file
+            if not self.__can_run_facefx():
+                return None
+
+            start = time.perf_counter()
+            arguments = facefx_arguments(self.__command_template, facefx_folder=self.__facefx_folder, wav_file=wav_file, resampled_wav_file=resampled_wav_file, lip_file=lip_file, text=text)
+            result = subprocess.run(arguments, startupinfo=_startupinfo(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=FACEFX_TIMEOUT)
+            seconds = time.perf_counter() - start
+            if not os.path.exists(lip_file):
+                logging.warning(f'FaceFX did not create a LIP file for {wav_file} (exit code {result.returncode}): {result.stderr.decode("utf-8", errors="replace").strip()}')
+                self.__count('failed')
+                return None
+
+            with self.__lock:
+                self.__facefx_seconds.append(seconds)
+            if on_facefx is not None:
+                on_facefx(seconds)
+            self.__count('generated')
+            self.__add_to_cache(key, lip_file)
+            return lip_file
+        except Exception as e:
+            logging.warning(e)
+            self.__count('failed')
+            return None
+        finally:
+            # remove file created by FaceFXWrapper
+            if os.path.exists(resampled_wav_file):
+                os.remove(resampled_wav_file)
+
+    def __can_run_facefx(self) -> bool:
+        """Whether FaceFXWrapper and its phoneme data are there (a custom command is assumed to work)"""
+        if not self.__uses_facefx_wrapper:
+            return True
+        cdf_path = f'{self.__facefx_folder}FonixData.cdf'
+        face_wrapper_executable = f'{self.__facefx_folder}FaceFXWrapper.exe'
+        if os.path.exists(cdf_path) and os.path.exists(face_wrapper_executable):
+            return True
+        if not self.__has_logged_missing_facefx:
+            if not os.path.exists(cdf_path):
+                logging.error(f'Could not find FonixData.cdf in "{Path(cdf_path).parent}" required by FaceFXWrapper. Look for the Lip Fuz plugin of xVASynth.')
+            else:
+                logging.error(f'Could not find FaceFXWrapper.exe in "{Path(face_wrapper_executable).parent}" with which to create a Lip Sync file, download it from: https://github.com/Nukem9/FaceFXWrapper/releases')
+            self.__has_logged_missing_facefx = True
+        self.__count('failed')
+        return False
+
+    def __key(self, wav_file: str, text: str) -> str:
+        content_hash = hashlib.sha256()
+        with open(wav_file, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                content_hash.update(block)
+        content_hash.update(' '.join(text.split()).encode('utf-8'))
+        content_hash.update(self.__command_template.encode('utf-8'))
+        return content_hash.hexdigest()[:32]
+
+    def __cache_file(self, key: str) -> str:
+        return os.path.join(self.__cache_folder, key + '.lip')
+
+    def __copy_from_cache(self, key: str, lip_file: str) -> bool:
+        with self.__lock:
+            if key not in self.__cached:
+                return False
+            self.__cached.move_to_end(key)
+        try:
+            shutil.copyfile(self.__cache_file(key), lip_file)
+            os.utime(self.__cache_file(key)) # keeps the LRU order across restarts
+            return True
+        except OSError:
+            with self.__lock:
+                self.__cached.pop(key, None)
+            return False
+
+    def __add_to_cache(self, key: str, lip_file: str):
+        if self.__max_cached <= 0:
+            return
+        try:
+            shutil.copyfile(lip_file, self.__cache_file(key))
+        except OSError as e:
+            logging.warning(f'Could not cache LIP file {lip_file}: {e}')
+            return
+        with self.__lock:
+            self.__cached[key] = None
+            self.__cached.move_to_end(key)
+            evicted = []
+            while len(self.__cached) > self.__max_cached:
+                evicted.append(self.__cached.popitem(last=False)[0])
+        for evicted_key in evicted:
+            try:
+                os.remove(self.__cache_file(evicted_key))
+            except OSError:
+                pass
+
+    def __load_cache(self):
+        """Index the cached .lip files, least recently used first"""
+        cached_files = []
+        for entry in os.scandir(self.__cache_folder):
+            key, extension = os.path.splitext(entry.name)
+            if entry.is_file() and extension == '.lip':
+                cached_files.append((entry.stat().st_mtime_ns, key))
+        for _, key in sorted(cached_files):
+            self.__cached[key] = None
+        # the limit may have been lowered since the last run
+        while len(self.__cached) > self.__max_cached:
+            try:
+                os.remove(self.__cache_file(self.__cached.popitem(last=False)[0]))
+            except OSError:
+                pass
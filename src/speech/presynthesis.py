@@ -0,0 +1,91 @@
+import logging
+import os
+import queue
+import threading
+from typing import Callable
+
+
+class _StockLineJob:
+    def __init__(self, voice: str, voiceline: str, key: str, file_name: str) -> None:
+        self.voice = voice
+        self.voiceline = voiceline
+        self.key = key
+        self.file_name = file_name
+        self.voiceline_file: str | None = None
+        self.is_started = False
+        self.done = threading.Event()
+
+
+class StockLinePresynthesizer:
+    """Synthesizes a voice's stock lines (goodbye, collecting thoughts, ...) on a worker thread after its voice model loads
+
+    `synthesize_stock_line(voice, voiceline, key, file_name)` does the actual work and returns the voiceline file,
+    or None if it could not (eg because another voice model was loaded in the meantime).
+    `get` hands out the finished file, waiting for it if the line is still being synthesized.
+    While paused (eg while a response is being spoken), no new line is started, so that they don't hold up the TTS
+    server. A line which is already being synthesized is finished.
+    """
+    def __init__(self, stock_lines: list[str], synthesize_stock_line: Callable[[str, str, str, str], str | None]) -> None:
+        self.__stock_lines = [line for line in stock_lines if line.strip() != '']
+        self.__synthesize_stock_line = synthesize_stock_line
+        self.__jobs: dict[str, _StockLineJob] = {}
+        self.__queue: queue.Queue[_StockLineJob] = queue.Queue()
+        self.__lock = threading.Condition()
+        self.__pauses = 0
+        self.__worker: threading.Thread | None = None
+
+    def queue(self, voice: str, key: Callable[[str, str], str]):
+        """Queue the stock lines of `voice`, where `key(voice, voiceline)` identifies a voiceline"""
+        with self.__lock:
+            for i, voiceline in enumerate(self.__stock_lines):
+                line_key = key(voice, voiceline)
+                job = self.__jobs.get(line_key)
+                if (job is not None) and ((not job.done.is_set()) or (job.voiceline_file is not None)):
+                    continue # already queued or ready
+                job = _StockLineJob(voice, voiceline, line_key, f'stock_{i}')
+                self.__jobs[line_key] = job
+                self.__queue.put(job)
+
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__work, name='stock-line-presynthesis', daemon=True)
+                self.__worker.start()
+
+    def get(self, key: str) -> str | None:
+        """Return the pre-synthesized voiceline file for `key`, or None if it isn't a (usable) stock line"""
+        with self.__lock:
+            job = self.__jobs.get(key)
+            if (job is None) or ((self.__pauses > 0) and not job.is_started):
+                # rather than waiting for the pause to end
+                return None
+        job.done.wait()
+        if (job.voiceline_file is None) or (not os.path.exists(job.voiceline_file)):
+            return None
+        return job.voiceline_file
+
+    def join(self):
+        """Wait until every queued line is done (eg before its folder is removed)"""
+        self.__queue.join()
+
+    def pause(self):
+        """Don't start any more lines until `resume` has been called as often as `pause`"""
+        with self.__lock:
+            self.__pauses += 1
+
+    def resume(self):
+        with self.__lock:
+            self.__pauses -= 1
+            self.__lock.notify_all()
+
+    def __work(self):
+        while True:
+            job = self.__queue.get()
+            with self.__lock:
+                self.__lock.wait_for(lambda: self.__pauses == 0)
+                job.is_started = True
+            try:
+                job.voiceline_file = self.__synthesize_stock_line(job.voice, job.voiceline, job.key, job.file_name)
+            except Exception as e:
+                logging.warning(f'Could not pre-synthesize "{job.voiceline}": {e}')
+            finally:
+                job.done.set()
+                self.__queue.task_done()
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+
+
+class VoiceModel:
+    """What Mantella needs to know about an installed xVASynth voice model (from its sk_<voice>.json file)"""
+    def __init__(self, voice_id: str, model_path: str, model_type: str | None, base_speaker_emb: str | None, languages: list[str], files: list[str], json_mtime_ns: int) -> None:
+        self.voice_id = voice_id
+        # the model's path without an extension, as xVASynth's loadModel expects it
+        self.model_path = model_path
+        self.model_type = model_type
+        # the base speaker embedding as the comma separated string xVASynth's synthesize expects
+        self.base_speaker_emb = base_speaker_emb
+        self.languages = languages
+        # every file belonging to the model (.json, .pt, .hg.pt, ...)
+        self.files = files
+        self.json_mtime_ns = json_mtime_ns
+
+
+def voice_id(voice: str) -> str:
+    """The voice model name as it appears in model file names ('Male Nord' -> 'malenord')"""
+    return voice.lower().replace(' ', '')
+
+
+class VoiceCatalogue:
+    """An index of the xVASynth voice models in a models folder, so that switching voices costs no file I/O
+
+    The folder is scanned once (optionally in the background), and again only when its mtime changes, ie when
+    models are added or removed. Model JSON files which haven't changed since the last scan are not parsed again.
+    """
+    def __init__(self, models_folder: str) -> None:
+        self.__models_folder = models_folder
+        self.__models: dict[str, VoiceModel] = {}
+        self.__folder_mtime_ns: int | None = None
+        self.__lock = threading.Lock()
+        self.__loaded = threading.Event()
+        self.__loader: threading.Thread | None = None
+
+    def load_in_background(self):
+        self.__loader = threading.Thread(target=self.__initial_load, name='voice-catalogue', daemon=True)
+        self.__loader.start()
+
+    def refresh(self) -> bool:
+        """Rescan the models folder if it has changed since the last scan. Returns whether it was rescanned"""
+        with self.__lock:
+            try:
+                folder_mtime_ns = os.stat(self.__models_folder).st_mtime_ns
+            except OSError:
+                self.__models = {}
+                self.__folder_mtime_ns = None
+                return False
+            if folder_mtime_ns == self.__folder_mtime_ns:
+                return False
+
+            files_by_voice_id: dict[str, list[str]] = {}
+            json_files: dict[str, os.DirEntry] = {}
+            for entry in os.scandir(self.__models_folder):
+                # file names are matched in lower case, like Windows does ('SK_MaleNord.json' is the model 'malenord')
+                name = entry.name.lower()
+                if not name.startswith('sk_') or not entry.is_file():
+                    continue
+                model_voice_id = name[len('sk_'):].split('.')[0]
+                files_by_voice_id.setdefault(model_voice_id, []).append(entry.path)
+                if name == f'sk_{model_voice_id}.json':
+                    json_files[model_voice_id] = entry
+
+            models = {}
+            for model_voice_id, entry in json_files.items():
+                previous = self.__models.get(model_voice_id)
+                json_mtime_ns = entry.stat().st_mtime_ns
+                if (previous is not None) and (previous.json_mtime_ns == json_mtime_ns):
+                    previous.files = sorted(files_by_voice_id[model_voice_id])
+                    models[model_voice_id] = previous
+                    continue
+                model = self.__parse(model_voice_id, entry.path, json_mtime_ns, sorted(files_by_voice_id[model_voice_id]))
+                if model is not None:
+                    models[model_voice_id] = model
+
+            self.__models = models
+            self.__folder_mtime_ns = folder_mtime_ns
+            return True
+
+    def get(self, voice: str) -> VoiceModel | None:
+        """Look up an installed voice model by name ('Male Nord'), waiting for the initial scan if needed"""
+        self.__wait_until_loaded()
+        model = self.__models.get(voice_id(voice))
+        if model is None and self.refresh(): # it may have been installed since the last scan
+            model = self.__models.get(voice_id(voice))
+        return model
+
+    def is_available(self, voice: str) -> bool:
+        return self.get(voice) is not None
+
+    def missing(self, voices: list[str]) -> list[str]:
+        """The voices in `voices` which have no installed model"""
+        self.__wait_until_loaded()
+        self.refresh()
+        return [voice for voice in voices if voice_id(voice) not in self.__models]
+
+    def __len__(self) -> int:
+        self.__wait_until_loaded()
+        return len(self.__models)
+
+    def __initial_load(self):
+        try:
+            self.refresh()
+            logging.debug(f'Found {len(self.__models)} xVASynth voice models in {self.__models_folder}')
+        except Exception as e:
+            logging.error(f'Could not scan xVASynth voice models in {self.__models_folder}: {e}')
+        finally:
+            self.__loaded.set()
+
+    def __wait_until_loaded(self):
+        if self.__loaded.is_set():
+            return
+        if self.__loader is None:
+            # no background scan was started, so scan now
+            self.__initial_load()
+        self.__loaded.wait()
+
+    @staticmethod
+    def __parse(model_voice_id: str, json_file: str, json_mtime_ns: int, files: list[str]) -> VoiceModel | None:
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                voice_model_json = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f'Could not read voice model {json_file}: {e}')
+            return None
+
+        try:
+            base_speaker_emb = voice_model_json['games'][0]['base_speaker_emb']
+            base_speaker_emb = str(base_speaker_emb).replace('[','').replace(']','')
+        except:
+            base_speaker_emb = None
+
+        languages = voice_model_json.get('lang', [])
+        if isinstance(languages, str):
+            languages = [languages]
+        return VoiceModel(
+            voice_id=model_voice_id,
+            model_path=json_file[:-len('.json')],
+            model_type=voice_model_json.get('modelType'),
+            base_speaker_emb=base_speaker_emb,
+            languages=languages,
+            files=files,
+            json_mtime_ns=json_mtime_ns,
+        )
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable
+from src.speech.latency import latency_summary
+
+
+class VoiceScheduler:
+    """Decides when voice models are loaded, so that switching speakers costs as little waiting as possible
+
+    `preload` loads a voice model on a worker thread (eg as soon as the LLM names the next speaker, while the
+    current sentence is still playing) and returns immediately. Only the most recent preload request is kept.
+    `switch_to` is called right before synthesizing: it waits for a preload of that voice which is in progress,
+    and only loads the model itself if nobody has.
+
+    Loaded voices are kept in an LRU of `max_loaded_voices` (the backend's `max_loaded_voices`), for backends which
+    can hold several voice models at once. xVASynth and xTTS both hold one. Voice models loaded without the scheduler
+    must be passed to `record_load`, or it would think the previous voice is still loaded.
+    """
+    def __init__(self, change_voice: Callable[[str], None], max_loaded_voices: int = 1) -> None:
+        self.__change_voice = change_voice
+        self.__max_loaded_voices = max_loaded_voices
+        self.__loaded: OrderedDict[str, None] = OrderedDict() # least recently used first
+        self.__pending: str | None = None
+        self.__loading: str | None = None
+        self.__condition = threading.Condition()
+        self.__worker: threading.Thread | None = None
+
+        self.__load_seconds: deque[float] = deque(maxlen=200)
+        self.__wait_seconds: deque[float] = deque(maxlen=200)
+        self.__counts = {'switches': 0, 'already_loaded': 0, 'preloads': 0, 'superseded': 0, 'failed_preloads': 0}
+
+    def preload(self, voice: str):
+        """Start loading `voice` in the background, replacing any preload which hasn't started yet"""
+        with self.__condition:
+            if (voice in self.__loaded) or (voice == self.__loading) or (voice == self.__pending):
+                return
+            if self.__pending is not None:
+                self.__counts['superseded'] += 1
+            self.__pending = voice
+            self.__counts['preloads'] += 1
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__work, name='voice-preload', daemon=True)
+                self.__worker.start()
+            self.__condition.notify_all()
+
+    def switch_to(self, voice: str):
+        """Make sure `voice` is loaded, waiting for a preload in progress rather than loading it twice"""
+        start = time.perf_counter()
+        with self.__condition:
+            self.__counts['switches'] += 1
+            while self.__loading is not None:
+                self.__condition.wait()
+            if self.__pending is not None:
+                if self.__pending != voice: # whoever was expected to speak next didn't
+                    self.__counts['superseded'] += 1
+                self.__pending = None
+            if voice in self.__loaded:
+                self.__loaded.move_to_end(voice)
+                self.__counts['already_loaded'] += 1
+                self.__wait_seconds.append(time.perf_counter() - start)
+                return
+            self.__loading = voice
+
+        try:
+            self.__load(voice)
+        finally:
+            with self.__condition:
+                self.__loading = None
+                self.__condition.notify_all()
+            self.__wait_seconds.append(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        """How often voices were switched and preloaded, how long model loads took and how long speakers waited for them"""
+        with self.__condition:
+            return {
+                **self.__counts,
+                'model_load': latency_summary(self.__load_seconds),
+                'switch_wait': latency_summary(self.__wait_seconds),
+            }
+
+    def record_load(self, voice: str, seconds: float):
+        """Note a voice model which was loaded without the scheduler (eg by Synthesizer.change_voice_async)"""
+        with self.__condition:
+            self.__load_seconds.append(seconds)
+            self.__loaded[voice] = None
+            self.__loaded.move_to_end(voice)
+            while len(self.__loaded) > self.__max_loaded_voices:
+                self.__loaded.popitem(last=False)
+
+    def __load(self, voice: str):
+        start = time.perf_counter()
+        self.__change_voice(voice)
+        self.record_load(voice, time.perf_counter() - start)
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                while (self.__pending is None) or (self.__loading is not None):
+                    self.__condition.wait()
+                voice = self.__pending
+                self.__pending = None
+                if voice in self.__loaded:
+                    continue
+                self.__loading = voice
+
+            try:
+                self.__load(voice)
+            except Exception as e:
+                # switch_to will try again, and report the error, if this voice is really needed
+                logging.warning(f'Could not preload voice model "{voice}": {e}')
+                with self.__condition:
+                    self.__counts['failed_preloads'] += 1
+            finally:
+                with self.__condition:
+                    self.__loading = None
+                    self.__condition.notify_all()
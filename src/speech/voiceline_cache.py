@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from src.game_io.file_writer import write_text_atomically
+
+INDEX_FILE_NAME = 'index.json'
+CACHE_FILE_EXTENSIONS = ['.wav', '.lip']
+
+
+class VoicelineCache:
+    """A disk cache of synthesized voicelines (.wav and, if FaceFX made one, .lip) with a size budget
+
+    Entries are keyed by a hash of everything which changes the audio: the voice model, the text, the emotion
+    (aggro) and the synthesis settings (backend, pace, language, ...). When the cache grows past `max_bytes`
+    the least recently used voicelines are deleted. The LRU order and sizes are kept in index.json, so the cache
+    survives restarts. Files in the folder which the index doesn't know about are removed on startup.
+
+    A hit only costs a dict lookup and a stat call, so a cached line skips both TTS and FaceFX.
+    """
+    def __init__(self, cache_folder: str, max_bytes: int, settings: dict) -> None:
+        self.__cache_folder = cache_folder
+        self.__max_bytes = max_bytes
+        self.__settings = json.dumps(settings, sort_keys=True)
+        self.__index_file = os.path.join(cache_folder, INDEX_FILE_NAME)
+        self.__entries: OrderedDict[str, int] = OrderedDict() # key -> size in bytes, least recently used first
+        self.__total_bytes = 0
+        self.__is_dirty = False
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+        if self.is_enabled:
+            os.makedirs(cache_folder, exist_ok=True)
+            self.__load_index()
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.__max_bytes > 0
+
+    def key(self, voice: str, voiceline: str, aggro) -> str:
+        text = ' '.join(voiceline.split())
+        return hashlib.sha256(json.dumps([self.__settings, voice, text, str(aggro)]).encode('utf-8')).hexdigest()[:32]
+
+    def get(self, key: str) -> str | None:
+        """Return the path of the cached .wav file (the .lip file is next to it), or None"""
+        if not self.is_enabled:
+            return None
+        wav_file = self.__file_path(key, '.wav')
+        with self.__lock:
+            if key in self.__entries and os.path.exists(wav_file):
+                self.__entries.move_to_end(key)
+                self.__is_dirty = True
+                self.__hits += 1
+                return wav_file
+            self.__misses += 1
+            return None
+
+    def put(self, key: str, wav_file: str):
+        """Copy a freshly synthesized .wav file (and its .lip file, if there is one) into the cache"""
+        if not self.is_enabled:
+            return
+        size = 0
+        try:
+            for extension in CACHE_FILE_EXTENSIONS:
+                source_file = wav_file[:-len('.wav')] + extension
+                if os.path.exists(source_file):
+                    shutil.copyfile(source_file, self.__file_path(key, extension))
+                    size += os.path.getsize(source_file)
+        except OSError as e:
+            logging.warning(f'Could not cache voiceline {wav_file}: {e}')
+            self.__remove_files(key)
+            return
+
+        with self.__lock:
+            self.__total_bytes += size - self.__entries.pop(key, 0)
+            self.__entries[key] = size
+            self.__evict()
+            self.__is_dirty = True
+        self.save()
+
+    def save(self):
+        """Write the index if it has changed (hits only reorder it in memory, to keep them fast)"""
+        with self.__lock:
+            if not self.__is_dirty:
+                return
+            index = {'entries': [[key, size] for key, size in self.__entries.items()]}
+            self.__is_dirty = False
+        try:
+            write_text_atomically(self.__index_file, json.dumps(index))
+        except OSError as e:
+            logging.warning(f'Could not save voiceline cache index: {e}')
+
+    def stats(self) -> dict:
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                'entries': len(self.__entries),
+                'size_mb': round(self.__total_bytes / 1024 / 1024, 2),
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_rate': round(self.__hits / lookups, 3) if lookups > 0 else 0.0,
+            }
+
+    def __file_path(self, key: str, extension: str) -> str:
+        return os.path.join(self.__cache_folder, key + extension)
+
+    def __remove_files(self, key: str):
+        for extension in CACHE_FILE_EXTENSIONS:
+            try:
+                os.remove(self.__file_path(key, extension))
+            except OSError:
+                pass
+
+    def __evict(self):
+        while self.__total_bytes > self.__max_bytes and len(self.__entries) > 1:
+            key, size = self.__entries.popitem(last=False)
+            self.__total_bytes -= size
+            self.__remove_files(key)
+
+    def __load_index(self):
+        try:
+            with open(self.__index_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('entries', [])
+        except FileNotFoundError:
+            entries = []
+        except (OSError, ValueError) as e:
+            logging.warning(f'Could not read voiceline cache index, starting with an empty cache: {e}')
+            entries = []
+
+        for key, size in entries:
+            if os.path.exists(self.__file_path(key, '.wav')):
+                self.__entries[key] = size
+                self.__total_bytes += size
+
+        # remove voicelines which were never indexed (eg Mantella was closed while caching one) or were evicted
+        for file_name in os.listdir(self.__cache_folder):
+            key, extension = os.path.splitext(file_name)
+            if extension in CACHE_FILE_EXTENSIONS and key not in self.__entries:
+                self.__remove_files(key)
+
+        # the budget may have been lowered since the last run
+        self.__evict()
+        self.__is_dirty = len(self.__entries) != len(entries)
+        self.save()
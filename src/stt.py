@@ -69,11 +69,9 @@ class Transcriber:
                     logging.log(self.loglevel, f'Player wrote "{transcribed_text}"')
                 # await text input from the game
                 else:
-                    self.game_state_manager.write_game_info('_mantella_text_input', '')
-                    self.game_state_manager.write_game_info('_mantella_text_input_enabled', 'True')
+                    self.game_state_manager.write_game_info_batch({'_mantella_text_input': '', '_mantella_text_input_enabled': 'True'})
                     transcribed_text = self.game_state_manager.load_data_when_available('_mantella_text_input', '')
-                    self.game_state_manager.write_game_info('_mantella_text_input', '')
-                    self.game_state_manager.write_game_info('_mantella_text_input_enabled', 'False')
+                    self.game_state_manager.write_game_info_batch({'_mantella_text_input': '', '_mantella_text_input_enabled': 'False'})
 
         if (self.debug_mode == '1') & (self.debug_exit_on_first_exchange == '1'):
             if say_goodbye:
@@ -1,55 +1,45 @@
-import requests
-import winsound
+try:
+    import winsound
+except ImportError: # not on Windows, where voicelines can't be played from the script
+    winsound = None
 import logging
 import src.utils as utils
 import os
-import soundfile as sf
-import numpy as np
 import re
-import pandas as pd
-import sys
 from pathlib import Path
-import json
-from subprocess import Popen, PIPE, STDOUT, DEVNULL, STARTUPINFO,STARTF_USESHOWWINDOW
-
-class TTSServiceFailure(Exception):
-    pass
-
-class VoiceModelNotFound(Exception):
-    pass
+import asyncio
+from contextlib import asynccontextmanager
+import src.speech.audio_assembly as audio_assembly
+from src.speech.http_session import TTSHttpSession
+from src.speech.async_http_session import AsyncTTSHttpSession
+from src.speech.backends import TTSBackend, VoiceModelNotFound, create_tts_backend
+from src.speech.voiceline_cache import VoicelineCache
+from src.speech.presynthesis import StockLinePresynthesizer
+from src.speech.voice_scheduler import VoiceScheduler
+from src.speech.lip_sync import LipSyncGenerator
+from src.speech.latency import StageTimings
+from src.speech.chunking import ChunkingPolicy, MAX_PHRASE_CHARS
+import threading
+import time
 
 class Synthesizer:
     def __init__(self, config):
         self.loglevel = 29
-        self.xvasynth_path = config.xvasynth_path
         self.facefx_path = config.facefx_path if config.facefx_path else (config.xvasynth_path + '/resources/app/plugins/lip_fuz/')
-        self.process_device = config.xvasynth_process_device
-        self.times_checked_xvasynth = 0
-        # to print output to console
-        self.tts_print = config.tts_print
-        
-        #Added from xTTS implementation
-        self.use_external_xtts = int(config.use_external_xtts)
-        self.xtts_set_tts_settings = config.xtts_set_tts_settings
-        self.xTTS_tts_data = config.xTTS_tts_data
-        self.xtts_server_path = config.xtts_server_path
-        self.synthesize_url_xtts = config.xtts_synthesize_url
-        self.switch_model_url = config.xtts_switch_model
-        self.xtts_get_models_list = config.xtts_get_models_list
-        self.xtts_set_output = config.xtts_set_output
-        self.official_model_list = ["main","v2.0.3","v2.0.2","v2.0.1","v2.0.0"]
-
-        # check if xvasynth is running; otherwise try to run it
-        if self.use_external_xtts == 1:
-            self._set_tts_settings_and_test_if_serv_running()
-            self.available_models = self._get_available_models()
-            self.plugins_path = self.xtts_server_path + "/plugins/lip_fuz"
-        else:
-            self.check_if_xvasynth_is_running()
-            self.plugins_path = self.xvasynth_path + "/resources/app/plugins/lip_fuz"
-
-        # voice models path
-        self.model_path = f"{self.xvasynth_path}/resources/app/models/skyrim/"
+
+        # one keep-alive connection pool for every request to the TTS server
+        slow_endpoint_timeouts = {endpoint: (2, config.tts_request_timeout) for endpoint in ['synthesize', 'synthesize_batch', 'load_model', 'switch_model']}
+        # how many phrases of a voiceline are sent to the TTS server at once, for models which can't be batch synthesized
+        self.max_concurrent_phrases = max(1, config.tts_max_concurrent_phrases)
+        pool_size = max(4, self.max_concurrent_phrases)
+        self.http = TTSHttpSession(timeouts=slow_endpoint_timeouts, max_retries=config.tts_request_retries, pool_size=pool_size)
+        # and its asyncio counterpart for synthesize_async / change_voice_async, which knows what the server was already sent
+        self.async_http = AsyncTTSHttpSession(timeouts=slow_endpoint_timeouts, max_retries=config.tts_request_retries, pool_size=pool_size, server_state=self.http.server_state)
+
+        # xVASynth or xTTS; connect to it (or start it)
+        self.backend: TTSBackend = create_tts_backend(config, self.http)
+        self.backend.start()
+
         # output wav / lip files path
         self.output_path = utils.resolve_path()+'/data'
 
@@ -63,73 +53,199 @@ class Synthesizer:
         self.debug_mode = config.debug_mode
         self.play_audio_from_script = config.play_audio_from_script
 
+        # previously synthesized voicelines, keyed by everything which changes how they sound
+        self.voiceline_cache = VoicelineCache(f"{self.output_path}/voicelines/_cache", int(config.voiceline_cache_size_mb * 1024 * 1024), {
+            **self.backend.cache_settings(),
+            'language': self.language,
+            'pace': self.pace,
+            'use_sr': self.use_sr,
+            'use_cleanup': self.use_cleanup,
+        })
+        # FaceFX makes the LIP files on worker threads, while the TTS server moves on to the next voiceline
+        self.lip_sync = LipSyncGenerator(self.facefx_path, config.facefx_command, f"{self.output_path}/voicelines/_lip_cache", config.lip_sync_workers)
+        # the TTS server works on one voice model and line at a time: threads take synthesis_lock, coroutines
+        # queue on an asyncio.Lock first (see _synthesis_lock_async)
+        self.synthesis_lock = threading.Lock()
+        self.__async_synthesis_lock: asyncio.Lock | None = None
+        self.__async_synthesis_lock_loop: asyncio.AbstractEventLoop | None = None
+        # voicelines are synthesized while earlier ones are still waiting to be played, so each of them gets its own file
+        self.voiceline_file_slots = max(1, config.tts_lookahead_sentences) + 3
+        self.__voiceline_file_number = 0
+        # lines every NPC says sooner or later are synthesized in the background as soon as a voice model loads
+        self.stock_lines = StockLinePresynthesizer([config.goodbye_npc_response, config.collecting_thoughts_npc_response], self._synthesize_stock_line)
+
+        # how long each stage of making a voiceline takes, per voice model, and how fast synthesis is compared to playback
+        self.stage_timings = StageTimings()
+        # how much of a response goes into each voiceline, and how voicelines are split into phrases
+        self.chunking = ChunkingPolicy(config.tts_chunking, config.tts_min_chunk_words, config.tts_max_chunk_words, config.number_words_tts, config.tts_first_clause_words, self.stage_timings)
+
         # last active voice model
         self.last_voice = ''
+        # loads the next speaker's voice model in the background, so group conversations don't wait on every switch
+        self.voice_scheduler = VoiceScheduler(self._load_voice_model, self.backend.max_loaded_voices)
 
-        self.model_type = ''
-        self.base_speaker_emb = ''
+    def synthesize(self, voice, voiceline, aggro=0):
+        """Synthesize a voiceline and wait for its LIP file. This blocks, so await `synthesize_async` on the event loop instead"""
+        self._check_not_on_event_loop('synthesize')
+        cache_key = self.voiceline_cache.key(voice, voiceline, aggro)
+        ready_voiceline_file = self._get_ready_voiceline(cache_key)
+        if ready_voiceline_file is not None:
+            logging.log(22, f'Using pre-synthesized voiceline: {voiceline}')
+            self.lip_sync.wait(ready_voiceline_file)
+            self._play_if_debugging(ready_voiceline_file)
+            return ready_voiceline_file
+
+        self.voice_scheduler.switch_to(voice)
+        with self.synthesis_lock:
+            voice_changed = voice != self.last_voice
+            if voice_changed: # another thread loaded a different voice model in the meantime
+                self.voice_scheduler.record_load(voice, self._change_voice(voice))
+
+            logging.log(22, f'Synthesizing voiceline: {voiceline}')
+            final_voiceline_file = self._synthesize(voiceline, cache_key, aggro, self._next_voiceline_file_name())
+
+        if voice_changed:
+            self._queue_stock_lines(voice)
+        self.lip_sync.wait(final_voiceline_file)
+        self._play_if_debugging(final_voiceline_file)
+        return final_voiceline_file
 
-        self.synthesize_url = 'http://127.0.0.1:8008/synthesize'
-        self.synthesize_batch_url = 'http://127.0.0.1:8008/synthesize_batch'
-        self.loadmodel_url = 'http://127.0.0.1:8008/loadModel'
-        self.setvocoder_url = 'http://127.0.0.1:8008/setVocoder'
-       
+    async def synthesize_async(self, voice, voiceline, aggro=0):
+        """`synthesize` for the event loop: requests go through the asyncio session and file work runs in a thread
 
-    def _get_available_models(self):
-        # Code to request and return the list of available models
-        response = requests.get(self.xtts_get_models_list)
-        return response.json() if response.status_code == 200 else []
-    
-    def get_first_available_official_model(self):
-        # Check in the available models list if there is an official model
-        for model in self.official_model_list:
-            if model in self.available_models:
-                return model
-        return None
-
-    def convert_to_16bit(self, input_file, output_file=None):
-        if output_file is None:
-            output_file = input_file
-        # Read the audio file
-        data, samplerate = sf.read(input_file)
-
-        # Directly convert to 16-bit if data is in float format and assumed to be in the -1.0 to 1.0 range
-        if np.issubdtype(data.dtype, np.floating):
-            # Ensure no value exceeds the -1.0 to 1.0 range before conversion (optional, based on your data's characteristics)
-            # data = np.clip(data, -1.0, 1.0)  # Uncomment if needed
-            data_16bit = np.int16(data * 32767)
-        elif not np.issubdtype(data.dtype, np.int16):
-            # If data is not floating-point or int16, consider logging or handling this case explicitly
-            # For simplicity, this example just converts to int16 without scaling
-            data_16bit = data.astype(np.int16)
-        else:
-            # If data is already int16, no conversion is necessary
-            data_16bit = data
-
-        # Write the 16-bit audio data back to a file
-        sf.write(output_file, data_16bit, samplerate, subtype='PCM_16')
+        Unlike `synthesize`, it returns before the LIP file is done, so that the next voiceline can be synthesized
+        in the meantime: await `wait_for_lip_file_async` before the voiceline is played.
+        Cancelling it abandons the voiceline
+        """
+        cache_key = self.voiceline_cache.key(voice, voiceline, aggro)
+        # waits if the line is a stock line which is still being pre-synthesized
+        ready_voiceline_file = await asyncio.to_thread(self._get_ready_voiceline, cache_key)
+        if ready_voiceline_file is not None:
+            logging.log(22, f'Using pre-synthesized voiceline: {voiceline}')
+            await asyncio.to_thread(self._play_if_debugging, ready_voiceline_file)
+            return ready_voiceline_file
+
+        async with self._synthesis_lock_async():
+            if voice != self.last_voice:
+                await self._change_voice_async(voice)
+                self._queue_stock_lines(voice)
+
+            logging.log(22, f'Synthesizing voiceline: {voiceline}')
+            final_voiceline_file = await self._synthesize_async(voiceline, cache_key, aggro, self._next_voiceline_file_name())
+
+        await asyncio.to_thread(self._play_if_debugging, final_voiceline_file)
+        return final_voiceline_file
 
-    def synthesize(self, voice, voiceline, aggro=0):
-        if voice != self.last_voice:
-            self.change_voice(voice)
+    async def wait_for_lip_file_async(self, voiceline_file):
+        """Wait until FaceFX is done with the LIP file of a voiceline returned by `synthesize_async`"""
+        await self.lip_sync.wait_async(voiceline_file)
+
+    def _get_ready_voiceline(self, cache_key):
+        """A pre-synthesized stock line or a cached voiceline, if there is one"""
+        ready_voiceline_file = self.stock_lines.get(cache_key)
+        if ready_voiceline_file is None:
+            ready_voiceline_file = self.voiceline_cache.get(cache_key)
+        return ready_voiceline_file
+
+    @asynccontextmanager
+    async def _synthesis_lock_async(self):
+        """Hold synthesis_lock from a coroutine without blocking the event loop
 
-        logging.log(22, f'Synthesizing voiceline: {voiceline}')
-        phrases = self._split_voiceline(voiceline)
+        Coroutines wait their turn on an asyncio.Lock. The one whose turn it is waits for synthesis_lock in a worker
+        thread if another thread (eg a voice model preload) has it
+        """
+        async with self._get_async_synthesis_lock():
+            if not self.synthesis_lock.acquire(blocking=False):
+                acquire = asyncio.ensure_future(asyncio.to_thread(self.synthesis_lock.acquire))
+                try:
+                    await asyncio.shield(acquire)
+                except asyncio.CancelledError:
+                    # the worker thread gets the lock anyway, so let go of it as soon as it does
+                    acquire.add_done_callback(lambda _: self.synthesis_lock.release())
+                    raise
+            try:
+                yield
+            finally:
+                self.synthesis_lock.release()
+
+    def _get_async_synthesis_lock(self) -> asyncio.Lock:
+        """asyncio locks belong to the event loop they were first used on, so each loop gets its own"""
+        loop = asyncio.get_running_loop()
+        if (self.__async_synthesis_lock is None) or (self.__async_synthesis_lock_loop is not loop):
+            self.__async_synthesis_lock = asyncio.Lock()
+            self.__async_synthesis_lock_loop = loop
+        return self.__async_synthesis_lock
+
+    def _check_not_on_event_loop(self, method):
+        """The blocking methods would deadlock the event loop if a coroutine on it holds synthesis_lock"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        raise RuntimeError(f'Synthesizer.{method} blocks, await its _async counterpart on the event loop instead')
+
+    def _next_voiceline_file_name(self):
+        """The file name for the next voiceline, taken in turn from `voiceline_file_slots` names. Call with synthesis_lock held"""
+        file_number = self.__voiceline_file_number
+        self.__voiceline_file_number = (file_number + 1) % self.voiceline_file_slots
+        return 'out' if file_number == 0 else f'out_{file_number}'
+
+    def _synthesize_stock_line(self, voice, voiceline, cache_key, file_name):
+        """Called by the stock line worker thread"""
+        with self.synthesis_lock:
+            if voice != self.last_voice: # another voice model has been loaded since this line was queued
+                return None
+            cached_voiceline_file = self.voiceline_cache.get(cache_key)
+            if cached_voiceline_file is not None:
+                return cached_voiceline_file
+            logging.debug(f'Pre-synthesizing voiceline: {voiceline}')
+            return self._synthesize(voiceline, cache_key, 0, file_name)
+
+    @utils.time_it
+    def _synthesize(self, voiceline, cache_key, aggro, final_voiceline_file_name):
+        """Synthesize a voiceline with the loaded voice model and return the .wav file (its LIP file is made in the background)"""
+        start = time.perf_counter()
+        phrases, voiceline_files, final_voiceline_file = self._prepare_voiceline(voiceline, final_voiceline_file_name)
+        output_folder_request = self.backend.output_folder_request(os.path.dirname(final_voiceline_file))
+        if output_folder_request is not None:
+            # only sent when the folder changes, ie with the voice model
+            self.http.post_if_changed(*output_folder_request)
+        with self.stage_timings.span(self.last_voice, 'http_synthesis'):
+            responses = self.http.post_all(self.backend.synthesis_requests(self.last_voice, phrases, voiceline_files, aggro), self.max_concurrent_phrases)
+        for response in responses:
+            self._check_synthesis_response(response)
+        return self._finish_voiceline(voiceline, cache_key, voiceline_files, final_voiceline_file, start)
+
+    async def _synthesize_async(self, voiceline, cache_key, aggro, final_voiceline_file_name):
+        start = time.perf_counter()
+        phrases, voiceline_files, final_voiceline_file = await self._run_in_thread(self._prepare_voiceline, voiceline, final_voiceline_file_name)
+        output_folder_request = self.backend.output_folder_request(os.path.dirname(final_voiceline_file))
+        if output_folder_request is not None:
+            await self.async_http.post_if_changed(*output_folder_request)
+        with self.stage_timings.span(self.last_voice, 'http_synthesis'):
+            responses = await self.async_http.post_all(self.backend.synthesis_requests(self.last_voice, phrases, voiceline_files, aggro), self.max_concurrent_phrases)
+        for response in responses:
+            self._check_synthesis_response(response)
+        return await self._run_in_thread(self._finish_voiceline, voiceline, cache_key, voiceline_files, final_voiceline_file, start)
+
+    async def _run_in_thread(self, func, *args):
+        """Run file work in a thread. If cancelled, wait for it to finish anyway, as the next voiceline reuses its files"""
+        work = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            await asyncio.wait([work])
+            raise
 
+    def _prepare_voiceline(self, voiceline, final_voiceline_file_name):
+        """Split the voiceline into the phrases to synthesize, and pick (and clear) the files they are synthesized to
+
+        Returns the phrases, their files (just the final file if there is only one phrase) and the final file
+        """
         # make voice model folder if it doesn't already exist
-        if not os.path.exists(f"{self.output_path}/voicelines/{self.last_voice}"):
-            os.makedirs(f"{self.output_path}/voicelines/{self.last_voice}")
-            
-        if self.use_external_xtts == 0:
-            phrases = self._split_voiceline(voiceline)
-			
-            voiceline_files = []
-            for phrase in phrases:
-                voiceline_file = f"{self.output_path}/voicelines/{self.last_voice}/{utils.clean_text(phrase)[:150]}.wav"
-                voiceline_files.append(voiceline_file)
-
-        final_voiceline_file_name = 'out' # "out" is the file name used by XTTS
         final_voiceline_folder = f"{self.output_path}/voicelines/{self.last_voice}"
+        if not os.path.exists(final_voiceline_folder):
+            os.makedirs(final_voiceline_folder)
         final_voiceline_file =  f"{final_voiceline_folder}/{final_voiceline_file_name}.wav"
 
         try:
@@ -139,55 +255,50 @@ class Synthesizer:
                 os.remove(final_voiceline_file.replace(".wav", ".lip"))
         except:
             logging.warning("Failed to remove spoken voicelines")
-    
-        # Synthesize voicelines
-        if self.use_external_xtts == 1:
-            requests.post(self.xtts_set_output, json={'output_folder': final_voiceline_folder})
-            self._synthesize_line_xtts(voiceline, final_voiceline_file, voice, aggro)
-        else:
-            if len(phrases) == 1:
-                self._synthesize_line(phrases[0], final_voiceline_file, aggro)
-            else:
-				# TODO: include batch synthesis for v3 models (batch not needed very often)
-                if self.model_type != 'xVAPitch':
-                    self._batch_synthesize(phrases, voiceline_files)
-                else:
-                    for i, voiceline_file in enumerate(voiceline_files):
-                        self._synthesize_line(phrases[i], voiceline_files[i])
-                self.merge_audio_files(voiceline_files, final_voiceline_file)
+
+        if not self.backend.splits_voicelines:
+            return [voiceline], [final_voiceline_file], final_voiceline_file
+
+        # phrases which are synthesized at the same time can be shorter when synthesis falls behind playback
+        concurrent_phrases = 1 if self.backend.supports_batch else self.max_concurrent_phrases
+        phrases = self._split_voiceline(voiceline, self.chunking.phrase_chars(len(voiceline), concurrent_phrases))
+        if len(phrases) == 1:
+            return phrases, [final_voiceline_file], final_voiceline_file
+        voiceline_files = [f"{final_voiceline_folder}/{utils.clean_text(phrase)[:150]}.wav" for phrase in phrases]
+        return phrases, voiceline_files, final_voiceline_file
+
+    def _check_synthesis_response(self, response):
+        if not response.ok:
+            logging.error(f"Failed to synthesize line: {response.status_code} - {response.text}")
+
+    def _finish_voiceline(self, voiceline, cache_key, voiceline_files, final_voiceline_file, synthesis_start):
+        """Turn the synthesized phrases into the final .wav file and start making its LIP file"""
+        voice = self.last_voice
+        stage_start = time.perf_counter()
+        stage = self.backend.finish_audio(voiceline_files, final_voiceline_file)
+        if stage is not None:
+            self.stage_timings.record(voice, stage, time.perf_counter() - stage_start)
         if not os.path.exists(final_voiceline_file):
             logging.error(f'xVASynth failed to generate voiceline at: {Path(final_voiceline_file)}')
             raise FileNotFoundError()
 
-        # FaceFX for creating a LIP file
-        try:
-            # check if FonixData.cdf file is besides FaceFXWrapper.exe
-            cdf_path = f'{self.facefx_path}FonixData.cdf'
-            if not os.path.exists(Path(cdf_path)):
-                logging.error(f'Could not find FonixData.cdf in "{Path(cdf_path).parent}" required by FaceFXWrapper. Look for the Lip Fuz plugin of xVASynth.')
-                raise FileNotFoundError()
-
-            # generate .lip file from the .wav file with FaceFXWrapper
-            face_wrapper_executable = f'{self.facefx_path}FaceFXWrapper.exe';
-            if os.path.exists(face_wrapper_executable):
-                # Run FaceFXWrapper.exe
-                self.run_command(f'{face_wrapper_executable} "Skyrim" "USEnglish" "{self.facefx_path}FonixData.cdf" "{final_voiceline_file}" "{final_voiceline_file.replace(".wav", "_r.wav")}" "{final_voiceline_file.replace(".wav", ".lip")}" "{voiceline}"')
-            else:
-                logging.error(f'Could not find FaceFXWrapper.exe in "{Path(face_wrapper_executable).parent}" with which to create a Lip Sync file, download it from: https://github.com/Nukem9/FaceFXWrapper/releases')
-                raise FileNotFoundError()
+        synthesis_seconds = time.perf_counter() - synthesis_start
+        audio_seconds = audio_assembly.audio_seconds(final_voiceline_file)
+        real_time_factor = self.stage_timings.record_line(voice, synthesis_seconds, audio_seconds)
+        if real_time_factor is not None:
+            logging.debug(f'Synthesized {round(audio_seconds, 2)} seconds of audio in {round(synthesis_seconds, 2)} seconds (real-time factor {round(real_time_factor, 2)})')
 
-            # remove file created by FaceFXWrapper
-            if os.path.exists(final_voiceline_file.replace(".wav", "_r.wav")):
-                os.remove(final_voiceline_file.replace(".wav", "_r.wav"))
-        except Exception as e:
-            logging.warning(e)
+        # the voiceline is cached once FaceFX has made its LIP file
+        self.lip_sync.submit(final_voiceline_file, voiceline, lambda: self.voiceline_cache.put(cache_key, final_voiceline_file),
+                             lambda seconds: self.stage_timings.record(voice, 'facefx', seconds))
+        return final_voiceline_file
 
+    def _play_if_debugging(self, voiceline_file):
         # if Debug Mode is on, play the audio file
-        if (self.debug_mode == '1') & (self.play_audio_from_script == '1'):
-            winsound.PlaySound(final_voiceline_file, winsound.SND_FILENAME)
-        return final_voiceline_file
+        if (self.debug_mode == '1') & (self.play_audio_from_script == '1') & (winsound is not None):
+            winsound.PlaySound(voiceline_file, winsound.SND_FILENAME)
 
-    def _group_sentences(self, voiceline_sentences, max_length=150):
+    def _group_sentences(self, voiceline_sentences, max_length=MAX_PHRASE_CHARS):
         """
         Splits sentences into separate voicelines based on their length (max=max_length)
         Groups sentences if they can be done so without exceeding max_length
@@ -208,7 +319,7 @@ class Synthesizer:
         return grouped_sentences
     
 
-    def _split_voiceline(self, voiceline, max_length=150):
+    def _split_voiceline(self, voiceline, max_length=MAX_PHRASE_CHARS):
         """Split voiceline into phrases by commas, 'and', and 'or'"""
 
         # Split by commas and "and" or "or"
@@ -250,194 +361,75 @@ class Synthesizer:
         logging.debug(f'Split sentence into : {result}')
 
         return result
-    
 
-    def merge_audio_files(self, audio_files, voiceline_file_name):
-        merged_audio = np.array([])
-
-        for audio_file in audio_files:
-            try:
-                audio, samplerate = sf.read(audio_file)
-                merged_audio = np.concatenate((merged_audio, audio))
-            except:
-                logging.error(f'Could not find voiceline file: {audio_file}')
-
-        sf.write(voiceline_file_name, merged_audio, samplerate)
-    
-
-    @utils.time_it
-    def _synthesize_line(self, line, save_path, aggro=0):
-        pluginsContext = {}
-        # in combat
-        if (aggro == 1):
-            pluginsContext["mantella_settings"] = {
-                "emAngry": 0.6
-            }
-        data = {
-            'pluginsContext': json.dumps(pluginsContext),
-            'modelType': self.model_type,
-            'sequence': line,
-            'pace': self.pace,
-            'outfile': save_path,
-            'vocoder': 'n/a',
-            'base_lang': self.language,
-            'base_emb': self.base_speaker_emb,
-            'useSR': self.use_sr,
-            'useCleanup': self.use_cleanup,
-        }
-        requests.post(self.synthesize_url, json=data)
-
-    @utils.time_it
-    def _synthesize_line_xtts(self, line, save_path, voice, aggro=0):
-        voice_path = f"{voice.lower().replace(' ', '')}"
-        data = {
-            'text': line,
-            'speaker_wav': voice_path,
-            'language': self.language,
-            'save_path': save_path
-        }
-        response = requests.post(self.synthesize_url_xtts, json=data)
-
-        # Check if the response is successful
-        if response.ok:
-            # Convert the audio file to 16-bit format only if the POST request was successful
-            self.convert_to_16bit(save_path)
-        else:
-            logging.error(f"Failed to synthesize line with xTTS: {response.status_code} - {response.text}")
-
-
-    @utils.time_it
-    def _batch_synthesize(self, grouped_sentences, voiceline_files):
-        # line = [text, unknown 1, unknown 2, pace, output_path, unknown 5, unknown 6, pitch_amp]
-        linesBatch = [[grouped_sentences[i], '', '', 1, voiceline_files[i], '', '', 1] for i in range(len(grouped_sentences))]
-        
-        data = {
-            'pluginsContext': '{}',
-            'modelType': self.model_type,
-            'linesBatch': linesBatch,
-            'speaker_i': None,
-            'vocoder': [],
-            'outputJSON': None,
-            'useSR': None,
-            'useCleanup': None,
-        }
-        requests.post(self.synthesize_batch_url, json=data)
-
-    def check_if_xvasynth_is_running(self):
-        self.times_checked_xvasynth += 1
-
-        try:
-            if (self.times_checked_xvasynth > 10):
-                # break loop
-                logging.error('Could not connect to xVASynth multiple times. Ensure that xVASynth is running and restart Mantella.')
-                raise TTSServiceFailure()
-
-            # contact local xVASynth server; ~2 second timeout
-            logging.log(self.loglevel, f'Attempting to connect to xVASynth... ({self.times_checked_xvasynth})')
-            response = requests.get('http://127.0.0.1:8008/')
-            response.raise_for_status()  # If the response contains an HTTP error status code, raise an exception
-        except requests.exceptions.RequestException as err:
-            if ('Connection aborted' in err.__str__()):
-                # So it is alive
-                return
-
-            if (self.times_checked_xvasynth == 1):
-                logging.log(self.loglevel, 'Could not connect to xVASynth. Attempting to run headless server...')
-                self.run_xvasynth_server()
-
-            # do the web request again; LOOP!!!
-            return self.check_if_xvasynth_is_running()
-
-    def run_xvasynth_server(self):
-        try:
-            # start the process without waiting for a response
-            if (self.tts_print == 1):
-                # print subprocess output
-                Popen(f'{self.xvasynth_path}/resources/app/cpython_{self.process_device}/server.exe', cwd=self.xvasynth_path, stdout=None, stderr=None)
-            else:
-                # ignore output
-                Popen(f'{self.xvasynth_path}/resources/app/cpython_{self.process_device}/server.exe', cwd=self.xvasynth_path, stdout=DEVNULL, stderr=DEVNULL)
-        except:
-            logging.error(f'Could not run xVASynth. Ensure that the path "{self.xvasynth_path}" is correct.')
-            raise TTSServiceFailure()
- 
-    def _set_tts_settings_and_test_if_serv_running(self):
-        try:
-            # Sending a POST request to the API endpoint
-            logging.log(self.loglevel, f'Attempting to connect to xTTS...')
-            tts_data_dict = json.loads(self.xTTS_tts_data.replace('\n', ''))
-            response = requests.post(self.xtts_set_tts_settings, json=tts_data_dict)
-            response.raise_for_status() 
-        except requests.exceptions.RequestException as e:
-            # Log the error
-            logging.error(f'Could not reach the API at "{self.xtts_set_tts_settings}". Error: {e}')
-            # Wait for user input before exiting
-            logging.error(f'You should run xTTS api server before running Mantella.')
-            input('\nPress any key to stop Mantella...')
-            sys.exit(0)
-            
     @utils.time_it
     def change_voice(self, voice):
+        self._check_not_on_event_loop('change_voice')
+        self.voice_scheduler.record_load(voice, self._load_voice_model(voice))
+
+    def _load_voice_model(self, voice):
+        """Load `voice` and return how long it took. VoiceScheduler's loader, which records the load itself"""
+        with self.synthesis_lock:
+            seconds = self._change_voice(voice)
+        self._queue_stock_lines(voice)
+        return seconds
+
+    def _queue_stock_lines(self, voice):
+        self.stock_lines.queue(voice, lambda voice, voiceline: self.voiceline_cache.key(voice, voiceline, 0))
+
+    async def change_voice_async(self, voice):
+        """`change_voice` for the event loop"""
+        async with self._synthesis_lock_async():
+            await self._change_voice_async(voice)
+        self._queue_stock_lines(voice)
+
+    def _change_voice(self, voice):
+        """Load `voice` on the TTS server and return how long it took. Call with synthesis_lock held"""
         logging.log(self.loglevel, 'Loading voice model...')
-        if self.use_external_xtts == 1:
-            # Format the voice string to match the model naming convention
-            voice_path = f"{voice.lower().replace(' ', '')}"
-            model_voice = voice_path
-            # Check if the specified voice is available
-            if voice_path not in self.available_models and voice != self.last_voice:
-                logging.log(self.loglevel, f'Voice "{voice}" not in available models. Available models: {self.available_models}')
-                # Use the first available official model as a fallback
-                model_voice = self.get_first_available_official_model()
-                if model_voice is None:
-                    # Handle the case where no official model is available
-                    raise ValueError("No available voice model found.")
-                # Update the voice_path with the fallback model
-                model_voice = f"{model_voice.lower().replace(' ', '')}"
-
-            # Request to switch the voice model
-            requests.post(self.switch_model_url, json={"model_name": model_voice})
-            
-        else :
-            voice_path = f"{self.model_path}sk_{voice.lower().replace(' ', '')}"
-            if not os.path.exists(voice_path+'.json'):
-                logging.error(f"Voice model does not exist in location '{voice_path}'. Please ensure that the correct path has been set in config.ini (xvasynth_folder) and that the model has been downloaded from https://www.nexusmods.com/skyrimspecialedition/mods/44184?tab=files (Ctrl+F for 'sk_{voice.lower().replace(' ', '')}').")
-                raise VoiceModelNotFound()
-
-            with open(voice_path+'.json', 'r', encoding='utf-8') as f:
-                voice_model_json = json.load(f)
-
-            try:
-                base_speaker_emb = voice_model_json['games'][0]['base_speaker_emb']
-                base_speaker_emb = str(base_speaker_emb).replace('[','').replace(']','')
-            except:
-                base_speaker_emb = None
-
-            self.base_speaker_emb = base_speaker_emb
-            self.model_type = voice_model_json.get('modelType')
-        
-            model_change = {
-                'outputs': None,
-                'version': '3.0',
-                'model': voice_path, 
-                'modelType': self.model_type,
-                'base_lang': self.language, 
-                'pluginsContext': '{}',
-            }
-            requests.post(self.loadmodel_url, json=model_change)
-
+        start = time.perf_counter()
+        response = self.http.post_if_changed(*self.backend.voice_model_request(voice))
+        self._voice_model_loaded(voice, response)
         self.last_voice = voice
-
+        seconds = time.perf_counter() - start
+        self.stage_timings.record(voice, 'model_load', seconds)
         logging.log(self.loglevel, 'Voice model loaded.')
+        return seconds
 
-    def run_command(self, command):
-        startupinfo = STARTUPINFO()
-        startupinfo.dwFlags |= STARTF_USESHOWWINDOW
+    async def _change_voice_async(self, voice):
+        logging.log(self.loglevel, 'Loading voice model...')
+        start = time.perf_counter()
+        response = await self.async_http.post_if_changed(*self.backend.voice_model_request(voice))
+        self._voice_model_loaded(voice, response)
+        self.last_voice = voice
+        self.voice_scheduler.record_load(voice, time.perf_counter() - start)
+        self.stage_timings.record(voice, 'model_load', time.perf_counter() - start)
+        logging.log(self.loglevel, 'Voice model loaded.')
 
-        sp = Popen(command, startupinfo=startupinfo, stdout=PIPE, stderr=PIPE)
+    def _voice_model_loaded(self, voice, response):
+        """Let the backend know `voice` is loaded, unless the server refused it (`response` is None if it was loaded already)"""
+        if (response is None) or response.ok:
+            self.backend.voice_model_loaded(voice)
+
+    def is_voice_model_available(self, voice) -> bool:
+        """Whether `voice` can be spoken, so that a missing voice model can be reported before a conversation starts"""
+        return self.backend.is_voice_model_available(voice)
+
+    def stats(self) -> dict:
+        """Stage timings per voice model, voiceline cache use, voice model switches, LIP files and request counts and round trip times per TTS server endpoint"""
+        return {
+            'stages': self.stage_timings.summary(),
+            'voiceline_cache': self.voiceline_cache.stats(),
+            'voice_models': self.voice_scheduler.stats(),
+            'lip_sync': self.lip_sync.stats(),
+            'requests': self.http.stats(),
+            'async_requests': self.async_http.stats(),
+        }
 
-        stdout, stderr = sp.communicate()
-        stderr = stderr.decode("utf-8")
+    def log_stage_timings(self):
+        """Log which stages of making voicelines take the longest, per voice model"""
+        for line in self.stage_timings.format_summary():
+            logging.log(self.loglevel, f'TTS stage timings for {line}')
 
-    def log_subprocess_output(self, pipe):
-        for line in iter(pipe.readline, b''): # b'\n'-separated lines
-            logging.log(self.loglevel, '%r', line)
\ No newline at end of file
+    async def close_async(self):
+        """Close the asyncio session's connections before the event loop they belong to finishes"""
+        await self.async_http.close()
@@ -0,0 +1,51 @@
+import json
+
+
+def parse_form_id(form_id: str) -> int | None:
+    """Parse a hex form ID ('00013AD3', '13AD3', '0x13AD3') to an integer, so that leading zeros don't matter"""
+    try:
+        return int(str(form_id).strip(), 16)
+    except ValueError:
+        return None
+
+
+class VoiceModelTable:
+    """Voice models for generic NPCs (those not in skyrim_characters.csv), loaded from data/generic_npc_voices.json
+
+    voice_models_by_form_id: the form ID of an in-game voice type -> the voice model to use for it
+    voice_models_by_race: sex -> race (eg 'NordRace') -> the voice model to use when the voice type is unknown
+    default_voice_models: sex -> the voice model to use when the race is unknown too
+    """
+    def __init__(self, voice_models_by_form_id: dict[str, str], voice_models_by_race: dict[str, dict[str, str]], default_voice_models: dict[str, str]) -> None:
+        self.__voice_models_by_form_id: dict[int, str] = {}
+        for form_id, voice_model in voice_models_by_form_id.items():
+            parsed_form_id = parse_form_id(form_id)
+            if parsed_form_id is None:
+                raise ValueError(f"Invalid form ID '{form_id}' for voice model '{voice_model}'")
+            if parsed_form_id in self.__voice_models_by_form_id:
+                raise ValueError(f"Form ID '{form_id}' is listed more than once")
+            self.__voice_models_by_form_id[parsed_form_id] = voice_model
+
+        self.__voice_models_by_race: dict[tuple[bool, str], str] = {}
+        for sex, voice_models in voice_models_by_race.items():
+            for race, voice_model in voice_models.items():
+                self.__voice_models_by_race[(sex == 'Female', race.lower())] = voice_model
+        self.__default_voice_models: dict[bool, str] = {sex == 'Female': voice_model for sex, voice_model in default_voice_models.items()}
+
+    @classmethod
+    def load(cls, file_name: str = 'data/generic_npc_voices.json') -> 'VoiceModelTable':
+        with open(file_name, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['voice_models_by_form_id'], data['voice_models_by_race'], data['default_voice_models'])
+
+    def get_voice_model_by_form_id(self, form_id: str) -> str | None:
+        parsed_form_id = parse_form_id(form_id)
+        if parsed_form_id is None:
+            return None
+        return self.__voice_models_by_form_id.get(parsed_form_id)
+
+    def get_voice_model_by_race(self, race: str, is_female: bool) -> str:
+        voice_model = self.__voice_models_by_race.get((is_female, race.lower()))
+        if voice_model is None:
+            return self.__default_voice_models[is_female]
+        return voice_model